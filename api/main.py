@@ -1,9 +1,31 @@
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from api.routes import financials_route
 from api.routes import advanced_analytics
 from api.routes import dashboard_support
+from api.routes import admin_route
+from api.repository import get_repository
+
+
+# If BANKING_API_WATCH_SECONDS is set every worker checks with that interval
+# if the pipeline published another version and reloads it in the background
+
+WATCH_ENV = "BANKING_API_WATCH_SECONDS"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+
+    interval = os.environ.get(WATCH_ENV)
+
+    if interval:
+        get_repository().watch(float(interval))
+
+    yield
 
 
 app = FastAPI(
@@ -15,6 +37,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 
@@ -36,23 +59,66 @@ def health():
     return {
         "status": "healthy",
         "message": "Banking Health API - OK",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "dataset_version": get_repository().version
     }
 
 app.include_router(financials_route.router)
 app.include_router(advanced_analytics.router)
 app.include_router(dashboard_support.router)
+app.include_router(admin_route.router)
 
 if __name__ == "__main__":
+    import argparse
+
     import uvicorn
-    
+
+    from api.shared_dataset import SHARED_DATASET_ENV
+
+    parser = argparse.ArgumentParser(description="Levanta la API")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Procesos que atienden la API, con más de uno comparten el "
+             "dataset publicado con mmap"
+    )
+    parser.add_argument(
+        "--watch", type=float, default=None, metavar="SEGUNDOS",
+        help="Recargar el dataset cuando el pipeline publique otra versión, "
+             "revisando cada tantos segundos"
+    )
+    args = parser.parse_args()
+
+    # The workers read it from the environment
+    if args.watch:
+        os.environ[WATCH_ENV] = str(args.watch)
+
     print("Inciando API")
     print("Documentación: http://localhost:8000/docs")
-    
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+
+    if args.workers > 1:
+
+        # This process already loaded the data, it publishes it and the
+        # workers only open it
+        directory = get_repository().publish()
+
+        if directory is not None:
+            os.environ[SHARED_DATASET_ENV] = directory
+            print(f"Dataset compartido: {directory}")
+
+        uvicorn.run(
+            "api.main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=args.workers,
+            log_level="info"
+        )
+
+    else:
+
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
@@ -0,0 +1,459 @@
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from scripts.visualizations.components.data_handler import DataHandler, make_read_only
+from scripts.visualizations.components.advanced_metrics import AdvancedMetrics
+from scripts.visualizations.components.indicator_database import IndicatorDatabase
+from scripts.visualizations.components.indicator_matrix import IndicatorMatrix, pivot_indicators
+from scripts.visualizations.data_loader import VisualizationDataLoader
+
+from api.shared_dataset import SHARED_DATASET_ENV, SharedDataset
+
+
+# Everything the endpoints read of one version of the dataset: the data, the
+# enriched data of the advanced analytics and its pivot, the handler with the
+# views and indexes of the categories and the indexed database. It's built
+# complete before anyone sees it and it's never changed after, a new version
+# is a new snapshot
+
+class DatasetSnapshot:
+
+    def __init__(self, dataset_name: str, loader: VisualizationDataLoader):
+
+        self.dataset_name = dataset_name
+        self.loader = loader
+
+        self.handler = DataHandler(loader)
+        self.database = None
+        self.version = 0
+
+        # What the snapshot was built from (version, path and modification
+        # time of the data), to know if the pipeline published another one
+        self.source = None
+
+        self._data = None
+        self._enriched = None
+        self._pivot_enriched = None
+
+    # The version first, if the pipeline publishes while we read the data we
+    # say the older version and the next reload catches up
+
+    @staticmethod
+    def get_source(dataset_name: str, loader: VisualizationDataLoader) -> Tuple:
+
+        version = loader.get_version(dataset_name).get("version", 0)
+
+        try:
+            path = loader.load(dataset_name)
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            path, modified = None, None
+
+        return version, path, modified
+
+    @classmethod
+    def load(cls, dataset_name: str, loader: VisualizationDataLoader) -> "DatasetSnapshot":
+
+        # While we read the files the pipeline can't publish another version,
+        # all of them (and the version) are of the same publication
+        with loader.read_lock(dataset_name):
+            return cls._load(dataset_name, loader)
+
+    @classmethod
+    def _load(cls, dataset_name: str, loader: VisualizationDataLoader) -> "DatasetSnapshot":
+
+        snapshot = cls(dataset_name, loader)
+        snapshot.source = cls.get_source(dataset_name, loader)
+        snapshot.version = snapshot.source[0]
+
+        data = snapshot.handler.load_data(dataset_name)
+        snapshot._data = make_read_only(data)
+
+        # The enriched data, the matrix bank x indicator of the pipeline is
+        # opened with mmap so the base data is not pivoted
+        if snapshot._data is not None:
+
+            # The columns of the pivots are the IDs with the labels of the
+            # registry, so the indicators with the same name stay apart
+            registry = snapshot.handler.registry
+
+            matrix = IndicatorMatrix.load(
+                loader.get_matrix_paths(dataset_name), registry
+            )
+            enriched = AdvancedMetrics.calculate_derived_indicators(
+                snapshot._data,
+                pivot_df=matrix if matrix is not None
+                else pivot_indicators(snapshot._data, registry)
+            )
+            enriched = AdvancedMetrics.calculate_composite_indices(
+                enriched, pivot_df=pivot_indicators(enriched, registry)
+            )
+
+            snapshot._enriched = make_read_only(enriched)
+            snapshot._pivot_enriched = make_read_only(
+                pivot_indicators(enriched, registry)
+            )
+
+        snapshot._prepare_handler()
+
+        return snapshot
+
+    # Open the frames that another process published (see SharedDataset),
+    # the enriched data comes with them so it's not calculated
+
+    @classmethod
+    def attach(cls, dataset_name: str, loader: VisualizationDataLoader,
+               directory: str) -> Optional["DatasetSnapshot"]:
+
+        if not SharedDataset.is_supported():
+            return None
+
+        shared = SharedDataset(directory)
+
+        try:
+            manifest = shared.read_manifest()
+
+            if manifest.get("dataset_name") != dataset_name:
+                return None
+
+            frames = shared.attach()
+
+        except (OSError, ValueError) as e:
+            print(f"❌ No se pudo abrir el dataset compartido {directory}: {e}")
+            return None
+
+        snapshot = cls(dataset_name, loader)
+        snapshot.version = manifest.get("version", 0)
+        snapshot.source = tuple(manifest.get("source") or ()) or None
+
+        snapshot._data = frames.get("data")
+        snapshot._enriched = frames.get("enriched")
+        snapshot._pivot_enriched = frames.get("pivot_enriched")
+
+        with loader.read_lock(dataset_name):
+            snapshot.handler.load_references(dataset_name)
+            snapshot._prepare_handler()
+
+        return snapshot
+
+    def _prepare_handler(self):
+
+        # The handler filters its own dataframe, it must be the shared one,
+        # and its views of the categories are built now and not in the
+        # first request
+        if self._data is not None:
+            self.handler.dataframe = self._data
+            self.handler.precompute_category_views()
+
+        # Indexed database of the pipeline for the banks and rankings. Its
+        # connection is opened now and kept, so it reads the database that was
+        # published with the data of the snapshot even if the pipeline
+        # publishes another one. It's closed when the snapshot is freed
+        try:
+            self.database = IndicatorDatabase(
+                self.loader.get_database_path(self.dataset_name)
+            )
+        except Exception as e:
+            print(f"❌ Error abriendo la base de datos: {e}")
+            self.database = None
+
+    # Publish the frames for the workers, returns the directory to put in
+    # SHARED_DATASET_ENV
+
+    def publish(self, directory: Optional[str] = None) -> Optional[str]:
+
+        if not SharedDataset.is_supported() or self._data is None:
+            return None
+
+        directory = directory or self.shared_directory()
+
+        return SharedDataset(directory).publish(
+            {
+                "data": self._data,
+                "enriched": self._enriched,
+                "pivot_enriched": self._pivot_enriched
+            },
+            {
+                "dataset_name": self.dataset_name,
+                "version": self.version,
+                "source": list(self.source) if self.source else None
+            }
+        )
+
+    def shared_directory(self) -> Optional[str]:
+
+        return shared_directory(self.dataset_name, self.source)
+
+    @staticmethod
+    def _view(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+
+        # A shallow copy shares the read only arrays, if a router replaces
+        # a whole column it only changes its own view
+        return df.copy(deep=False) if df is not None else None
+
+    @property
+    def data(self) -> Optional[pd.DataFrame]:
+
+        return self._view(self._data)
+
+    @property
+    def enriched(self) -> Optional[pd.DataFrame]:
+
+        return self._view(self._enriched)
+
+    @property
+    def pivot_enriched(self) -> Optional[pd.DataFrame]:
+
+        return self._view(self._pivot_enriched)
+
+
+def shared_directory(dataset_name: str, source: Optional[Tuple]) -> Optional[str]:
+
+    if not source or source[2] is None:
+        return None
+
+    return SharedDataset.default_directory(dataset_name, source[0], source[2])
+
+
+# One repository of the dataset for the whole process. Every router used to
+# create its own loader and DataHandler and read Final Dataframe at import,
+# so the api parsed it three times and kept three copies. Now they all ask
+# this one for the current snapshot at the start of every request and use
+# only that one until they answer.
+#
+# A reload builds the new snapshot in another thread while the requests keep
+# using the old one, and then replaces the reference (read, copy, update).
+# The requests that already had the old snapshot finish with it, and it's
+# freed when the last one ends
+
+class DatasetRepository:
+
+    def __init__(self, dataset_name="Final Dataframe",
+                 loader: Optional[VisualizationDataLoader] = None):
+
+        self.dataset_name = dataset_name
+        self.loader = loader or VisualizationDataLoader()
+
+        self._lock = threading.Lock()
+        self._snapshot: Optional[DatasetSnapshot] = None
+
+        self._reload_thread: Optional[threading.Thread] = None
+        self._watch_thread: Optional[threading.Thread] = None
+
+        self.last_reload: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # The endpoints run in a pool of threads, the lock makes sure only the
+    # first one loads and the others wait for it
+
+    def snapshot(self) -> DatasetSnapshot:
+
+        snapshot = self._snapshot
+
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+
+            if self._snapshot is None:
+                self._snapshot = self._build(
+                    os.environ.get(SHARED_DATASET_ENV)
+                )
+                self.last_reload = time.time()
+
+        return self._snapshot
+
+    def load(self) -> "DatasetRepository":
+
+        self.snapshot()
+
+        return self
+
+    # A worker of a server with several of them opens the dataset that was
+    # published, if it's not there it loads the data like a single worker.
+    # In a reload of a worker the first one that builds the new version
+    # publishes it and the others open it
+
+    def _build(self, directory: Optional[str] = None) -> DatasetSnapshot:
+
+        shared = os.environ.get(SHARED_DATASET_ENV)
+
+        if directory and os.path.exists(directory):
+
+            snapshot = DatasetSnapshot.attach(
+                self.dataset_name, self.loader, directory
+            )
+
+            if snapshot is not None:
+                return snapshot
+
+        snapshot = DatasetSnapshot.load(self.dataset_name, self.loader)
+
+        if shared:
+
+            published = snapshot.publish()
+
+            if published is not None:
+                attached = DatasetSnapshot.attach(
+                    self.dataset_name, self.loader, published
+                )
+                snapshot = attached or snapshot
+
+        return snapshot
+
+    # The version that the pipeline published is not the one of the snapshot
+
+    def has_changed(self) -> bool:
+
+        current = self._snapshot
+
+        if current is None:
+            return True
+
+        source = DatasetSnapshot.get_source(self.dataset_name, self.loader)
+
+        # A snapshot without source only knows its version
+        if current.source is None:
+            return source[0] != current.version
+
+        return source != current.source
+
+    # Build the new snapshot and replace the current one. If it fails the
+    # current one stays and the error is saved for /admin/reload
+
+    def reload(self) -> bool:
+
+        try:
+            source = DatasetSnapshot.get_source(self.dataset_name, self.loader)
+
+            directory = None
+            if os.environ.get(SHARED_DATASET_ENV):
+                directory = shared_directory(self.dataset_name, source)
+
+            snapshot = self._build(directory)
+
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ Error recargando el dataset: {e}")
+            return False
+
+        if snapshot._data is None:
+            self.last_error = "No se pudieron cargar los datos"
+            print(f"❌ Error recargando el dataset: {self.last_error}")
+            return False
+
+        with self._lock:
+            self._snapshot = snapshot
+
+        self.last_reload = time.time()
+        self.last_error = None
+
+        print(f"✅ Dataset recargado, versión {snapshot.version}")
+
+        return True
+
+    # The reload in a thread, only one at a time. Returns False if there's
+    # one running already
+
+    def reload_in_background(self) -> bool:
+
+        with self._lock:
+
+            if self.is_reloading():
+                return False
+
+            self._reload_thread = threading.Thread(
+                target=self.reload, name="dataset-reload", daemon=True
+            )
+            self._reload_thread.start()
+
+        return True
+
+    def is_reloading(self) -> bool:
+
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def wait_for_reload(self, timeout: Optional[float] = None):
+
+        thread = self._reload_thread
+
+        if thread is not None:
+            thread.join(timeout)
+
+    # Check every interval seconds if the pipeline published another version
+    # and reload it. With several workers every one has its own watch, the
+    # admin endpoint only reaches the worker that answers it
+
+    def watch(self, interval: float = 30) -> bool:
+
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return False
+
+        def run():
+
+            while True:
+
+                time.sleep(interval)
+
+                try:
+                    if self.has_changed() and not self.is_reloading():
+                        print("Cambio detectado en el dataset")
+                        self.reload()
+
+                except Exception as e:
+                    print(f"❌ Error revisando el dataset: {e}")
+
+        self._watch_thread = threading.Thread(
+            target=run, name="dataset-watch", daemon=True
+        )
+        self._watch_thread.start()
+
+        return True
+
+    # The attributes of the current snapshot, for who only needs one of them
+
+    @property
+    def version(self) -> int:
+
+        return self.snapshot().version
+
+    @property
+    def handler(self) -> DataHandler:
+
+        return self.snapshot().handler
+
+    @property
+    def database(self) -> Optional[IndicatorDatabase]:
+
+        return self.snapshot().database
+
+    @property
+    def data(self) -> Optional[pd.DataFrame]:
+
+        return self.snapshot().data
+
+    @property
+    def enriched(self) -> Optional[pd.DataFrame]:
+
+        return self.snapshot().enriched
+
+    @property
+    def pivot_enriched(self) -> Optional[pd.DataFrame]:
+
+        return self.snapshot().pivot_enriched
+
+    def publish(self, directory: Optional[str] = None) -> Optional[str]:
+
+        return self.snapshot().publish(directory)
+
+
+_repository = DatasetRepository()
+
+
+def get_repository() -> DatasetRepository:
+
+    return _repository.load()
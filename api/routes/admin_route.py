@@ -0,0 +1,82 @@
+import datetime
+import os
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from ..schemas import ReloadStatusResponse
+from ..repository import get_repository
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    responses={403: {"description": "Forbidden"}}
+)
+
+# The reload of the dataset without restarting the api. The endpoints ask
+# for the token of the variable BANKING_API_ADMIN_TOKEN in the header
+# X-Admin-Token, without the variable they are closed. With several workers the request only reloads the worker
+# that answers it, for all of them use the watch (BANKING_API_WATCH_SECONDS)
+
+ADMIN_TOKEN_ENV = "BANKING_API_ADMIN_TOKEN"
+
+repository = get_repository()
+
+
+def check_token(token: Optional[str]):
+
+    expected = os.environ.get(ADMIN_TOKEN_ENV)
+
+    if not expected:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Las rutas de administración necesitan {ADMIN_TOKEN_ENV}"
+        )
+
+    if not secrets.compare_digest(token or "", expected):
+        raise HTTPException(
+            status_code=403,
+            detail="Token de administración inválido"
+        )
+
+
+def reload_status():
+
+    last_reload = repository.last_reload
+
+    return {
+        "dataset_version": repository.version,
+        "reloading": repository.is_reloading(),
+        "last_reload": datetime.datetime.fromtimestamp(
+            last_reload
+        ).isoformat() if last_reload else None,
+        "last_error": repository.last_error
+    }
+
+
+@router.post("/reload", response_model=ReloadStatusResponse)
+def reload_dataset(
+    wait: bool = Query(False, description="Esperar a que termine la recarga"),
+    x_admin_token: Optional[str] = Header(None)
+):
+
+    check_token(x_admin_token)
+
+    # The new version is built in another thread while the requests keep
+    # answering with the current one
+    started = repository.reload_in_background()
+
+    if wait:
+        repository.wait_for_reload()
+
+    return {"started": started, **reload_status()}
+
+
+@router.get("/reload", response_model=ReloadStatusResponse)
+def get_reload_status(x_admin_token: Optional[str] = Header(None)):
+
+    check_token(x_admin_token)
+
+    return reload_status()
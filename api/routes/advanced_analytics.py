@@ -16,10 +16,10 @@ from api.schemas import (
     SystemStatisticsResponse
 )
 
-from scripts.visualizations.components.data_handler import DataHandler
+from api.repository import get_repository
+
 from scripts.visualizations.components.advanced_metrics import AdvancedMetrics
 from scripts.visualizations.components.analysis_engine import TrendAnalysis
-from scripts.visualizations.data_loader import VisualizationDataLoader
 
 router = APIRouter(
     prefix="/advanced",
@@ -28,17 +28,17 @@ router = APIRouter(
 )
 
 print("🔄 Inicializando componentes avanzados...")
-loader = VisualizationDataLoader()
-dh = DataHandler(loader)
-df_original = dh.load_data("Final Dataframe")
-
-# Enriquecer datos con métricas avanzadas
-if df_original is not None:
-    df_enriched = AdvancedMetrics.calculate_derived_indicators(df_original)
-    df_enriched = AdvancedMetrics.calculate_composite_indices(df_enriched)
-    print(f"✅ Datos enriquecidos: {len(df_enriched)} registros")
+
+# Los datos vienen del repositorio compartido por todos los routers. Los
+# datos enriquecidos y su tabla pivote se calculan una sola vez por versión
+# del dataset (con la matriz banco x indicador del pipeline abierta con mmap)
+# y cada petición toma la versión actual al empezar, así una recarga no le
+# cambia los datos a la mitad
+repository = get_repository()
+
+if repository.enriched is not None:
+    print(f"✅ Datos enriquecidos: {len(repository.enriched)} registros")
 else:
-    df_enriched = None
     print("❌ Error: No se pudieron cargar los datos")
 
 
@@ -58,11 +58,15 @@ def get_system_alerts(
     - Solvencia (Patrimonio/Activos < 9%)
     - Eficiencia (Gastos/Ingresos > 70%)
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
     # Generar alertas
-    alerts = TrendAnalysis.generate_alerts(df_enriched)
+    alerts = TrendAnalysis.generate_alerts(df_enriched, pivot_df=pivot_enriched)
     
     # Filtrar por severidad si se especifica
     if severity:
@@ -106,11 +110,15 @@ def get_market_concentration(
     - 1500-2500: Moderadamente Concentrado
     - > 2500: Altamente Concentrado
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
     # Calcular concentración
-    concentration_data = TrendAnalysis.calculate_concentration_risk(df_enriched)
+    concentration_data = TrendAnalysis.calculate_concentration_risk(df_enriched, pivot_df=pivot_enriched)
     
     if not concentration_data or metric not in concentration_data:
         raise HTTPException(
@@ -149,6 +157,9 @@ def get_peer_groups(
     - Bancos Medianos-Pequeños (50-75%)
     - Bancos Pequeños (Bottom 25%)
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -181,10 +192,14 @@ def get_correlations():
     - Morosidad
     - Liquidez
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
-    correlation_matrix = TrendAnalysis.correlation_analysis(df_enriched)
+    correlation_matrix = TrendAnalysis.correlation_analysis(df_enriched, pivot_df=pivot_enriched)
     
     if correlation_matrix.empty:
         raise HTTPException(
@@ -231,6 +246,10 @@ def get_benchmark_analysis(
     - top_quartile: Top 25%
     - median: Mediana del sistema
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -245,7 +264,7 @@ def get_benchmark_analysis(
         )
     
     # Calcular benchmarks
-    benchmark_results = TrendAnalysis.benchmark_analysis(df_enriched, benchmark_type)
+    benchmark_results = TrendAnalysis.benchmark_analysis(df_enriched, benchmark_type, pivot_df=pivot_enriched)
     
     # Filtrar solo indicadores relevantes del banco
     bank_benchmarks = {}
@@ -287,6 +306,9 @@ def get_derived_indicators(
     - Índice de Rentabilidad Ajustada
     - Índice Global de Desempeño
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -343,10 +365,14 @@ def get_system_statistics():
     - Percentiles 25 y 75
     - Total de bancos con datos
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
-    system_stats = AdvancedMetrics.get_system_statistics(df_enriched)
+    system_stats = AdvancedMetrics.get_system_statistics(df_enriched, pivot_df=pivot_enriched)
     
     if not system_stats:
         raise HTTPException(
@@ -380,10 +406,14 @@ def get_market_share(
     - CARTERA DE CRÉDITOS
     - TOTAL PATRIMONIO
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
-    market_participation = AdvancedMetrics.calculate_market_participation(df_enriched)
+    market_participation = AdvancedMetrics.calculate_market_participation(df_enriched, pivot_df=pivot_enriched)
     
     if metric not in market_participation:
         available_metrics = list(market_participation.keys())
@@ -419,6 +449,10 @@ def detect_outliers(
     - iqr: Rango Intercuartílico (Q3 - Q1)
     - zscore: Desviación estándar (|z| > 2)
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -428,7 +462,7 @@ def detect_outliers(
             detail="Método debe ser 'iqr' o 'zscore'"
         )
     
-    outliers = AdvancedMetrics.detect_outliers(df_enriched, method)
+    outliers = AdvancedMetrics.detect_outliers(df_enriched, method, pivot_df=pivot_enriched)
     
     if not outliers:
         return {
@@ -470,6 +504,10 @@ def get_system_overview():
     - Alertas activas
     - Top performers
     """
+    snapshot = repository.snapshot()
+    df_enriched = snapshot.enriched
+    pivot_enriched = snapshot.pivot_enriched
+
     if df_enriched is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -487,11 +525,11 @@ def get_system_overview():
     roe_promedio = float(roe_data['valor_indicador'].mean()) if not roe_data.empty else 0
     
     # Concentración
-    concentration_data = TrendAnalysis.calculate_concentration_risk(df_enriched)
+    concentration_data = TrendAnalysis.calculate_concentration_risk(df_enriched, pivot_df=pivot_enriched)
     hhi = concentration_data.get('TOTAL ACTIVO', {}).get('HHI', 0) if concentration_data else 0#type:ignore
     
     # Alertas
-    alerts = TrendAnalysis.generate_alerts(df_enriched)
+    alerts = TrendAnalysis.generate_alerts(df_enriched, pivot_df=pivot_enriched)
     critical_alerts = len([a for a in alerts if "CRÍTICA" in a.get('severidad', '')])
     
     # Top performers
@@ -9,30 +9,34 @@ root_dir = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(root_dir))
 
 try:
-    from scripts.visualizations.components.data_handler import DataHandler
+    from api.repository import get_repository
     from scripts.visualizations.components.metrics_calculator import MetricsCalculator
     from scripts.visualizations.components.indicator_config import IndicatorConfig
-    from scripts.visualizations.data_loader import VisualizationDataLoader
+    from scripts.visualizations.components.indicator_registry import AmbiguousIndicatorError
 except ImportError as e:
     print(f"Error importing components: {e}")
 
 router = APIRouter(prefix="/api", tags=["Dashboard Support"])
 
-# Inicializar componentes
+# Inicializar componentes, los datos y la base de datos indexada del
+# pipeline (para pedir el top de un indicador sin filtrar todo el dataframe)
+# vienen de la versión actual del repositorio compartido por todos los
+# routers, que cada petición toma al empezar
 try:
-    loader = VisualizationDataLoader()
-    dh = DataHandler(loader)
+    repository = get_repository()
+    loader = repository.loader
     calc = MetricsCalculator()
-    df_original = dh.load_data("Final Dataframe")
     print("✅ Datos cargados exitosamente para dashboard")
 except Exception as e:
     print(f"❌ Error cargando datos: {e}")
-    dh = None
-    df_original = None
+    repository = None
 
 @router.get("/banks/list")
 def get_banks_list():
     """Obtener lista simple de bancos"""
+    snapshot = repository.snapshot() if repository is not None else None
+    df_original = snapshot.data if snapshot is not None else None
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -76,6 +80,9 @@ def get_indicators_by_category(categoria: str):
 @router.get("/banks/{bank_name}/financials")
 def get_bank_financials(bank_name: str, categoria: str = Query("Balance")):
     """Obtener datos financieros de un banco específico"""
+    snapshot = repository.snapshot() if repository is not None else None
+    df_original = snapshot.data if snapshot is not None else None
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -128,20 +135,84 @@ def get_bank_financials(bank_name: str, categoria: str = Query("Balance")):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @router.get("/rankings/{indicator}")
-def get_ranking(indicator: str, categoria: str = Query("Balance"), limit: Optional[int] = None):
+def get_ranking(
+    indicator: str,
+    categoria: str = Query("Balance"),
+    limit: int = Query(10, ge=1, description="Cantidad de bancos del ranking"),
+    sheet: Optional[str] = Query(None, description="Hoja del indicador si el nombre se repite (ej: BALANCE)"),
+    code: Optional[str] = Query(None, description="Código del indicador si el nombre se repite")
+):
     """Obtener ranking de bancos por indicador"""
+    snapshot = repository.snapshot() if repository is not None else None
+    df_original = snapshot.data if snapshot is not None else None
+    database = snapshot.database if snapshot is not None else None
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
-    
+
+    # Solo se rankean los indicadores de la categoría, la categoría también
+    # dice si los valores van en porcentaje
+    indicator_names = IndicatorConfig.get_indicator_names_by_category(categoria)
+
+    if not indicator_names:
+        raise HTTPException(status_code=400, detail="Categoría inválida")
+
+    if database is not None and database.is_available():
+
+        # El ranking es de un solo ID, un nombre que tienen varios
+        # indicadores necesita la hoja o el código
+        try:
+            indicator_key = snapshot.handler.resolve_indicator(
+                indicator, sheet, code
+            )
+        except AmbiguousIndicatorError as e:
+            raise HTTPException(
+                status_code=400, detail={"error": str(e), "choices": e.choices}
+            )
+
+        if indicator_key is None:
+            raise HTTPException(status_code=404, detail=f"Indicador '{indicator}' no encontrado")
+
+        if indicator_key not in snapshot.handler.get_indicator_keys(indicator_names):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Indicador '{indicator}' no pertenece a la categoría '{categoria}'"
+            )
+
+        # Solo se leen las primeras limit filas del índice del indicador.
+        # Los porcentajes van por 100 como en el resto de la api
+        sorted_data = database.get_ranking(
+            indicator_key, limit=limit,
+            scale=100 if IndicatorConfig.is_category_percentage(categoria) else 1
+        )
+
+        if sorted_data.empty:
+            raise HTTPException(status_code=404, detail=f"Indicador '{indicator}' no encontrado")
+
+        data = [
+            {
+                "banks": row["banks"],
+                "valor_indicador": float(row["valor_indicador"]),
+                "ranking": position
+            }
+            for position, row in sorted_data.iterrows()
+        ]
+
+        return {
+            "data": data,
+            "indicator": indicator,
+            "total_banks": database.count_banks(indicator_key)
+        }
+
     try:
         latest_date = df_original['date'].max()
         latest_data = df_original[df_original['date'] == latest_date]
         
-        if indicator not in latest_data.columns:
+        if indicator not in latest_data.columns or indicator not in indicator_names:
             raise HTTPException(status_code=404, detail=f"Indicador '{indicator}' no encontrado")
         
         # Ordenar por indicador
-        sorted_data = latest_data.nlargest(limit or 10, indicator)
+        sorted_data = latest_data.nlargest(limit, indicator)
         
         data = []
         for i, (_, row) in enumerate(sorted_data.iterrows()):
@@ -163,6 +234,9 @@ def get_ranking(indicator: str, categoria: str = Query("Balance"), limit: Option
 @router.get("/comparative/table")
 def get_comparative_table(categoria: str = Query("Balance")):
     """Obtener tabla comparativa"""
+    snapshot = repository.snapshot() if repository is not None else None
+    df_original = snapshot.data if snapshot is not None else None
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -192,6 +266,9 @@ def get_comparative_table(categoria: str = Query("Balance")):
 @router.get("/comparative/statistics")
 def get_comparative_statistics(categoria: str = Query("Balance")):
     """Obtener estadísticas comparativas"""
+    snapshot = repository.snapshot() if repository is not None else None
+    df_original = snapshot.data if snapshot is not None else None
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -247,3 +324,53 @@ def get_comparative_statistics(categoria: str = Query("Balance")):
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.get("/changes")
+def get_changes(
+    since_version: int = Query(0, ge=0, description="Última versión que ya tiene el cliente"),
+    include_rows: bool = Query(False, description="Incluir las filas que cambiaron"),
+    limit: int = Query(10, ge=1, le=100, description="Máximo de versiones por respuesta")
+):
+    """Qué cambió en los datos publicados desde una versión"""
+    current = loader.get_version("Final Dataframe")
+    current_version = current.get("version", 0)
+
+    # Solo se leen los deltas de esta página, las siguientes se piden con
+    # since_version=next_since_version
+    deltas = loader.load_deltas("Final Dataframe", since_version, limit)
+
+    expected = list(range(since_version + 1, current_version + 1))[:limit]
+    next_since_version = max([since_version, *expected[-1:], *list(deltas)[-1:]])
+
+    # Si falta el delta de alguna versión el cliente tiene que recargar todo
+    complete = list(deltas) == expected
+
+    changes = []
+
+    for version, delta in deltas.items():
+
+        counts = delta["Cambio"].value_counts()
+
+        change = {
+            "version": version,
+            "agregado": int(counts.get("agregado", 0)),
+            "eliminado": int(counts.get("eliminado", 0)),
+            "modificado": int(counts.get("modificado", 0)),
+            "banks": sorted(delta["Banks"].astype(str).unique().tolist())
+        }
+
+        if include_rows:
+            change["rows"] = delta.astype(object).where(delta.notna(), None).to_dict("records")
+
+        changes.append(change)
+
+    return {
+        "dataset_version": current_version,
+        "published_at": current.get("published_at"),
+        "since_version": since_version,
+        "complete": complete,
+        "has_more": next_since_version < current_version,
+        "next_since_version": next_since_version,
+        "changes": changes
+    }
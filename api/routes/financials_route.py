@@ -1,18 +1,23 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional
 
+import pandas as pd
+
 from ..schemas import (
     BankFinancialsResponse,
     RankingResponse,
     BanksListResponse,
     IndicatorsListResponse,
+    IndicatorRegistryResponse,
+    SegmentTotalsResponse,
     ComparativeResponse,
 )
 
-from scripts.visualizations.components.data_handler import DataHandler
+from ..repository import get_repository
+
 from scripts.visualizations.components.metrics_calculator import MetricsCalculator
 from scripts.visualizations.components.indicator_config import IndicatorConfig
-from scripts.visualizations.data_loader import VisualizationDataLoader
+from scripts.visualizations.components.indicator_registry import AmbiguousIndicatorError
 
 
 # Create the router
@@ -23,11 +28,17 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
-loader = VisualizationDataLoader()
-dh = DataHandler(loader)
-calc = MetricsCalculator()
+# The data, the handler and the indexed database come from the snapshot of
+# the repository that all the routers share, every request takes the current
+# one at the start so a reload doesn't change the data in the middle of it.
+# The data of a bank and the rankings come from the index of the view of the
+# category, that is built with the snapshot. The database only answers when
+# the snapshot has no data
 
-df_original = dh.load_data("Final Dataframe")
+repository = get_repository()
+
+loader = repository.loader
+calc = MetricsCalculator()
 
 
 @router.get("/bank", response_model=BankFinancialsResponse)
@@ -36,6 +47,10 @@ def get_bank_financials(
     category: str = Query("Balance", description="Balance, Rendimiento o Estructura")
 ):
 
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+    database = snapshot.database
+
     if category not in ["Balance", "Rendimiento", "Estructura"]:
         raise HTTPException(
             status_code=400, 
@@ -46,23 +61,36 @@ def get_bank_financials(
     indicator_names = IndicatorConfig.get_indicator_names_by_category(category)
     is_percentage = IndicatorConfig.is_category_percentage(category)
     unit = IndicatorConfig.get_category_unit(category)
-    
-    df_filtrado = dh.filter_by_category(indicator_names, is_percentage)
-    
-    if df_filtrado.empty:
-        raise HTTPException(
-            status_code=404, 
-            detail=f"No hay datos para la categoría {category}"
+
+    index = dh.get_category_index(indicator_names, is_percentage)
+
+    if index is not None:
+
+        if index.frame.empty:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No hay datos para la categoría {category}"
+            )
+
+        bank_data = index.get_bank_data(name, sort_by_value=True)
+        available_banks = index.get_banks()
+
+    elif database is not None and database.is_available():
+
+        bank_data = database.get_bank_data(
+            name, dh.get_indicator_keys(indicator_names),
+            scale=100 if is_percentage else 1
         )
-    
-    bank_data = dh.get_bank_data(df_filtrado, name, sort_by_value=True)
-    
+        available_banks = []
+
+    else:
+        raise HTTPException(status_code=503, detail="Datos no disponibles")
+
     if bank_data.empty:
 
-        available_banks = dh.get_unique_values(df_filtrado, "banks")
         raise HTTPException(
             status_code=404,
-            detail=f"Banco '{name}' no encontrado. Bancos disponibles: {', '.join(available_banks[:5])}"
+            detail=f"Banco '{name}' no encontrado. Bancos disponibles: {', '.join(sorted(available_banks)[:5])}"
         )
     
     stats = calc.get_sumary_stats(bank_data)
@@ -82,12 +110,16 @@ def get_bank_financials(
 def get_ranking(
     kpi: str = Query(..., description="Indicador para el ranking (ej: TOTAL ACTIVO)"),
     category: str = Query("Balance", description="Balance, Rendimiento o Estructura"),
-    ascending: bool = Query(False, description="Orden ascendente (menor a mayor)")
+    ascending: bool = Query(False, description="Orden ascendente (menor a mayor)"),
+    top: Optional[int] = Query(None, ge=1, description="Solo los primeros N bancos"),
+    sheet: Optional[str] = Query(None, description="Hoja del indicador si el nombre se repite (ej: BALANCE)"),
+    code: Optional[str] = Query(None, description="Código del indicador si el nombre se repite")
 ):
 
-    if df_original is None:
-        raise HTTPException(status_code=503, detail="Datos no disponibles")
-    
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+    database = snapshot.database
+
     if category not in ["Balance", "Rendimiento", "Estructura"]:
         raise HTTPException(
             status_code=400,
@@ -97,11 +129,38 @@ def get_ranking(
     indicator_names = IndicatorConfig.get_indicator_names_by_category(category)
     is_percentage = IndicatorConfig.is_category_percentage(category)
     unit = IndicatorConfig.get_category_unit(category)
-    
-    
-    df_filtrado = dh.filter_by_category(indicator_names, is_percentage)
-    
-    ranking = dh.get_ranking(df_filtrado, kpi, ascending=ascending)
+
+    # The ranking is of one ID, a name with more than one needs the sheet
+    # or the code
+    try:
+        indicator = dh.resolve_indicator(kpi, sheet, code)
+    except AmbiguousIndicatorError as e:
+        raise HTTPException(
+            status_code=400, detail={"error": str(e), "choices": e.choices}
+        )
+
+    index = dh.get_category_index(indicator_names, is_percentage)
+
+    if index is not None:
+
+        ranking = index.get_ranking(indicator, ascending=ascending, top=top)
+        total_banks = index.count_banks(indicator) if top else len(ranking)
+
+    elif (database is not None and database.is_available() and
+            indicator in dh.get_indicator_keys(indicator_names)):
+
+        ranking = database.get_ranking(
+            indicator, ascending=ascending, limit=top,
+            scale=100 if is_percentage else 1
+        )
+        total_banks = database.count_banks(indicator) if top else len(ranking)
+
+    elif database is not None and database.is_available():
+
+        ranking = pd.DataFrame()
+
+    else:
+        raise HTTPException(status_code=503, detail="Datos no disponibles")
     
     if ranking.empty:
         raise HTTPException(
@@ -115,7 +174,7 @@ def get_ranking(
         "is_percentage": is_percentage,
         "unit": unit,
         "ranking": ranking.to_dict('records'),
-        "total_banks": len(ranking)
+        "total_banks": total_banks
     }
 
 
@@ -124,6 +183,10 @@ def get_available_banks(
     category: str = Query("Balance", description="Filtrar por categoría")
 ):
     
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+    df_original = snapshot.data
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -149,6 +212,9 @@ def get_available_indicators(
     category: str = Query("Balance", description="Balance, Rendimiento o Estructura")
 ):
    
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+
     if category not in ["Balance", "Rendimiento", "Estructura"]:
         raise HTTPException(status_code=400, detail="Categoría inválida")
     
@@ -158,16 +224,111 @@ def get_available_indicators(
         "category": category,
         "indicators": list(indicator_names.keys()),
         "descriptions": indicator_names,
+        "ids": {
+            name: dh.registry.get_ids([name]) for name in indicator_names
+        },
         "total": len(indicator_names)
     }
 
 
+@router.get("/indicators/registry", response_model=IndicatorRegistryResponse)
+def get_indicator_registry():
+
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+
+    if not dh.registry.is_available():
+        raise HTTPException(
+            status_code=404,
+            detail="El registro de indicadores no está publicado"
+        )
+
+    return {
+        "indicators": dh.registry.to_records(),
+        "ambiguous_names": [
+            name for name in dh.registry.ids_by_name
+            if dh.registry.is_ambiguous(name)
+        ],
+        "total": len(dh.registry.registry)
+    }
+
+
+@router.get("/segments", response_model=SegmentTotalsResponse)
+def get_segment_totals(
+    category: str = Query("Balance", description="Balance, Rendimiento o Estructura")
+):
+
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+    df_original = snapshot.data
+
+    if category not in ["Balance", "Rendimiento", "Estructura"]:
+        raise HTTPException(status_code=400, detail="Categoría inválida")
+
+    if not dh.segments.is_available():
+        raise HTTPException(
+            status_code=404,
+            detail="Los totales de los segmentos no están publicados"
+        )
+
+    indicator_names = IndicatorConfig.get_indicator_names_by_category(category)
+    is_percentage = IndicatorConfig.is_category_percentage(category)
+    scale = 100 if is_percentage else 1
+
+    indicator_ids = dh.registry.get_ids(list(indicator_names))
+
+    # The totals come as the Superintendencia publishes them, the sum of the
+    # banks of the data only says if they match (it makes sense for amounts)
+
+    totals = dh.segments.get_totals(indicator_ids)
+    comparison = dh.segments.compare(
+        df_original[df_original["id_indicador"].isin(indicator_ids)]
+    ) if df_original is not None and dh.has_indicator_ids(df_original) else None
+
+    segments = []
+
+    for segment in dh.segments.get_segments():
+
+        segment_totals = totals[totals["segmento"] == segment]
+
+        matches = None
+
+        if comparison is not None:
+            matches = comparison.loc[
+                comparison["segmento"] == segment
+            ].set_index("id_indicador")["coincide"]
+
+        segments.append({
+            "segment": segment,
+            "banks": dh.segments.get_members(segment),
+            "totals": {
+                dh.registry.get_label(row.id_indicador) or row.nombre_del_indicador: {
+                    "value": None if pd.isna(row.valor_indicador) else row.valor_indicador * scale,
+                    "matches_banks": None if matches is None or row.id_indicador not in matches.index
+                    else bool(matches[row.id_indicador])
+                }
+                for row in segment_totals.itertuples(index=False)
+            }
+        })
+
+    return {
+        "category": category,
+        "is_percentage": is_percentage,
+        "segments": segments,
+        "total": len(segments)
+    }
+
+
 @router.get("/comparative", response_model=ComparativeResponse)
 def get_comparative_table(
     category: str = Query("Balance", description="Categoría a comparar"),
     banks: Optional[List[str]] = Query(None, description="Bancos específicos (opcional)")
 ):
    
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+    df_original = snapshot.data
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -212,6 +373,10 @@ def get_category_statistics(
     category: str = Query("Balance", description="Categoría a analizar")
 ):
     
+    snapshot = repository.snapshot()
+    dh = snapshot.handler
+    df_original = snapshot.data
+
     if df_original is None:
         raise HTTPException(status_code=503, detail="Datos no disponibles")
     
@@ -225,7 +390,7 @@ def get_category_statistics(
     
     stats = calc.get_sumary_stats(df_filtrado)
     
-    resumen_bancos = df_filtrado.groupby('banks').agg({
+    resumen_bancos = df_filtrado.groupby('banks', observed=True).agg({
         'valor_indicador': ['mean', 'sum', 'count', 'std']
     }).round(2)
     
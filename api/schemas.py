@@ -91,6 +91,7 @@ class IndicatorsListResponse(BaseModel):
     category: str = Field(..., description="Categoría")
     indicators: List[str] = Field(..., description="Lista de indicadores")
     descriptions: Dict[str, str] = Field(..., description="Descripción de cada indicador")
+    ids: Dict[str, List[int]] = Field(default_factory=dict, description="IDs de cada indicador (más de uno si el nombre se repite)")
     total: int = Field(..., description="Total de indicadores")
     
     class Config:
@@ -102,11 +103,30 @@ class IndicatorsListResponse(BaseModel):
                     "FONDOS DISPONIBLES": "Liquidez inmediata",
                     "INVERSIONES": "Activos financieros"
                 },
+                "ids": {
+                    "FONDOS DISPONIBLES": [115560015],
+                    "INVERSIONES": [740263794]
+                },
                 "total": 2
             }
         }
 
 
+class IndicatorRegistryResponse(BaseModel):
+
+    indicators: List[Dict] = Field(..., description="ID, hoja, código y nombre de cada indicador")
+    ambiguous_names: List[str] = Field(..., description="Nombres que tienen más de un ID")
+    total: int = Field(..., description="Total de IDs")
+
+
+class SegmentTotalsResponse(BaseModel):
+
+    category: str = Field(..., description="Categoría de análisis")
+    is_percentage: bool = Field(..., description="Si los valores son porcentajes")
+    segments: List[Dict] = Field(..., description="Cada segmento con sus bancos y sus totales oficiales por indicador")
+    total: int = Field(..., description="Total de segmentos")
+
+
 class ComparativeResponse(BaseModel):
 
     category: str = Field(..., description="Categoría de análisis")
@@ -194,3 +214,12 @@ class SystemStatisticsResponse(BaseModel):
     total_indicators: int
     statistics: Dict[str, Dict[str, float]]
     summary: Dict
+
+
+class ReloadStatusResponse(BaseModel):
+    """Estado de la recarga del dataset"""
+    started: Optional[bool] = None
+    dataset_version: int
+    reloading: bool
+    last_reload: Optional[str]
+    last_error: Optional[str]
@@ -0,0 +1,242 @@
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+import pandas as pd
+
+from scripts.visualizations.components.data_handler import make_read_only
+
+
+# With several workers every one of them read the dataset, normalized it and
+# calculated the enriched data of the advanced analytics, so the memory grew
+# with every worker. Now one process (the one that starts the workers, or
+# python -m api.shared_dataset) publishes the frames of the repository as
+# arrow files without compression, and the workers open them with mmap: the
+# numeric columns and the codes of the categories are read only views of the
+# file, so the pages are the same for all the workers (the page cache of the
+# system) and a worker starts without reading or calculating anything
+
+SHARED_DATASET_ENV = "BANKING_API_SHARED_DATASET"
+
+_project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+_shared_root = os.path.join(_project_root, "output", "cache", "shared")
+
+
+class SharedDataset:
+
+    manifest_name = "manifest.json"
+
+    def __init__(self, directory: str):
+
+        self.directory = directory
+
+    # pyarrow is optional, without it the workers load the dataset like
+    # before
+
+    @staticmethod
+    def is_supported() -> bool:
+
+        return importlib.util.find_spec("pyarrow") is not None
+
+    # The directory of a version of the dataset, the modification time of
+    # the data is in the name so a new run of the pipeline with the same
+    # version (or without version file) is published again
+
+    @staticmethod
+    def default_directory(dataset_name: str, version: int, modified: int) -> str:
+
+        return os.path.join(_shared_root, dataset_name, f"v{version}-{modified}")
+
+    @property
+    def manifest_path(self) -> str:
+
+        return os.path.join(self.directory, self.manifest_name)
+
+    def exists(self) -> bool:
+
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self) -> dict:
+
+        with open(self.manifest_path, encoding="utf-8") as file:
+            return json.load(file)
+
+    # from_pandas turns the NaN into nulls, and a column with nulls has to be
+    # copied to put them back when it's read. The float columns keep the NaN
+    # as a value so they can be read without copy
+
+    @staticmethod
+    def _to_table(df: pd.DataFrame):
+
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=None)
+
+        for position, field in enumerate(table.schema):
+
+            if (pa.types.is_floating(field.type) and
+                    field.name in df.columns and
+                    isinstance(df[field.name], pd.Series)):
+
+                table = table.set_column(
+                    position, field, pa.array(df[field.name].to_numpy())
+                )
+
+        return table
+
+    # Write the frames in a temporary directory and rename it, the workers
+    # never see a half written version. If another process published the
+    # same version first we keep that one
+
+    def publish(self, frames: Dict[str, Optional[pd.DataFrame]], manifest: dict) -> str:
+
+        import pyarrow as pa
+
+        if self.exists():
+            return self.directory
+
+        parent = os.path.dirname(self.directory)
+        os.makedirs(parent, exist_ok=True)
+
+        temporary = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+
+        try:
+
+            published = []
+
+            for name, df in frames.items():
+
+                if df is None:
+                    continue
+
+                table = self._to_table(df)
+
+                with pa.OSFile(os.path.join(temporary, f"{name}.arrow"), "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+
+                published.append(name)
+
+            with open(os.path.join(temporary, self.manifest_name), "w",
+                      encoding="utf-8") as file:
+                json.dump({**manifest, "frames": published}, file, indent=2,
+                          ensure_ascii=False)
+
+            os.replace(temporary, self.directory)
+
+        except OSError:
+
+            shutil.rmtree(temporary, ignore_errors=True)
+
+            if not self.exists():
+                raise
+
+        self.remove_older()
+
+        return self.directory
+
+    # A worker can still be attaching the previous version, or serving from
+    # its mmaps until its next reload (--watch), so the previous version is
+    # always kept and an older one is only deleted when the version that
+    # replaced it was published more than grace_seconds ago
+
+    grace_seconds = 600
+
+    @staticmethod
+    def _published_at(path: str) -> Optional[float]:
+
+        try:
+            return os.path.getmtime(os.path.join(path, SharedDataset.manifest_name))
+
+        except OSError:
+            return None
+
+    def remove_older(self, now: Optional[float] = None):
+
+        import time
+
+        now = time.time() if now is None else now
+        parent = os.path.dirname(self.directory)
+
+        versions = []
+
+        for name in os.listdir(parent):
+
+            path = os.path.join(parent, name)
+
+            if path == self.directory or name.startswith(".tmp-"):
+                continue
+
+            published_at = self._published_at(path)
+
+            # Without manifest it's a broken version, nobody can attach it
+            if published_at is None:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+
+            versions.append((published_at, path))
+
+        # From the newest to the oldest, every version was replaced when the
+        # one before it in the list was published
+
+        versions.sort(reverse=True)
+        replaced_at = self._published_at(self.directory) or now
+
+        for position, (published_at, path) in enumerate(versions):
+
+            if position > 0 and now - replaced_at > self.grace_seconds:
+                shutil.rmtree(path, ignore_errors=True)
+
+            replaced_at = published_at
+
+    # Open the frames with mmap, the arrays that arrow can't give without
+    # copy (the text columns) are copied once and locked like the others
+
+    def attach(self) -> Dict[str, pd.DataFrame]:
+
+        import pyarrow as pa
+
+        frames = {}
+
+        for name in self.read_manifest()["frames"]:
+
+            source = pa.memory_map(
+                os.path.join(self.directory, f"{name}.arrow"), "r"
+            )
+            table = pa.ipc.open_file(source).read_all()
+
+            frames[name] = make_read_only(table.to_pandas(split_blocks=True))
+
+        return frames
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Publica el dataset de la API para que los workers lo "
+                    "abran con mmap"
+    )
+    parser.add_argument(
+        "--dataset", default="Final Dataframe",
+        help="Nombre del dataset en output/cleaned_data"
+    )
+    args = parser.parse_args()
+
+    from api.repository import DatasetRepository
+
+    directory = DatasetRepository(args.dataset).publish()
+
+    if directory is None:
+        print("❌ No se pudo publicar el dataset (¿falta pyarrow o los datos?)")
+        return
+
+    print(f"✅ Dataset publicado en {directory}")
+    print(f"   export {SHARED_DATASET_ENV}=\"{directory}\"")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,16 +29,36 @@ def load_real_data():
     """Intenta cargar datos reales del dataset"""
     try:
         # Intentar diferentes rutas donde pueden estar los datos
-        possible_paths = [
-            Path(__file__).parent.parent / "output" / "cleaned_data" / "Final Dataframe.csv",
-            Path(__file__).parent.parent / "scripts" / "visualizations" / "data" / "Final Dataframe.csv",
-            Path(__file__).parent / "data" / "Final Dataframe.csv"
+        possible_dirs = [
+            Path(__file__).parent.parent / "output" / "cleaned_data",
+            Path(__file__).parent.parent / "scripts" / "visualizations" / "data",
+            Path(__file__).parent / "data"
         ]
+
+        # En cada carpeta preferimos el parquet (lectura tipada y rápida) y
+        # si no existe o está desactualizado usamos el csv
+        possible_paths = []
+        for data_dir in possible_dirs:
+            csv_path = data_dir / "Final Dataframe.csv"
+            parquet_path = data_dir / "Final Dataframe.parquet"
+            if parquet_path.exists() and (
+                not csv_path.exists()
+                or parquet_path.stat().st_mtime >= csv_path.stat().st_mtime
+            ):
+                possible_paths.append(parquet_path)
+            possible_paths.append(csv_path)
         
         for path in possible_paths:
             if path.exists():
                 print(f"📊 Cargando datos reales desde: {path}")
-                df = pd.read_csv(path)
+                try:
+                    if path.suffix == ".parquet":
+                        df = pd.read_parquet(path)
+                    else:
+                        df = pd.read_csv(path)
+                except ImportError:
+                    # Sin pyarrow no se puede leer el parquet, probamos el csv
+                    continue
                 print(f"✅ Datos cargados: {len(df)} registros")
                 return df
         
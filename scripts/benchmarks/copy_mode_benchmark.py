@@ -0,0 +1,179 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# The pipeline modules use flat imports, so we add their directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "pipeline"
+)))
+
+from data_pipeline import (  # noqa: E402
+    CleaningPipeline,
+    BalanceCleaningPipeline,
+    MatchColumnsPipeline,
+    ConcatDataframesPipeline
+)
+
+# Columns that the Superintendencia adds next to the banks, the pipeline
+# drops them or filters them
+CATEGORY_COLUMNS = [
+    "BANCOS PRIVADOS GRANDES",
+    "BANCOS PRIVADOS MEDIANOS",
+    "BANCOS PRIVADOS PEQUEÑOS",
+    "TOTAL BANCOS PRIVADOS",
+    "BANCOS PRIVADOS VIVIENDA"
+]
+
+
+# Build the sheets as pandas gives them after read_excel(skiprows=7), with
+# the same columns as dataset.xlsx but with the size we ask for
+
+def build_sheets(accounts, banks, seed=0):
+
+    rng = np.random.default_rng(seed)
+    bank_columns = [f"BANCO {number:04d}" for number in range(banks)]
+
+    def values(rows):
+
+        data = rng.random((rows, len(bank_columns) + len(CATEGORY_COLUMNS)))
+        data[rng.random(rows) < 0.1] = np.nan
+
+        return pd.DataFrame(data, columns=bank_columns + CATEGORY_COLUMNS)
+
+    balance = pd.concat([
+        pd.DataFrame({
+            "Unnamed: 0": np.nan,
+            "CÓDIGO": rng.integers(1, 10_000, accounts),
+            "CUENTA": [f"CUENTA {number}" for number in range(accounts)]
+        }),
+        values(accounts)
+    ], axis=1)
+
+    cartera = balance.copy()
+
+    indicadores = pd.concat([
+        pd.DataFrame({
+            "Unnamed: 0": np.nan,
+            "NOMBRE DEL INDICADOR": [
+                f"INDICADOR {number}" for number in range(accounts // 10)
+            ]
+        }),
+        values(accounts // 10)
+    ], axis=1)
+
+    return {
+        "BALANCE": balance,
+        "COMPOS CART": cartera,
+        "INDICADORES": indicadores
+    }
+
+
+# Peak resident memory of this process in MB, on windows there is no
+# resource module so we can't measure it
+
+def peak_rss_mb():
+
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux gives the value in KB and macOS in bytes
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return float("nan")
+
+
+# Run the full cleaning of the sheets with one copy mode, this runs in its own
+# process so the peak memory of one mode doesn't hide the other one
+
+def run_mode(copy, accounts, banks, queue):
+
+    sheets = build_sheets(accounts, banks)
+    baseline = current_rss_mb()
+
+    main_pipeline = CleaningPipeline(copy=copy)
+    # The random codes of these sheets don't add up like a real balance, so
+    # the accounting checks are left out
+    balance_pipeline = BalanceCleaningPipeline(copy=copy, on_violation="ignore")
+    match_pipeline = MatchColumnsPipeline(copy=copy)
+    concat_pipeline = ConcatDataframesPipeline(copy=copy)
+
+    start = time.perf_counter()
+
+    final_dataframes = []
+
+    for name in list(sheets):
+
+        # The pipeline owns the sheet, so we take it out of the dictionary
+        df = sheets.pop(name)
+
+        if name == "BALANCE":
+            df = balance_pipeline.clean(df)
+        else:
+            df = main_pipeline.clean(df)
+
+        final_dataframes.append(match_pipeline.match(df, name))
+
+    result = concat_pipeline.concat(final_dataframes)
+
+    queue.put({
+        "copy": copy,
+        "rows": len(result),
+        "seconds": time.perf_counter() - start,
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": peak_rss_mb()
+    })
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Compara tiempo y memoria del pipeline con y sin copias"
+    )
+    parser.add_argument("--accounts", type=int, default=20_000)
+    parser.add_argument("--banks", type=int, default=200)
+    args = parser.parse_args()
+
+    # Use spawn so every mode starts from a clean process
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+
+    print(f"Hojas sintéticas: {args.accounts} cuentas x {args.banks} bancos")
+    print(f"{'modo':<10}{'filas':>12}{'segundos':>10}"
+          f"{'rss base MB':>14}{'pico MB':>10}{'extra MB':>10}")
+
+    for copy in (True, False):
+
+        process = context.Process(
+            target=run_mode, args=(copy, args.accounts, args.banks, queue)
+        )
+        process.start()
+        result = queue.get()
+        process.join()
+
+        mode = "copy" if copy else "no-copy"
+        extra = result["peak_rss_mb"] - result["baseline_rss_mb"]
+
+        print(f"{mode:<10}{result['rows']:>12}{result['seconds']:>10.2f}"
+              f"{result['baseline_rss_mb']:>14.1f}"
+              f"{result['peak_rss_mb']:>10.1f}{extra:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
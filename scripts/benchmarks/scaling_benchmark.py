@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# The pipeline modules use flat imports, so we add their directory to the path
+sys.path.insert(0, os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "pipeline"
+)))
+
+from copy_mode_benchmark import peak_rss_mb, current_rss_mb  # noqa: E402
+from workbook_generator import generate_directory  # noqa: E402
+
+from data_ingest import DataIngester  # noqa: E402
+from data_processing import CreateDataframes  # noqa: E402
+from data_saving import SaveCleanData  # noqa: E402
+from main import clean_sheet  # noqa: E402
+from data_pipeline import (  # noqa: E402
+    CleaningPipeline,
+    BalanceCleaningPipeline,
+    MatchColumnsPipeline,
+    ConcatDataframesPipeline
+)
+
+
+# Run the full pipeline (read, clean, concat and save) over every workbook
+# of a directory. It runs in its own process so the peak memory is only the
+# one of this scale
+
+def run_scale(directory, output_dir, queue):
+
+    baseline = current_rss_mb()
+
+    ingester = DataIngester()
+    dataframe_creator = CreateDataframes()
+    main_pipeline = CleaningPipeline()
+    balance_pipeline = BalanceCleaningPipeline()
+    match_pipeline = MatchColumnsPipeline()
+    concat_pipeline = ConcatDataframesPipeline()
+    data_saver = SaveCleanData(output_dir)
+
+    seconds = {"read": 0.0, "clean": 0.0, "save": 0.0}
+    rows = 0
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+
+        for period, path in ingester.ingest_directory(directory):
+
+            start = time.perf_counter()
+            dataframes = dataframe_creator.create(path)
+            seconds["read"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            concat_dataframe = concat_pipeline.concat([
+                clean_sheet(
+                    name, df, main_pipeline, balance_pipeline, match_pipeline
+                )
+                for name, df in dataframes.items()
+            ])
+            seconds["clean"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            data_saver.save(concat_dataframe, f"Final Dataframe {period}")
+            seconds["save"] += time.perf_counter() - start
+
+            rows += len(concat_dataframe)
+
+            del dataframes, concat_dataframe
+
+    queue.put({
+        "rows": rows,
+        "seconds": seconds,
+        "baseline_rss_mb": baseline,
+        "peak_rss_mb": peak_rss_mb()
+    })
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Mide tiempo y memoria del pipeline con libros sintéticos "
+                    "cada vez más grandes"
+    )
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=[1, 10],
+        help="Veces el tamaño de dataset.xlsx (por ejemplo 1 10 100)"
+    )
+    parser.add_argument(
+        "--dimensions", nargs="+", default=["banks", "accounts"],
+        choices=["banks", "accounts", "periods"],
+        help="Qué crece con la escala: bancos, cuentas y/o periodos"
+    )
+    parser.add_argument(
+        "--workdir", default=None,
+        help="Directorio para los libros y salidas (por defecto uno temporal)"
+    )
+    parser.add_argument(
+        "--keep", action="store_true",
+        help="No borrar los libros generados"
+    )
+    parser.add_argument(
+        "--report", default=None,
+        help="Ruta del reporte json (por defecto "
+             "output/reports/scaling_benchmark_<fecha>.json)"
+    )
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="scaling_benchmark_")
+
+    # Use spawn so every scale starts from a clean process
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+
+    results = []
+
+    print(f"Dimensiones escaladas: {', '.join(args.dimensions)}")
+    print(f"{'escala':>7}{'libros':>8}{'filas':>12}{'generar s':>11}"
+          f"{'leer s':>9}{'limpiar s':>11}{'guardar s':>11}{'total s':>9}"
+          f"{'pico MB':>10}{'extra MB':>10}")
+
+    try:
+        for scale in args.scales:
+
+            def size(dimension):
+                return scale if dimension in args.dimensions else 1
+
+            directory = os.path.join(workdir, f"escala_{scale}")
+
+            start = time.perf_counter()
+
+            # A workbook can't have more than 16384 columns, so the biggest
+            # scales of banks don't fit in excel
+
+            try:
+                workbooks = generate_directory(
+                    os.path.join(directory, "dataset"),
+                    periods=size("periods"),
+                    banks_scale=size("banks"),
+                    accounts_scale=size("accounts")
+                )
+            except ValueError as e:
+                print(f"{scale:>7}  omitida: {e}")
+                continue
+
+            generate_seconds = time.perf_counter() - start
+
+            process = context.Process(
+                target=run_scale,
+                args=(os.path.join(directory, "dataset"),
+                      os.path.join(directory, "output"), queue)
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+
+            total = sum(result["seconds"].values())
+            extra = result["peak_rss_mb"] - result["baseline_rss_mb"]
+
+            results.append({
+                "scale": scale,
+                "banks_scale": size("banks"),
+                "accounts_scale": size("accounts"),
+                "periods": size("periods"),
+                "workbooks": len(workbooks),
+                "workbook_mb": round(sum(
+                    os.path.getsize(path) for path in workbooks
+                ) / 1024 ** 2, 3),
+                "generate_seconds": round(generate_seconds, 3),
+                "total_seconds": round(total, 3),
+                **result
+            })
+
+            print(f"{scale:>7}{len(workbooks):>8}{result['rows']:>12}"
+                  f"{generate_seconds:>11.2f}"
+                  f"{result['seconds']['read']:>9.2f}"
+                  f"{result['seconds']['clean']:>11.2f}"
+                  f"{result['seconds']['save']:>11.2f}{total:>9.2f}"
+                  f"{result['peak_rss_mb']:>10.1f}{extra:>10.1f}")
+
+    finally:
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report_path = args.report or os.path.join(
+        os.path.dirname(__file__), "..", "..", "output", "reports",
+        f"scaling_benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    report_path = os.path.abspath(report_path)
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump({
+            "dimensions": args.dimensions,
+            "cpu_count": os.cpu_count(),
+            "results": results
+        }, file, indent=2, ensure_ascii=False)
+
+    print(f"Reporte: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+import argparse
+import calendar
+import datetime
+import os
+
+import numpy as np
+from openpyxl import Workbook
+
+
+# Size of dataset/dataset.xlsx, the scales multiply these numbers
+BASE_BANKS = 23
+BASE_SUBACCOUNTS = 6
+BASE_DETAILS = 8
+BASE_PORTFOLIO_DETAILS = 8
+BASE_INDICATORS = 60
+
+# Excel can't have more columns than this
+MAX_COLUMNS = 16_384
+
+# The banks are grouped by size like in the Superintendencia workbook, the
+# column of the segment goes right after its banks
+SIZE_SEGMENTS = [
+    ("BANCOS PRIVADOS GRANDES", 4),
+    ("BANCOS PRIVADOS MEDIANOS", 9),
+    ("BANCOS PRIVADOS PEQUEÑOS", 10)
+]
+
+# And after the total there is one column for every line of business
+BUSINESS_SEGMENTS = [
+    "BANCOS PRIVADOS COMERCIALES",
+    "BANCOS PRIVADOS CONSUMO",
+    "BANCOS PRIVADOS VIVIENDA",
+    "BANCOS PRIVADOS MICROCRÉDITO",
+    "BANCA MÚLTIPLE"
+]
+
+# Groups of accounts of the balance, with the code of their total
+ASSET_GROUPS = [
+    ("11", "FONDOS DISPONIBLES"),
+    ("12", "OPERACIONES INTERBANCARIAS"),
+    ("13", "INVERSIONES"),
+    ("14", "CARTERA DE CRÉDITOS"),
+    ("15", "DEUDORES POR ACEPTACIONES"),
+    ("16", "CUENTAS POR COBRAR"),
+    ("17", "BIENES REALIZABLES"),
+    ("18", "PROPIEDADES Y EQUIPO"),
+    ("19", "OTROS ACTIVOS")
+]
+
+LIABILITY_GROUPS = [
+    ("21", "OBLIGACIONES CON EL PÚBLICO"),
+    ("22", "OPERACIONES INTERBANCARIAS"),
+    ("23", "OBLIGACIONES INMEDIATAS"),
+    ("24", "ACEPTACIONES EN CIRCULACIÓN"),
+    ("25", "CUENTAS POR PAGAR"),
+    ("26", "OBLIGACIONES FINANCIERAS"),
+    ("27", "VALORES EN CIRCULACIÓN"),
+    ("29", "OTROS PASIVOS")
+]
+
+EQUITY_GROUPS = [
+    ("31", "CAPITAL SOCIAL"),
+    ("33", "RESERVAS"),
+    ("35", "SUPERÁVIT POR VALUACIONES"),
+    ("36", "RESULTADOS")
+]
+
+CONTINGENT_GROUPS = [
+    ("61", "DEUDORAS"),
+    ("64", "ACREEDORAS")
+]
+
+ORDER_GROUPS = [
+    ("71", "CUENTAS DE ORDEN DEUDORAS"),
+    ("74", "CUENTAS DE ORDEN ACREEDORAS")
+]
+
+PORTFOLIO_PRODUCTS = [
+    "PRODUCTIVO",
+    "CONSUMO",
+    "INMOBILIARIO",
+    "MICROCRÉDITO",
+    "VIVIENDA DE INTERÉS SOCIAL Y PÚBLICO"
+]
+
+PORTFOLIO_STATES = [
+    "POR VENCER",
+    "REFINANCIADA POR VENCER",
+    "REESTRUCTURADA POR VENCER",
+    "QUE NO DEVENGA INTERESES",
+    "VENCIDA"
+]
+
+INDICATOR_SECTIONS = [
+    "SUFICIENCIA PATRIMONIAL",
+    "ESTRUCTURA Y CALIDAD DE ACTIVOS:",
+    "INDICES DE MOROSIDAD",
+    "COBERTURA DE PROVISIONES PARA CARTERA IMPRODUCTIVA",
+    "EFICIENCIA MICROECONOMICA",
+    "RENTABILIDAD",
+    "LIQUIDEZ"
+]
+
+
+def get_period_date(period):
+
+    year, month = (int(part) for part in period.split("-"))
+
+    return datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+
+# The periods go back month by month from the last one, so the oldest
+# workbook is the first one of the list
+
+def get_periods(last_period, periods):
+
+    year, month = (int(part) for part in last_period.split("-"))
+    result = []
+
+    for _ in range(periods):
+        result.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+
+    return result[::-1]
+
+
+# Names of the banks and of all the columns of a sheet, with the segment
+# columns between the banks like in the real workbook
+
+class BankLayout:
+
+    def __init__(self, banks, rng):
+
+        self.banks = [f"BP SINTÉTICO {number:05d}" for number in range(banks)]
+
+        # Split the banks in the size segments with the same proportions
+        # of the real workbook
+
+        base_total = sum(size for _, size in SIZE_SEGMENTS)
+        bounds = np.cumsum([0] + [size for _, size in SIZE_SEGMENTS])
+        bounds = np.round(bounds * banks / base_total).astype(int)
+
+        self.size_members = {
+            segment: list(range(bounds[position], bounds[position + 1]))
+            for position, (segment, _) in enumerate(SIZE_SEGMENTS)
+        }
+
+        # Every bank has a line of business, nobody is only of housing like
+        # in the real data, so that column is always zero
+
+        business = rng.choice(
+            [0, 1, 3, 4], size=banks, p=[0.4, 0.2, 0.1, 0.3]
+        )
+
+        self.business_members = {
+            segment: list(np.flatnonzero(business == position))
+            for position, segment in enumerate(BUSINESS_SEGMENTS)
+        }
+
+        self.columns = []
+
+        for segment, _ in SIZE_SEGMENTS:
+            self.columns += [self.banks[bank]
+                             for bank in self.size_members[segment]]
+            self.columns.append(segment)
+
+        self.columns += ["TOTAL BANCOS PRIVADOS"] + BUSINESS_SEGMENTS
+
+    # Put the values of the banks in the order of the columns, with the
+    # segments. In the balance the segments are sums, in the indicators
+    # they are averages
+
+    def get_row_values(self, values, aggregate="sum"):
+
+        def segment_value(members):
+            if not len(members):
+                return 0.0
+            return float(getattr(values[members], aggregate)())
+
+        row = []
+
+        for segment, _ in SIZE_SEGMENTS:
+            members = self.size_members[segment]
+            row += values[members].tolist()
+            row.append(segment_value(members))
+
+        row.append(segment_value(np.arange(len(values))))
+
+        for segment in BUSINESS_SEGMENTS:
+            row.append(segment_value(self.business_members[segment]))
+
+        return row
+
+
+# Rows of the sheet before the table, the title, the system, the date and
+# the unit, with empty rows so the table starts after 7 rows
+
+def write_header(sheet, title, period, unit):
+
+    sheet.append([])
+    sheet.append([None, title])
+    sheet.append([None, "SISTEMA DE BANCOS PRIVADOS"])
+    sheet.append([None, get_period_date(period).strftime("%d/%m/%Y")])
+    sheet.append([None, unit])
+    sheet.append([])
+    sheet.append([])
+
+
+# A group of the balance with its subaccounts (4 digits) and their details
+# (6 digits or more), the values of every level are the sum of the level
+# below so the totals of the workbook add up
+
+def build_group(code, name, total, subaccounts, details, rng):
+
+    weights = rng.dirichlet(np.ones(subaccounts), size=len(total)).T
+    width = max(2, len(str(details * 5)))
+    rows = [(code, name, total)]
+
+    for subaccount in range(subaccounts):
+
+        subaccount_code = f"{code}{subaccount + 1:02d}"
+        subaccount_total = total * weights[subaccount]
+
+        rows.append((subaccount_code, f"Subcuenta {subaccount_code}",
+                     subaccount_total))
+
+        detail_weights = rng.dirichlet(np.ones(details),
+                                       size=len(total)).T
+
+        for detail in range(details):
+
+            detail_code = f"{subaccount_code}{(detail + 1) * 5:0{width}d}"
+
+            rows.append((detail_code, f"Detalle {detail_code}",
+                         subaccount_total * detail_weights[detail]))
+
+    return rows
+
+
+def split_total(total, groups, rng):
+
+    weights = rng.dirichlet(np.ones(len(groups)) * 2, size=len(total)).T
+
+    return [total * weights[position] for position in range(len(groups))]
+
+
+def write_balance(sheet, layout, period, assets, subaccounts, details, rng):
+
+    write_header(sheet, "ESTADO DE SITUACIÓN", period,
+                 "(en miles de dólares)")
+    sheet.append([None, "CÓDIGO", "CUENTA"] + layout.columns)
+
+    def append_rows(rows):
+        for code, name, values in rows:
+            sheet.append([None, code, name] + layout.get_row_values(values))
+
+    def append_groups(groups, total):
+        for (code, name), values in zip(groups, split_total(total, groups,
+                                                             rng)):
+            append_rows(build_group(code, name, values, subaccounts,
+                                    details, rng))
+
+    # ACTIVO = PASIVOS + PATRIMONIO + INGRESOS - GASTOS, like the real
+    # workbook where the result of the year is not closed yet
+
+    liabilities = assets * rng.uniform(0.85, 0.92, len(assets))
+    expenses = assets * rng.uniform(0.05, 0.09, len(assets))
+    income = expenses * rng.uniform(1.0, 1.2, len(assets))
+    equity = assets - liabilities - (income - expenses)
+
+    sheet.append([None, None, "ACTIVO"])
+    append_groups(ASSET_GROUPS, assets)
+    append_rows([
+        ("1", "TOTAL ACTIVO", assets),
+        ("4", "GASTOS", expenses),
+        ("+1+4", "TOTAL ACTIVO Y GASTOS", assets + expenses)
+    ])
+
+    sheet.append([None, None, "PASIVOS"])
+    append_groups(LIABILITY_GROUPS, liabilities)
+    append_rows([("2", "TOTAL PASIVOS", liabilities)])
+
+    sheet.append([None, None, "PATRIMONIO"])
+    append_groups(EQUITY_GROUPS, equity)
+    append_rows([
+        ("3", "TOTAL PATRIMONIO", equity),
+        ("+2+3", "TOTAL PASIVO Y PATRIMONIO", liabilities + equity),
+        ("5", "INGRESOS", income),
+        ("+2+3+5", "TOTAL PASIVOS PATRIMONIOS E INGRESOS",
+         liabilities + equity + income)
+    ])
+
+    contingent = assets * rng.uniform(0.1, 0.4, len(assets))
+    append_rows([("6", "CUENTAS CONTINGENTES", contingent)])
+    append_groups(CONTINGENT_GROUPS, contingent)
+
+    order = assets * rng.uniform(1.5, 3.0, len(assets))
+    append_rows([("7", "CUENTAS DE ORDEN", order)])
+    append_groups(ORDER_GROUPS, order)
+
+
+def write_portfolio(sheet, layout, period, assets, details, rng):
+
+    write_header(
+        sheet,
+        "COMPOSICIÓN DE LA CARTERA DE CRÉDITOS POR VENCIMIENTOS Y LÍNEAS "
+        "DE NEGOCIO",
+        period,
+        "En miles de dólares"
+    )
+    sheet.append([None, "CÓDIGO", "CUENTA"] + layout.columns)
+
+    portfolio = assets * rng.uniform(0.55, 0.7, len(assets))
+    lines = [
+        (f"14{position + 1:02d}",
+         f"CARTERA DE CRÉDITOS {product} {state}")
+        for position, (state, product) in enumerate(
+            (state, product)
+            for state in PORTFOLIO_STATES
+            for product in PORTFOLIO_PRODUCTS
+        )
+    ]
+
+    sheet.append([None, None, "CARTERA BRUTA"] +
+                 layout.get_row_values(portfolio))
+    sheet.append([])
+
+    width = max(2, len(str(details * 5)))
+
+    for (code, name), values in zip(lines, split_total(portfolio, lines,
+                                                       rng)):
+
+        sheet.append([None, code, name] + layout.get_row_values(values))
+
+        weights = rng.dirichlet(np.ones(details), size=len(values)).T
+
+        for detail in range(details):
+
+            detail_code = f"{code}{(detail + 1) * 5:0{width}d}"
+
+            sheet.append(
+                [None, detail_code, f"De {detail * 30 + 1} a "
+                 f"{(detail + 1) * 30} días"] +
+                layout.get_row_values(values * weights[detail])
+            )
+
+
+def write_indicators(sheet, layout, period, indicators, rng):
+
+    write_header(sheet, "INDICADORES FINANCIEROS", period,
+                 "(En porcentajes)")
+    sheet.append([None, "NOMBRE DEL INDICADOR"] + layout.columns)
+
+    per_section = max(1, indicators // len(INDICATOR_SECTIONS))
+    number = 0
+
+    for section in INDICATOR_SECTIONS:
+
+        sheet.append([])
+        sheet.append([None, section])
+
+        for _ in range(per_section):
+
+            number += 1
+            values = rng.uniform(0, 1.5, len(layout.banks))
+
+            sheet.append(
+                [None, f"INDICADOR FINANCIERO {number:05d}"] +
+                layout.get_row_values(values, aggregate="mean")
+            )
+
+
+# Write a workbook of one period with the layout of dataset.xlsx, only the
+# sheets that the pipeline reads
+
+def generate_workbook(path, period, banks_scale=1, accounts_scale=1, seed=0):
+
+    banks = BASE_BANKS * banks_scale
+    columns = 3 + banks + len(SIZE_SEGMENTS) + 1 + len(BUSINESS_SEGMENTS)
+
+    if columns > MAX_COLUMNS:
+        raise ValueError(
+            f"{banks} bancos necesitan {columns} columnas, excel permite "
+            f"{MAX_COLUMNS}"
+        )
+
+    # The layout of the banks is the same in every period, only the values
+    # change from one month to the next
+
+    layout = BankLayout(banks, np.random.default_rng(seed))
+    period_date = get_period_date(period)
+    rng = np.random.default_rng([seed, period_date.year, period_date.month])
+
+    assets = rng.lognormal(14, 1.2, banks)
+
+    workbook = Workbook(write_only=True)
+
+    write_balance(
+        workbook.create_sheet("BALANCE"), layout, period, assets,
+        BASE_SUBACCOUNTS, BASE_DETAILS * accounts_scale, rng
+    )
+    write_portfolio(
+        workbook.create_sheet("COMPOS CART"), layout, period, assets,
+        BASE_PORTFOLIO_DETAILS * accounts_scale, rng
+    )
+    write_indicators(
+        workbook.create_sheet("INDICADORES"), layout, period,
+        BASE_INDICATORS * accounts_scale, rng
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    workbook.save(path)
+
+    return path
+
+
+# Write one workbook for every period in a directory, with the period in the
+# name so DataIngester.ingest_directory finds them
+
+def generate_directory(directory, periods=1, banks_scale=1, accounts_scale=1,
+                       last_period="2025-09", seed=0):
+
+    return [
+        generate_workbook(
+            os.path.join(directory, f"dataset_{period}.xlsx"),
+            period,
+            banks_scale=banks_scale,
+            accounts_scale=accounts_scale,
+            seed=seed
+        )
+        for period in get_periods(last_period, periods)
+    ]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Genera libros sintéticos con el formato de la "
+                    "Superintendencia"
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--banks-scale", type=int, default=1)
+    parser.add_argument("--accounts-scale", type=int, default=1)
+    parser.add_argument("--periods", type=int, default=1)
+    parser.add_argument("--last-period", default="2025-09")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_directory(
+        args.directory,
+        periods=args.periods,
+        banks_scale=args.banks_scale,
+        accounts_scale=args.accounts_scale,
+        last_period=args.last_period,
+        seed=args.seed
+    )
+
+    print(f"Libros generados: {len(paths)} en {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
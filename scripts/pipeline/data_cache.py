@@ -0,0 +1,465 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import zipfile
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+import pandas as pd
+
+
+# Namespaces used inside the xlsx files, we need them to find the xml file of
+# every sheet without opening the workbook with pandas
+
+SPREADSHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIP_NS = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+)
+
+# These files are shared by all the sheets (the text values and the formats),
+# so if one of them changes every sheet has to be processed again
+
+SHARED_MEMBERS = ["xl/sharedStrings.xml", "xl/styles.xml"]
+
+
+class PipelineCache:
+
+    def __init__(self, cache_dir=None):
+
+        # Get the root path of the project
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        # Everything lives in the output directory, next to the cleaned data
+
+        self.cache_dir = cache_dir or os.path.join(
+            project_root, "output", "cache"
+        )
+
+        self.manifest_path = os.path.join(self.cache_dir, "manifest.json")
+
+
+    # Join any number of values into a single sha256 key
+
+    @staticmethod
+    def make_key(*parts):
+
+        digest = hashlib.sha256()
+
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+
+    # Hash the content of a file by blocks, so we never hold it all in memory
+
+    @staticmethod
+    def file_hash(path):
+
+        digest = hashlib.sha256()
+
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+
+    # Fingerprint the transformers of the pipelines: the class, the params
+    # and the source code of the module, so changing a step or its code also
+    # invalidates the cached sheets
+
+    def params_hash(self, *pipelines):
+
+        fingerprint = []
+        modules = {}
+
+        for pipeline in pipelines:
+
+            steps = pipeline.get_steps()
+
+            fingerprint.append([type(pipeline).__name__, [
+                (name, type(step).__name__, step.get_params())
+                for name, step in steps
+            ]])
+
+            for item in [pipeline] + [step for _, step in steps]:
+                module = inspect.getmodule(type(item))
+                modules[module.__name__] = module  # type:ignore
+
+        # Sort the modules by name so the key is the same on every run
+
+        for name in sorted(modules):
+            fingerprint.append(inspect.getsource(modules[name]))
+
+        return self.make_key(json.dumps(fingerprint, default=repr))
+
+
+    # Map every sheet name to the xml file inside the xlsx, it's a zip file
+    # so we can read it without parsing the cells
+
+    @staticmethod
+    def _sheet_members(archive: zipfile.ZipFile):
+
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        relations = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+
+        targets = {
+            relation.get("Id"): relation.get("Target", "")
+            for relation in relations
+        }
+
+        members = {}
+
+        for sheet in workbook.iter(f"{{{SPREADSHEET_NS}}}sheet"):
+
+            target = targets.get(sheet.get(f"{{{RELATIONSHIP_NS}}}id"), "")
+
+            # The targets can be absolute from the root of the zip or
+            # relative to the xl directory
+
+            if target.startswith("/"):
+                members[sheet.get("name")] = target.lstrip("/")
+            else:
+                members[sheet.get("name")] = f"xl/{target}"
+
+        return members
+
+
+    # Hash every sheet on its own, this way we know which sheets changed
+    # between two versions of the workbook
+
+    def sheet_hashes(self, workbook_path, sheet_names):
+
+        # The workbook can also come as its bytes, read only once by main.py
+        if isinstance(workbook_path, bytes):
+            archive_source = BytesIO(workbook_path)
+        else:
+            archive_source = workbook_path
+
+        try:
+            with zipfile.ZipFile(archive_source) as archive:
+
+                members = self._sheet_members(archive)
+                available = set(archive.namelist())
+
+                shared = self.make_key(*[
+                    hashlib.sha256(archive.read(member)).hexdigest()
+                    for member in SHARED_MEMBERS if member in available
+                ])
+
+                return {
+                    sheet: self.make_key(
+                        shared,
+                        hashlib.sha256(
+                            archive.read(members[sheet])
+                        ).hexdigest()
+                    )
+                    for sheet in sheet_names
+                }
+
+        except (zipfile.BadZipFile, KeyError, ET.ParseError):
+
+            # If the file is not a regular xlsx we use the hash of the whole
+            # file for every sheet, so any change processes all of them
+
+            if isinstance(workbook_path, bytes):
+                whole_file = hashlib.sha256(workbook_path).hexdigest()
+            else:
+                whole_file = self.file_hash(workbook_path)
+
+            return {sheet: whole_file for sheet in sheet_names}
+
+
+    def _sheet_path(self, sheet, key):
+
+        safe_name = sheet.replace(" ", "_").replace(os.sep, "_")
+
+        return os.path.join(self.cache_dir, f"{safe_name}-{key}.pkl")
+
+
+    # Load the cleaned dataframe of a sheet, or None if we don't have it
+
+    def load_sheet(self, sheet, key):
+
+        path = self._sheet_path(sheet, key)
+
+        if not os.path.exists(path):
+            return None
+
+        try:
+            return pd.read_pickle(path)
+
+        except Exception as e:
+            print(f"No se pudo leer la cache de {sheet}: {e}")
+            return None
+
+
+    # Save the cleaned dataframe of a sheet and delete the old versions of the
+    # same sheet, so the cache doesn't keep growing on every change
+
+    def save_sheet(self, sheet, key, dataframe: pd.DataFrame):
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        path = self._sheet_path(sheet, key)
+        prefix = os.path.basename(path).rsplit("-", 1)[0] + "-"
+
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.startswith(prefix) and file_name.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, file_name))
+
+        dataframe.to_pickle(path)
+
+        return path
+
+
+    def load_manifest(self):
+
+        if not os.path.exists(self.manifest_path):
+            return {}
+
+        try:
+            with open(self.manifest_path, encoding="utf-8") as file:
+                return json.load(file)
+
+        except (OSError, ValueError):
+            return {}
+
+
+    # Write down the key of the last build and the hash of the files we
+    # published, so the next run can check all of them
+
+    def save_manifest(self, build_key, output_paths, sheet_keys):
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        manifest = {
+            "build_key": build_key,
+            "outputs": {
+                path: self.file_hash(path) for path in output_paths
+            },
+            "sheets": sheet_keys
+        }
+
+        with open(self.manifest_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, ensure_ascii=False)
+
+
+    # The build is up to date when the inputs are the same as the last run
+    # and the published files are still the ones we wrote (a deleted file
+    # is published again)
+
+    def is_up_to_date(self, build_key, output_paths):
+
+        manifest = self.load_manifest()
+
+        if manifest.get("build_key") != build_key:
+            return False
+
+        outputs = manifest.get("outputs", {})
+
+        if set(outputs) != set(output_paths):
+            return False
+
+        return all(
+            os.path.exists(path) and self.file_hash(path) == file_hash
+            for path, file_hash in outputs.items()
+        )
+
+
+# On disk memory of the output of every step of the pipelines, so changing a
+# late step (like FilterRealBanks) doesn't read and melt every sheet again.
+# The key of a step is the key of its input plus the class, params and code
+# of the step, so only the first input is hashed and the rest of the keys
+# are a chain. When the cache is bigger than max_bytes we delete the files
+# that were used the longest time ago (the date of the file is updated on
+# every hit)
+
+class StepMemory:
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 ** 2):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        self.cache_dir = cache_dir or os.path.join(
+            project_root, "output", "cache", "steps"
+        )
+        self.max_bytes = max_bytes
+
+        # The last objects we gave or received with their key, so the next
+        # pipeline doesn't need to hash what the previous one returned. We
+        # keep the object so its id can't be used by another one
+        self._known = {}
+
+    # The dataframes of the known objects don't go to the worker processes
+
+    def __getstate__(self):
+
+        return {**self.__dict__, "_known": {}}
+
+    def remember(self, X, key, limit=16):
+
+        self._known[id(X)] = (X, key)
+
+        while len(self._known) > limit:
+            del self._known[next(iter(self._known))]
+
+        return key
+
+    def fingerprint(self, X):
+
+        known = self._known.get(id(X))
+
+        if known is not None and known[0] is X:
+            return known[1]
+
+        if isinstance(X, (list, tuple)):
+            return PipelineCache.make_key(
+                "list", *[self.fingerprint(item) for item in X]
+            )
+
+        if isinstance(X, pd.DataFrame):
+
+            digest = hashlib.sha256()
+            digest.update(repr(list(X.columns)).encode("utf-8"))
+            digest.update(repr(list(X.dtypes.astype(str))).encode("utf-8"))
+            digest.update(
+                pd.util.hash_pandas_object(X, index=True).values.tobytes()
+            )
+
+            return self.remember(X, digest.hexdigest())
+
+        return PipelineCache.make_key(pickle.dumps(X))
+
+    # The class, the params and the code of the step, the profiler wrapper
+    # gives the ones of the step it measures
+
+    @staticmethod
+    def step_fingerprint(step):
+
+        step = getattr(step, "step", step)
+
+        sources = []
+
+        for cls in type(step).__mro__:
+            try:
+                sources.append(inspect.getsource(cls))
+            except (OSError, TypeError):
+                continue
+
+        return json.dumps(
+            [type(step).__name__, step.get_params(), sources],
+            default=repr, sort_keys=True
+        )
+
+    def step_key(self, input_key, step):
+
+        return PipelineCache.make_key(input_key, self.step_fingerprint(step))
+
+    def _path(self, key):
+
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def contains(self, key):
+
+        return os.path.exists(self._path(key))
+
+    def load(self, key):
+
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as file:
+                result = pickle.load(file)
+
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        # Mark it as recently used for the eviction, a run that only reads
+        # also trims the cache when we ask for a smaller size
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.remember(result, key)
+        self.evict()
+
+        return result
+
+    def save(self, key, result):
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        path = self._path(key)
+
+        # Other processes can be writing the same key, the rename is atomic
+        temp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(temp_path, "wb") as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp_path, path)
+
+        self.remember(result, key)
+        self.evict()
+
+        return path
+
+    # Delete the least recently used files until the cache fits in max_bytes
+
+    def evict(self):
+
+        entries = []
+
+        for file_name in os.listdir(self.cache_dir):
+
+            if not file_name.endswith(".pkl"):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, file_name))
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, file_name in sorted(entries):
+
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+    # Run a function that is not a step (like reading a sheet) only if we
+    # don't have its result for this key
+
+    def cached_call(self, key, function, *args):
+
+        if self.contains(key):
+
+            result = self.load(key)
+
+            if result is not None:
+                return result
+
+        result = function(*args)
+        self.save(key, result)
+
+        return result
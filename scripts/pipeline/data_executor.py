@@ -0,0 +1,407 @@
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+# Run a task and write down when it started and ended. It lives at module
+# level so the process pool can pickle it, and it uses the clock of the
+# system so the times of the workers and the main process can be compared
+
+def timed_call(function, args):
+
+    started = time.time()
+    result = function(*args)
+
+    return result, started, time.time()
+
+
+# Initializer of the workers with --quiet, the redirect of the main process
+# doesn't reach them. The file is closed when the worker ends
+
+def silence_output():
+
+    sys.stdout = open(os.devnull, "w")
+
+
+# Small DAG executor for the pipeline. Every task is a function with its
+# arguments and the names of the tasks it depends on, the results of those
+# tasks are added at the end of its arguments. The tasks that don't depend
+# on each other (like the sheets of a workbook) run at the same time in
+# worker processes, and the ones marked in_process (concat, save) run in
+# this process because they need the big results or write the outputs
+
+#
+# With keep_going a task that fails doesn't stop the graph: its error goes to
+# errors (and to on_error), the tasks that depend on it are skipped with the
+# same error and the rest go on. max_pending limits the tasks sent to the
+# workers at the same time, so a graph of years of workbooks doesn't keep
+# all the finished sheets waiting in memory. With quiet the workers don't
+# print anything either
+
+class TaskGraph:
+
+    def __init__(self, max_workers=None, keep_going=False, max_pending=None,
+                 on_error=None, quiet=False):
+
+        self.max_workers = max_workers
+        self.keep_going = keep_going
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.quiet = quiet
+        self.tasks = {}
+        self.timings = {}
+        self.errors = {}
+        self.workers = None
+
+
+    # The dependencies must be added before, that way the order of the
+    # tasks is always a valid order to run them and the graph has no cycles
+
+    def add_task(self, name, function, *args, dependencies=(),
+                 in_process=False):
+
+        if name in self.tasks:
+            raise ValueError(f"La tarea {name} ya existe")
+
+        missing = [task for task in dependencies if task not in self.tasks]
+
+        if missing:
+            raise ValueError(
+                f"La tarea {name} depende de tareas que no existen: {missing}"
+            )
+
+        self.tasks[name] = {
+            "function": function,
+            "args": args,
+            "dependencies": list(dependencies),
+            "in_process": in_process
+        }
+
+        return name
+
+
+    def get_workers(self):
+
+        worker_tasks = sum(
+            not task["in_process"] for task in self.tasks.values()
+        )
+
+        return self.max_workers or min(worker_tasks, os.cpu_count() or 1)
+
+
+    def _get_ready(self, pending, finished):
+
+        return [
+            name for name, task in pending.items()
+            if all(dependency in finished
+                   for dependency in task["dependencies"])
+        ]
+
+
+    def _get_args(self, task, results):
+
+        return task["args"] + tuple(
+            results[dependency] for dependency in task["dependencies"]
+        )
+
+
+    # Save the error of a task and skip everything that depends on it, even
+    # through other tasks. The skipped tasks won't use the results of their
+    # dependencies anymore, so those are released like after a finish
+
+    def _fail(self, name, error, pending, results, finished):
+
+        if not self.keep_going:
+            raise error
+
+        failed = [name]
+
+        while failed:
+
+            name = failed.pop()
+            self.errors[name] = error
+
+            if self.on_error is not None:
+                self.on_error(name, error)
+
+            self._release(name, results, finished)
+
+            for dependent, task in list(pending.items()):
+                if name in task["dependencies"]:
+                    del pending[dependent]
+                    failed.append(dependent)
+
+
+    # A result is only needed until all the tasks that use it finished (or
+    # were skipped), after that we let it go. The results of the last tasks
+    # (the ones nobody depends on) are the ones that run returns
+
+    def _release(self, name, results, finished):
+
+        for dependency in self.tasks[name]["dependencies"]:
+
+            if all(dependent in finished or dependent in self.errors
+                   for dependent in self.dependents[dependency]):
+                results.pop(dependency, None)
+
+
+    def _finish(self, name, result, task_start, task_end, results, finished):
+
+        results[name] = result
+        finished.add(name)
+        self.timings[name] = (task_start, task_end)
+        self._release(name, results, finished)
+
+
+    def run(self):
+
+        pending = dict(self.tasks)
+        results = {}
+        finished = set()
+        running = {}
+
+        self.timings = {}
+        self.errors = {}
+        self.workers = self.get_workers()
+
+        self.dependents = {name: [] for name in self.tasks}
+
+        for name, task in self.tasks.items():
+            for dependency in task["dependencies"]:
+                self.dependents[dependency].append(name)
+        started = time.time()
+
+        max_pending = self.max_pending or float("inf")
+
+        # With a single worker there is no point in paying the start of the
+        # processes, so everything runs here in the same order
+
+        executor = None
+
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=silence_output if self.quiet else None
+            )
+
+        try:
+            while pending or running:
+
+                ready = self._get_ready(pending, finished)
+
+                # First we send to the workers everything that is ready, so
+                # they keep working while this process runs its own tasks
+
+                for name in ready:
+
+                    task = self.tasks[name]
+
+                    if len(running) >= max_pending:
+                        break
+
+                    if executor is not None and not task["in_process"]:
+
+                        future = executor.submit(
+                            timed_call, task["function"],
+                            self._get_args(task, results)
+                        )
+
+                        running[future] = name
+                        del pending[name]
+
+                # Without workers the tasks of the pool also run here
+
+                local_tasks = [
+                    name for name in ready
+                    if name in pending and (
+                        executor is None or self.tasks[name]["in_process"]
+                    )
+                ]
+
+                if local_tasks:
+
+                    name = local_tasks[0]
+                    task = pending.pop(name)
+
+                    try:
+                        result, task_start, task_end = timed_call(
+                            task["function"], self._get_args(task, results)
+                        )
+                    except Exception as e:
+                        self._fail(name, e, pending, results, finished)
+                        continue
+
+                    self._finish(
+                        name, result, task_start, task_end, results, finished
+                    )
+
+                    # The local name would keep the result alive after it's
+                    # released, until the next task finishes
+                    del result
+
+                    continue
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+
+                    name = running.pop(future)
+
+                    try:
+                        result, task_start, task_end = future.result()
+                    except Exception as e:
+                        self._fail(name, e, pending, results, finished)
+                        continue
+
+                    self._finish(
+                        name, result, task_start, task_end, results, finished
+                    )
+
+                    del result
+
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        self.started = started
+        self.wall_seconds = time.time() - started
+
+        return {
+            name: result for name, result in results.items()
+            if not self.dependents[name]
+        }
+
+
+    # The critical path is the chain of dependent tasks that takes the most
+    # time, it's the minimum time of the run even with infinite workers
+
+    def get_critical_path(self):
+
+        longest = {}
+
+        for name, task in self.tasks.items():
+
+            if name not in self.timings:
+                continue
+
+            task_start, task_end = self.timings[name]
+
+            previous = max(
+                (dependency for dependency in task["dependencies"]
+                 if dependency in longest),
+                key=lambda dependency: longest[dependency][0],
+                default=None
+            )
+
+            seconds, path = longest[previous] if previous else (0.0, [])
+            longest[name] = (seconds + task_end - task_start, path + [name])
+
+        if not longest:
+            return [], 0.0
+
+        seconds, path = max(longest.values(), key=lambda item: item[0])
+
+        return path, seconds
+
+
+    def get_report(self):
+
+        path, seconds = self.get_critical_path()
+
+        return {
+            "workers": self.workers,
+            "errors": {
+                name: str(error) for name, error in self.errors.items()
+            },
+            "wall_seconds": round(self.wall_seconds, 6),
+            "critical_path": path,
+            "critical_path_seconds": round(seconds, 6),
+            "tasks": [
+                {
+                    "task": name,
+                    "dependencies": task["dependencies"],
+                    "in_process": task["in_process"],
+                    "start_seconds": round(
+                        self.timings[name][0] - self.started, 6
+                    ),
+                    "end_seconds": round(
+                        self.timings[name][1] - self.started, 6
+                    )
+                }
+                for name, task in self.tasks.items()
+                if name in self.timings
+            ]
+        }
+
+
+    def print_summary(self):
+
+        path, seconds = self.get_critical_path()
+
+        print(
+            f"Tareas: {len(self.timings)} con {self.workers} procesos en "
+            f"{self.wall_seconds:.2f} s, ruta crítica "
+            f"{' → '.join(path)} ({seconds:.2f} s)"
+        )
+
+
+# Progress of a long run over many files: how many are done and how many
+# failed, the files and rows per second since the start and about how much
+# time is left at that speed
+
+class ProgressReport:
+
+    def __init__(self, total):
+
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.rows = 0
+        self.started = time.time()
+
+    def get_rates(self):
+
+        seconds = max(time.time() - self.started, 1e-9)
+
+        return (
+            (self.done + self.failed) / seconds,
+            self.rows / seconds,
+            seconds
+        )
+
+    def update(self, name, rows=0, error=None):
+
+        if error is None:
+            self.done += 1
+            self.rows += rows
+            status = f"{rows} filas"
+        else:
+            self.failed += 1
+            status = f"falló ({error})"
+
+        files_per_second, rows_per_second, _ = self.get_rates()
+        left = self.total - self.done - self.failed
+
+        print(
+            f"[{self.done + self.failed}/{self.total}] {name}: {status} | "
+            f"{files_per_second:.2f} archivos/s, {rows_per_second:.0f} "
+            f"filas/s, faltan ~{left / files_per_second:.0f} s"
+        )
+
+    def get_summary(self):
+
+        files_per_second, rows_per_second, seconds = self.get_rates()
+
+        return {
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "rows": self.rows,
+            "seconds": round(seconds, 3),
+            "files_per_second": round(files_per_second, 3),
+            "rows_per_second": round(rows_per_second, 1)
+        }
@@ -1,8 +1,18 @@
 import os
+import re
+import datetime
+
+import pandas as pd
+
+# The period can be in the name of the file (dataset_2025-09.xlsx or
+# 202509.xlsx) or in the header of the sheet (30/09/2025)
+
+FILE_PERIOD_PATTERN = re.compile(r"(?<!\d)(\d{4})[-_]?(\d{2})(?!\d)")
+HEADER_DATE_PATTERN = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
 
 class DataIngester:
 
-    def ingest (self, dataset_name):
+    def get_dataset_dir(self):
 
         # Get the root path of the project
         project_root = os.path.abspath(os.path.join(
@@ -10,7 +20,11 @@ class DataIngester:
         ))
 
         # Get the directory route where is the dataset
-        dataset_dir = os.path.join(project_root, "dataset")
+        return os.path.join(project_root, "dataset")
+
+    def ingest (self, dataset_name):
+
+        dataset_dir = self.get_dataset_dir()
 
         # Create the path to the file
         data_path= os.path.join(
@@ -22,5 +36,96 @@ class DataIngester:
         if not os.path.exists(data_path):
             raise FileNotFoundError(f"No se encontro el archivo {data_path}")
 
-        return data_path 
+        return data_path
+
+
+    # Find all the monthly workbooks of a directory and return them with the
+    # period they belong to, sorted from the oldest to the newest
+
+    #
+    # With a failures dict the files whose period can't be read (or is the
+    # period of another file) go there with their error instead of stopping
+    # everything, a long backfill doesn't depend on every file being good
+
+    def ingest_directory(self, directory=None, failures=None):
+
+        directory = directory or self.get_dataset_dir()
+
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"No se encontro el directorio {directory}")
+
+        workbooks = {}
+        repeated = {}
+
+        for file_name in sorted(os.listdir(directory)):
+
+            # Skip the lock files that excel leaves while a file is open
+
+            if not file_name.endswith(".xlsx") or file_name.startswith("~$"):
+                continue
+
+            data_path = os.path.join(directory, file_name)
+
+            try:
+                period = self.get_period(data_path)
+
+            except Exception as e:
+
+                if failures is None:
+                    raise
+
+                failures[data_path] = e
+                continue
+
+            # Two files of the same period, we can't know which one is good.
+            # With failures both go there and the period is left out
+
+            if period in workbooks or period in repeated:
+
+                first_path = workbooks.pop(period, repeated.get(period))
+                error = ValueError(
+                    f"Los archivos {first_path} y {data_path} "
+                    f"son del mismo periodo {period}"
+                )
+
+                if failures is None:
+                    raise error
+
+                repeated[period] = first_path
+                failures.setdefault(first_path, error)
+                failures[data_path] = error
+                continue
+
+            workbooks[period] = data_path
+
+        return sorted(workbooks.items())
+
+
+    # Get the period (YYYY-MM) of a workbook, first from the name of the file
+    # because it's free, and if it's not there from the header of the sheet
+
+    def get_period(self, data_path, sheet_name="BALANCE", header_rows=7):
+
+        match = FILE_PERIOD_PATTERN.search(os.path.basename(data_path))
+
+        if match and 1 <= int(match.group(2)) <= 12:
+            return f"{match.group(1)}-{match.group(2)}"
+
+        header = pd.read_excel(
+            data_path,
+            sheet_name=sheet_name,
+            header=None,
+            nrows=header_rows
+        )
+
+        for value in header.to_numpy().ravel():
+
+            if isinstance(value, (datetime.date, pd.Timestamp)):
+                return value.strftime("%Y-%m")
+
+            match = HEADER_DATE_PATTERN.search(str(value))
+
+            if match:
+                return f"{match.group(3)}-{int(match.group(2)):02d}"
 
+        raise ValueError(f"No se encontro el periodo del archivo {data_path}")
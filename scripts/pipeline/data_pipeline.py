@@ -1,29 +1,63 @@
-from sklearn.pipeline import Pipeline
+from data_steps import StepPipeline
 
 from data_processing import  (
     DropBlankColumns, 
     DropRowsWithoutValues,
     TakePriorRows,
     MeltBanksIndicatorsAndValues,
-    DropCodeColumn,
     RenameColumns,
+    AssignIndicatorIds,
     ConcatDataframes,
-    FilterRealBanks  
+    ExtractIndicatorRegistry,
+    CompactDtypes,
+    FilterRealBanks,
+    ValidateAccountingIdentities
 )
 
+# Build the pipeline, when there is a profiler every step is wrapped so we
+# get its time, memory and shape in the run report. With a memory (the
+# StepMemory of data_cache) the pipeline skips the steps it already ran
+
+def build_pipeline(steps, profiler=None, pipeline_name="", memory=None):
+
+    if profiler is not None:
+        steps = profiler.wrap(steps, pipeline_name)
+
+    return StepPipeline(steps, memory=memory)
+
+
+# Every pipeline receives the copy mode and passes it to its steps, with
+# copy=False the steps change the intermediate dataframes in place
+
 class CleaningPipeline:
 
+    def __init__(self, copy=True, profiler=None, memory=None):
+
+        self.copy = copy
+        self.profiler = profiler
+        self.memory = memory
+
+    # The steps are built in their own method so we can read the parameters
+    # of every transformer without running anything, the cache uses them to
+    # know when a sheet needs to be processed again
+
+    def get_steps(self):
+
+        return [
+            ("blank_column_dropper", DropBlankColumns(copy=self.copy)),
+            ("row_dropper", DropRowsWithoutValues(copy=self.copy)),
+            ("tidy_formatter", MeltBanksIndicatorsAndValues(copy=self.copy))
+        ]
+
     def clean(self, dataframe):
         
         # Execute the process in sequence, obtain the result from one process
         # and use that result to continue with the other one
 
-        cleaning_pipe = Pipeline([
-            ("blank_column_dropper", DropBlankColumns()),
-            ("row_dropper", DropRowsWithoutValues()),
-            ("tidy_formatter", MeltBanksIndicatorsAndValues()),
-            ("real_banks_filter", FilterRealBanks())
-        ])
+        cleaning_pipe = build_pipeline(
+            self.get_steps(), self.profiler, type(self).__name__,
+            self.memory
+        )
 
         transformed_dataframe = cleaning_pipe.fit_transform(dataframe)
 
@@ -36,47 +70,119 @@ class CleaningPipeline:
 
 class BalanceCleaningPipeline(CleaningPipeline):
 
-    def clean(self, dataframe):
+    # on_violation says what to do when the accounting identities fail,
+    # "raise" stops the run before publishing, "warn" only prints them and
+    # "ignore" doesn't check anything (the streaming mode only has blocks of
+    # the balance, so it can't check the totals). With prior_rows=False the
+    # whole chart of accounts is kept instead of only the codes under 100,
+    # the streaming mode doesn't need to keep the sheet small
 
-        # Apply the base pipeline for cleaning the data
+    def __init__(self, copy=True, profiler=None, on_violation="raise",
+                 memory=None, prior_rows=True):
 
-        transformed_dataframe = super().clean(dataframe)
+        super().__init__(copy=copy, profiler=profiler, memory=memory)
 
-        # Implement the new specific pipeline for the dataframe
+        self.on_violation = on_violation
+        self.prior_rows = prior_rows
 
-        balance_pipe = Pipeline([
-            ("row_picker", TakePriorRows())
-        ])
+    def get_steps(self):
 
-        final_dataframe = balance_pipe.fit_transform(
-            transformed_dataframe
-        )
+        # Apply the base steps for cleaning the data and then add the new
+        # specific step for the dataframe
+
+        steps = super().get_steps()
+
+        if self.prior_rows:
+            steps.append(("row_picker", TakePriorRows(copy=self.copy)))
 
-        return final_dataframe 
+        if self.on_violation != "ignore":
+            steps.append((
+                "identity_validator",
+                ValidateAccountingIdentities(
+                    copy=self.copy, on_violation=self.on_violation
+                )
+            ))
+
+        return steps
 
 class MatchColumnsPipeline:
 
-    def match(self, dataframe):
+    def __init__(self, copy=True, profiler=None, memory=None):
 
-        match_pipe = Pipeline([
-            ("drop_extra_column", DropCodeColumn()),
-            ("rename_columns", RenameColumns())
-        ])
+        self.copy = copy
+        self.profiler = profiler
+        self.memory = memory
+
+    # The sheet is part of the ID of the indicators, so every sheet builds
+    # its own steps
+
+    def get_steps(self, sheet_name=None):
+
+        return [
+            ("rename_columns", RenameColumns(copy=self.copy)),
+            ("indicator_ids", AssignIndicatorIds(
+                copy=self.copy, sheet_name=sheet_name
+            ))
+        ]
+
+    def match(self, dataframe, sheet_name=None):
+
+        match_pipe = build_pipeline(
+            self.get_steps(sheet_name), self.profiler, type(self).__name__,
+            self.memory
+        )
 
         transformed_dataframe = match_pipe.fit_transform(dataframe)
 
         return transformed_dataframe
 
+# After the concat we take out the registry of the indicators and the rows
+# of the segments of the Superintendencia, and compact the types of the
+# final dataframe, the value keeps float64 unless we ask for a narrower
+# type. The registry, the banks of every segment and the official totals of
+# the segments of the last concat stay in registry, segments and
+# segment_totals. The segments are filtered here and not when we clean the
+# sheets so their totals also get the IDs of the indicators
+
 class ConcatDataframesPipeline:
 
+    def __init__(self, copy=True, profiler=None, value_dtype=None,
+                 memory=None):
+
+        self.copy = copy
+        self.profiler = profiler
+        self.value_dtype = value_dtype
+        self.memory = memory
+        self.registry = None
+        self.segments = None
+        self.segment_totals = None
+
+    def get_steps(self):
+
+        return [
+            ("concater", ConcatDataframes(copy=self.copy)),
+            ("indicator_registry", ExtractIndicatorRegistry(copy=self.copy)),
+            ("real_banks_filter", FilterRealBanks(copy=self.copy)),
+            ("dtype_compacter", CompactDtypes(
+                copy=self.copy, value_dtype=self.value_dtype
+            ))
+        ]
+
     def concat(self, dataframe):
 
-        concat_pipe= Pipeline([
-            ("concater", ConcatDataframes())
-        ])
+        steps = self.get_steps()
+
+        concat_pipe= build_pipeline(
+            steps, self.profiler, type(self).__name__,
+            self.memory
+        )
 
         transformed_dataframe = concat_pipe.fit_transform(dataframe)
 
+        self.registry = dict(steps)["indicator_registry"].registry_
+        self.segments = dict(steps)["real_banks_filter"].segments_
+        self.segment_totals = dict(steps)["real_banks_filter"].segment_totals_
+
         return transformed_dataframe
 
 
@@ -90,7 +196,7 @@ class BankFilterPipeline:
         """
         print("\n🧹 Aplicando filtro de bancos reales...")
         
-        filter_pipe = Pipeline([
+        filter_pipe = StepPipeline([
         ])
         
         filtered_dataframe = filter_pipe.fit_transform(dataframe)
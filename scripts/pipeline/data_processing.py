@@ -1,41 +1,297 @@
+import os
+import zlib
+import importlib.util
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-from sklearn.base import BaseEstimator, TransformerMixin
+
+from data_steps import StepTransformer
+
+
+# Pick the fastest engine installed to parse the workbook, calamine is a rust
+# reader that is a lot faster than openpyxl, but it's optional so we fall
+# back to openpyxl (which pandas already opens in read only mode)
+
+def get_excel_engine():
+
+    if importlib.util.find_spec("python_calamine") is not None:
+        return "calamine"
+
+    return "openpyxl"
+
+
+# This function lives at module level so the process pool can pickle it,
+# every worker parses only its own sheet from the bytes of the workbook
+
+def read_sheet(workbook_bytes, sheet, engine, skiprows):
+
+    with pd.ExcelFile(BytesIO(workbook_bytes), engine=engine) as workbook:
+        return workbook.parse(sheet_name=sheet, skiprows=skiprows)
+
 
 class CreateDataframes:
 
-    def create(self, dataset_path):
+    def __init__(self, sheet_names=None, max_workers=None, engine=None,
+                 skiprows=7):
 
         # Create the dataframes for the data we previously analysed
 
-        sheet_names = [
+        self.sheet_names = sheet_names or [
             "BALANCE", 
             "COMPOS CART",
             "INDICADORES"
         ]
 
-        dataframe_dict = {}
+        self.max_workers = max_workers
+        self.engine = engine or get_excel_engine()
+        self.skiprows = skiprows
+
+    def create(self, dataset_path, sheet_names=None):
+
+        # We can ask only for some of the sheets, for example the ones that
+        # changed since the last run
+
+        sheet_names = sheet_names or self.sheet_names
 
-        # Fill the dictionary with the dataframes
-        # And use the first strategy to clean the data, skiping the rows
-        # and using only the columns of the table
+        # Read the file from disk only once, and then every parse works
+        # over the bytes in memory instead of reopening the workbook
 
-        for sheet in sheet_names:
-            temp_dataframe = pd.read_excel(dataset_path, sheet_name= sheet,
-                                           skiprows=7)
-            dataframe_dict[sheet] = temp_dataframe
+        with open(dataset_path, "rb") as file:
+            workbook_bytes = file.read()
+
+        # Open the workbook to find the sheets before doing any heavy work,
+        # so a missing sheet fails fast with a clear message
+
+        with pd.ExcelFile(BytesIO(workbook_bytes),
+                          engine=self.engine) as workbook:
+
+            self.check_sheets(workbook, dataset_path, sheet_names)
+
+            workers = self.max_workers or min(
+                len(sheet_names), os.cpu_count() or 1
+            )
+
+            # With a single worker there is no point in paying the start of
+            # a process, so we parse the sheets with the workbook we opened
+
+            if workers <= 1 or len(sheet_names) <= 1:
+
+                # Use the first strategy to clean the data, skiping the rows
+                # and using only the columns of the table
+
+                return {
+                    sheet: workbook.parse(sheet_name=sheet,
+                                          skiprows=self.skiprows)
+                    for sheet in sheet_names
+                }
+
+        # Parse every sheet in parallel, each one in its own process, and
+        # fill the dictionary in the same order of the sheet names so the
+        # final dataframe is always the same
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+
+            futures = {
+                sheet: executor.submit(
+                    read_sheet, workbook_bytes, sheet, self.engine,
+                    self.skiprows
+                )
+                for sheet in sheet_names
+            }
+
+            dataframe_dict = {
+                sheet: future.result() for sheet, future in futures.items()
+            }
 
         # Return all the dataframes created
 
         return dataframe_dict
 
 
-# We inherit from BaseEstimator and TransformerMixin to make this class 
-# compatible with sklearn Pipelines. These base classes ensure that our custom 
-# transformer implements the required fit() and transform() methods,
-# allowing sklearn to call fit_transform() and integrate this step seamlessly 
-# into a data processing workflow.
+    @staticmethod
+    def check_sheets(workbook, dataset_path, sheet_names):
+
+        missing_sheets = [
+            sheet for sheet in sheet_names
+            if sheet not in workbook.sheet_names
+        ]
+
+        if missing_sheets:
+            raise ValueError(
+                f"No se encontraron las hojas {missing_sheets} "
+                f"en {dataset_path}"
+            )
+
+
+    # The workbook can be its path or its bytes already read, with the bytes
+    # nobody opens the file again
+
+    def _open(self, workbook):
+
+        if isinstance(workbook, bytes):
+            workbook = BytesIO(workbook)
+
+        return pd.ExcelFile(workbook, engine=self.engine)
+
+
+    # Read the file once and check its sheets, the executor of main.py gives
+    # these bytes to the branch of every sheet, so the workbook is not read
+    # from disk once per sheet
+
+    def load(self, dataset_path, sheet_names=None):
+
+        with open(dataset_path, "rb") as file:
+            workbook_bytes = file.read()
+
+        with self._open(workbook_bytes) as excel_file:
+            self.check_sheets(
+                excel_file, dataset_path, sheet_names or self.sheet_names
+            )
+
+        return workbook_bytes
+
+
+    # Check the sheets of a workbook without parsing them
+
+    def validate(self, dataset_path, sheet_names=None):
+
+        with self._open(dataset_path) as excel_file:
+            self.check_sheets(
+                excel_file, dataset_path, sheet_names or self.sheet_names
+            )
+
+
+    # Read only one sheet of the workbook (its path or its bytes)
+
+    def read(self, workbook, sheet):
+
+        with self._open(workbook) as excel_file:
+            return excel_file.parse(sheet_name=sheet, skiprows=self.skiprows)
+
+
+    # Read a sheet by blocks of rows instead of loading it all, openpyxl in
+    # read only mode goes through the xml of the sheet without keeping it in
+    # memory, so the memory only depends on the size of the block
+
+    def iter_chunks(self, dataset_path, sheet, chunk_size=5000):
+
+        # Imported here because only the streaming mode needs it
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(
+            dataset_path, read_only=True, data_only=True, keep_links=False
+        )
+
+        try:
+            rows = workbook[sheet].iter_rows(values_only=True)
+
+            # Skip the same rows as read_excel and take the next one as the
+            # header
+
+            for _ in range(self.skiprows):
+                next(rows, None)
+
+            header = trim_row(next(rows, ()))
+            block = []
+
+            for row in rows:
 
-class DropBlankColumns(BaseEstimator, TransformerMixin):
+                block.append(trim_row(row))
+
+                if len(block) >= chunk_size:
+                    yield build_block(header, block)
+                    block = []
+
+            if block:
+                yield build_block(header, block)
+
+        finally:
+            workbook.close()
+
+
+# Remove the empty cells at the end of a row, openpyxl gives rows of different
+# lengths and pandas ignores those cells too
+
+def trim_row(row):
+
+    row = list(row)
+
+    while row and row[-1] is None:
+        row.pop()
+
+    return row
+
+
+# Build a dataframe from a block of rows with the same column names that
+# read_excel gives: "Unnamed: n" for the empty headers and ".1" for the
+# repeated ones
+
+def build_block(header, rows):
+
+    width = max([len(header)] + [len(row) for row in rows])
+
+    columns = []
+    seen = {}
+
+    for position in range(width):
+
+        name = header[position] if position < len(header) else None
+
+        if name is None:
+            name = f"Unnamed: {position}"
+
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+
+        columns.append(name)
+
+    data = [row + [None] * (width - len(row)) for row in rows]
+
+    # Keep the same types as read_excel, the columns with numbers and empty
+    # cells become float columns with NaN
+
+    return pd.DataFrame(data, columns=columns).infer_objects()
+
+
+# We inherit from StepTransformer so every step has the fit(), transform()
+# and fit_transform() methods that the pipelines call, and the get_params()
+# that the cache uses, without importing sklearn.
+
+# All the steps share the copy param (like the sklearn scalers). With
+# copy=True every step works over its own copy of the dataframe, and with
+# copy=False the pipeline owns the intermediate dataframes and every step
+# changes them in place, which saves a full copy of each sheet per step
+
+class CopyAwareTransformer(StepTransformer):
+
+    def __init__(self, copy=True):
+
+        self.copy = copy
+
+    def fit(self, X, y=None):
+
+        return self
+
+    def _start(self, X):
+
+        return X.copy() if self.copy else X
+
+    # Boolean indexing marks the result as a slice and pandas warns when the
+    # next step changes it in place, take() gives a new dataframe without
+    # that mark
+
+    @staticmethod
+    def _take_rows(X: pd.DataFrame, mask):
+
+        return X.take(np.flatnonzero(np.asarray(mask)))
+
+
+class DropBlankColumns(CopyAwareTransformer):
 
     def fit(self, X: pd.DataFrame, y= None):
 
@@ -52,20 +308,20 @@ class DropBlankColumns(BaseEstimator, TransformerMixin):
         # But I know that ain't gonna happen because i saw all the excel
         # and its all the same in the tables we use
 
-        X = X.copy()
+        X = self._start(X)
 
         X.drop("BANCOS PRIVADOS VIVIENDA", axis=1, inplace=True,
                errors="ignore")
 
         X.drop("Unnamed: 0", axis=1, inplace=True)
 
-        X = X.reset_index(drop=True)
+        X.reset_index(drop=True, inplace=True)
 
         return X 
 
 
 
-class DropRowsWithoutValues(BaseEstimator, TransformerMixin):
+class DropRowsWithoutValues(CopyAwareTransformer):
 
     def fit(self, X: pd.DataFrame, y=None):
 
@@ -73,7 +329,7 @@ class DropRowsWithoutValues(BaseEstimator, TransformerMixin):
 
     def transform(self, X: pd.DataFrame):
 
-        X = X.copy()
+        X = self._start(X)
 
         # Drop the rows that have the definition and name, but it doesn't 
         # have values at all on the banks columns
@@ -85,14 +341,14 @@ class DropRowsWithoutValues(BaseEstimator, TransformerMixin):
         
         X.dropna(thresh=3, inplace=True)
 
-        X = X.reset_index(drop=True)
+        X.reset_index(drop=True, inplace=True)
 
         return X
 
 
 # Processing for Balance Dataframe
 
-class TakePriorRows(BaseEstimator, TransformerMixin):
+class TakePriorRows(CopyAwareTransformer):
 
     def fit(self, X: pd.DataFrame, y=None):
 
@@ -100,25 +356,183 @@ class TakePriorRows(BaseEstimator, TransformerMixin):
 
     def transform(self, X: pd.DataFrame):
 
-        X = X.copy()
+        X = self._start(X)
 
         # Keep only the rows where the code is less than 100, because there
         # are the most significants rows, the other ones doesn't matter
 
         X["CÓDIGO"] = pd.to_numeric(X["CÓDIGO"], errors="coerce")
 
-        X = X.loc[X["CÓDIGO"] < 100].copy()
+        if self.copy:
+            X = X.loc[X["CÓDIGO"] < 100].copy()
+        else:
+            X = self._take_rows(X, X["CÓDIGO"] < 100)
+
+        X.reset_index(drop=True, inplace=True)
+
+        return X
+
+# Error of a workbook that doesn't pass the accounting checks, it carries the
+# table of violations so whoever catches it can save it. The violations go in
+# the args too, that way the error arrives complete from a worker process
+
+class AccountingIdentityError(ValueError):
+
+    def __init__(self, message, violations=None):
+
+        super().__init__(message, violations)
+        self.violations = violations
+
+    def __str__(self):
+
+        return self.args[0]
+
+
+# Check the accounting identities of every bank on the melted balance before
+# the code column is dropped. All the banks are checked at the same time:
+# one groupby puts the banks in the rows and the codes in the columns, and
+# then every rule is a vectorized operation between columns
+#
+# - Every class total (1 ACTIVO, 2 PASIVOS, 3 PATRIMONIO, 6, 7) is the sum of
+#   its groups of 2 digits (11-19, 21-29...)
+# - TOTAL ACTIVO = TOTAL PASIVOS + TOTAL PATRIMONIO + INGRESOS - GASTOS, the
+#   monthly balance doesn't close the result of the year so it goes apart
+# - The mandatory codes must have a value for every bank
+
+class ValidateAccountingIdentities(CopyAwareTransformer):
+
+    # It has to run every time to raise or warn
+    memoize = False
+
+    def __init__(self, copy=True, tolerance=1e-6, absolute_tolerance=1.0,
+                 class_totals=(1, 2, 3, 6, 7), mandatory_codes=(1, 2, 3),
+                 group_columns=("Banks",), on_violation="raise"):
+
+        super().__init__(copy=copy)
+
+        self.tolerance = tolerance
+        self.absolute_tolerance = absolute_tolerance
+        self.class_totals = class_totals
+        self.mandatory_codes = mandatory_codes
+        self.group_columns = group_columns
+        self.on_violation = on_violation
+
+    def fit(self, X: pd.DataFrame, y=None):
+
+        return self
+
+    def get_rules(self, accounts: pd.DataFrame):
+
+        rules = {}
+
+        for code in self.class_totals:
+
+            lines = [
+                column for column in accounts.columns
+                if 10 * code <= column < 10 * code + 10
+            ]
+
+            if code in accounts.columns and lines:
+                rules[f"Código {code} = suma de los códigos {code}1-{code}9"] = (
+                    accounts[code],
+                    accounts[lines].sum(axis=1, min_count=1)
+                )
+
+        if {1, 2, 3} <= set(accounts.columns):
+
+            zero = pd.Series(0.0, index=accounts.index)
+
+            rules["ACTIVO = PASIVOS + PATRIMONIO + INGRESOS - GASTOS"] = (
+                accounts[1],
+                accounts[2] + accounts[3]
+                + accounts.get(5, zero).fillna(0)
+                - accounts.get(4, zero).fillna(0)
+            )
+
+        return rules
+
+    def get_violations(self, X: pd.DataFrame):
+
+        group_columns = list(self.group_columns)
+
+        # Banks in the rows and codes in the columns, in one pass
+
+        accounts = (
+            X.dropna(subset=["CÓDIGO"])
+            .groupby(group_columns + ["CÓDIGO"], observed=True)
+            ["Valor Indicador"].sum(min_count=1)
+            .unstack("CÓDIGO")
+        )
+
+        accounts = accounts.reindex(
+            columns=accounts.columns.union(pd.Index(self.mandatory_codes,
+                                                    dtype=float))
+        )
+
+        violations = []
+
+        for rule, (value, expected) in self.get_rules(accounts).items():
+
+            difference = value - expected
+            limit = np.maximum(self.absolute_tolerance,
+                               self.tolerance * expected.abs())
+            failed = difference.abs() > limit
+
+            violations.append(pd.DataFrame({
+                "Regla": rule,
+                "Valor": value[failed],
+                "Esperado": expected[failed],
+                "Diferencia": difference[failed]
+            }))
+
+        missing = accounts[list(self.mandatory_codes)].isna()
+        missing = missing.stack()
+        missing = missing[missing]
+
+        violations.append(pd.DataFrame({
+            "Regla": [f"Falta el código obligatorio {code:g}"
+                      for code in missing.index.get_level_values(-1)],
+            "Valor": np.nan,
+            "Esperado": np.nan,
+            "Diferencia": np.nan
+        }, index=missing.index.droplevel(-1)))
+
+        return pd.concat(violations).reset_index().sort_values(
+            group_columns, kind="stable", ignore_index=True
+        )
+
+    def transform(self, X: pd.DataFrame):
+
+        # Only reads the data, so it goes out as it came in
+
+        self.violations_ = self.get_violations(X)
+
+        if self.violations_.empty:
+            return X
+
+        banks = self.violations_[list(self.group_columns)].drop_duplicates()
+
+        message = (
+            f"{len(self.violations_)} violaciones de las identidades "
+            f"contables en {len(banks)} bancos"
+        )
 
-        X = X.reset_index(drop=True)
+        if self.on_violation == "raise":
+            raise AccountingIdentityError(message, self.violations_)
+
+        if self.on_violation == "warn":
+            print(f"Advertencia: {message}")
+            print(self.violations_.head(10))
 
         return X
 
+
 # We change the format of the dataframes, because it's wide and complex to
 # analyse so we're changing that by using melt function to it and returning
 # the melted dataframe, so now we have 3 columns with every record of every
 # bank
 
-class MeltBanksIndicatorsAndValues(BaseEstimator, TransformerMixin):
+class MeltBanksIndicatorsAndValues(CopyAwareTransformer):
 
     def fit(self, X:pd.DataFrame, y=None):
 
@@ -130,7 +544,7 @@ class MeltBanksIndicatorsAndValues(BaseEstimator, TransformerMixin):
 
     def transform(self, X: pd.DataFrame):
         
-        X = X.copy()
+        X = self._start(X)
 
         if "CUENTA" in X.columns:
 
@@ -151,13 +565,48 @@ class MeltBanksIndicatorsAndValues(BaseEstimator, TransformerMixin):
             id_vars= id_cols,
             var_name= "Banks",
             value_name="Valor Indicador"
-        ).copy()
+        )
+
+        # melt already builds a new dataframe, the extra copy is only kept
+        # for the copy mode
+
+        return X_melted.copy() if self.copy else X_melted
+
+# The same name can be two different indicators (OPERACIONES INTERBANCARIAS
+# is in the assets and in the liabilities), so every indicator gets an
+# integer ID from its sheet, its code and its name. It's a crc32 of the
+# three, so it's the same in every run and every worker process without
+# sharing any state, and it fits in an int32
+
+def normalize_code(code):
+
+    if pd.isna(code):
+        return ""
+
+    # The balance codes are floats after to_numeric, 11.0 is the code 11
+    if isinstance(code, (float, np.floating)) and float(code).is_integer():
+        return str(int(code))
+
+    return str(code).strip()
+
+
+def get_indicator_id(sheet, code, name):
+
+    key = f"{sheet}|{normalize_code(code)}|{str(name).strip()}"
+
+    return zlib.crc32(key.encode("utf-8")) & 0x7FFFFFFF
+
+
+# After we filter and clean the data we put the ID of the indicator in the
+# first column. The sheet and the code stay in the rows until the concat,
+# there ExtractIndicatorRegistry moves them to the registry of names and IDs
 
-        return X_melted
+class AssignIndicatorIds(CopyAwareTransformer):
 
-# After we filter and clean the data, we drop the unused column of CÓDIGO
+    def __init__(self, copy=True, sheet_name=None):
 
-class DropCodeColumn(BaseEstimator, TransformerMixin):
+        self.copy = copy
+        self.sheet_name = sheet_name
 
     def fit(self, X: pd.DataFrame, y=None):
 
@@ -165,20 +614,101 @@ class DropCodeColumn(BaseEstimator, TransformerMixin):
 
     def transform(self, X: pd.DataFrame):
 
-        X = X.copy()
+        X = self._start(X)
 
-        X.drop("CÓDIGO", axis=1, inplace=True,
-               errors="ignore")
+        # The sheet of indicators doesn't have codes
+        if "CÓDIGO" not in X.columns:
+            X["CÓDIGO"] = np.nan
 
-        X = X.reset_index(drop=True)
+        # Every row has a pair of code and name, we compute the ID once per
+        # pair and then give it to the rows with an integer index
 
-        return X 
+        code_index, code_values = pd.factorize(
+            X["CÓDIGO"], use_na_sentinel=False
+        )
+        name_index, name_values = pd.factorize(
+            X["NOMBRE DEL INDICADOR"], use_na_sentinel=False
+        )
+
+        pair_index, pairs = pd.factorize(
+            code_index.astype(np.int64) * len(name_values) + name_index
+        )
+
+        pair_codes = [
+            normalize_code(code_values[pair // len(name_values)])
+            for pair in pairs
+        ]
+        pair_ids = np.array([
+            get_indicator_id(
+                self.sheet_name, code, name_values[pair % len(name_values)]
+            )
+            for code, pair in zip(pair_codes, pairs)
+        ], dtype=np.int32)
+
+        X["CÓDIGO"] = np.array(pair_codes, dtype=object)[pair_index]
+        X["HOJA"] = self.sheet_name
+        X.insert(0, "ID INDICADOR", pair_ids[pair_index])
+
+        X.reset_index(drop=True, inplace=True)
+
+        return X
+
+
+# After the concat, keep the ID, sheet, code and name of every indicator in
+# registry_ and drop the sheet and code columns, the rows only need the ID.
+# It adds up the registry of every dataframe it transforms since the last
+# fit, so the streaming mode can pass the blocks one by one
+
+class ExtractIndicatorRegistry(CopyAwareTransformer):
+
+    memoize = False
+
+    registry_columns = [
+        "ID INDICADOR", "HOJA", "CÓDIGO", "NOMBRE DEL INDICADOR"
+    ]
+
+    def fit(self, X: pd.DataFrame, y=None):
+
+        self.registry_ = None
+
+        return self
+
+    def transform(self, X: pd.DataFrame):
+
+        X = self._start(X)
+
+        if not all(column in X.columns for column in self.registry_columns):
+            return X
+
+        registry = X[self.registry_columns].drop_duplicates()
+
+        if getattr(self, "registry_", None) is not None:
+            registry = pd.concat([self.registry_, registry]).drop_duplicates()
+
+        # Two different indicators with the same ID would be averaged like
+        # the names before, so we stop here (it's very unlikely with crc32)
+
+        collisions = registry[
+            registry["ID INDICADOR"].duplicated(keep=False)
+        ]
+
+        if not collisions.empty:
+            raise ValueError(
+                "Indicadores distintos con el mismo ID: "
+                f"{collisions.to_dict('records')}"
+            )
+
+        self.registry_ = registry.reset_index(drop=True)
+
+        X.drop(columns=["HOJA", "CÓDIGO"], inplace=True)
+
+        return X
 
 
 # After we match the number of columns on each dataframe, we continue with
 # changing the name to match everything for the concat of the dataframes
 
-class RenameColumns(BaseEstimator, TransformerMixin):
+class RenameColumns(CopyAwareTransformer):
 
     def fit(self, X: pd.DataFrame, y=None):
 
@@ -186,7 +716,7 @@ class RenameColumns(BaseEstimator, TransformerMixin):
 
     def transform(self, X: pd.DataFrame):
 
-        X = X.copy()
+        X = self._start(X)
 
         X.rename(columns={"CUENTA": "NOMBRE DEL INDICADOR"}, inplace=True)
 
@@ -195,7 +725,7 @@ class RenameColumns(BaseEstimator, TransformerMixin):
 # Finally after cleaning and matching all the main data, we concat all the
 # dataframes into big tidy one
 
-class ConcatDataframes(BaseEstimator, TransformerMixin):
+class ConcatDataframes(CopyAwareTransformer):
 
     def fit(self, X: pd.DataFrame, y=None):
 
@@ -203,38 +733,148 @@ class ConcatDataframes(BaseEstimator, TransformerMixin):
 
     def transform(self, X:(pd.DataFrame)):
 
-        X = X.copy()
+        # X is the list of dataframes, concat always builds a new dataframe
+        # so the list is only copied in the copy mode
+
+        X = self._start(X)
 
         X_final_dataframe = pd.concat(X)
 
         return X_final_dataframe
 
 
+# The names of the banks and the indicators are repeated on every row, so we
+# store them as categories (an integer code for each row and the text only
+# once) and the filters compare integers instead of strings. The value can
+# also go to a narrower type like float32 if we don't need all the precision
+
+class CompactDtypes(CopyAwareTransformer):
+
+    def __init__(self, copy=True, value_dtype=None,
+                 category_columns=("Banks", "NOMBRE DEL INDICADOR"),
+                 value_column="Valor Indicador"):
+
+        self.copy = copy
+        self.value_dtype = value_dtype
+        self.category_columns = category_columns
+        self.value_column = value_column
+
+    def fit(self, X: pd.DataFrame, y=None):
+
+        return self
+
+    def transform(self, X: pd.DataFrame):
+
+        X = self._start(X)
+
+        for column in self.category_columns:
+            if column in X.columns:
+                X[column] = X[column].astype("category")
+
+        if self.value_dtype is not None and self.value_column in X.columns:
+            X[self.value_column] = X[self.value_column].astype(
+                self.value_dtype
+            )
+
+        return X
+
+
 # FILTRO DE CATEGORÍAS BANCARIAS
-class FilterRealBanks(BaseEstimator, TransformerMixin):
+class FilterRealBanks(CopyAwareTransformer):
     """
     Filtrar solo bancos reales, eliminar categorías de clasificación.
     Estas categorías son agrupaciones de la Superintendencia de Bancos,
     NO son instituciones bancarias individuales.
+
+    Las filas de las categorías no se pierden: segment_totals_ guarda los
+    totales oficiales de cada segmento y segments_ a qué segmento pertenece
+    cada banco. Como ExtractIndicatorRegistry, suma lo de cada bloque que
+    transforma desde el último fit.
+
+    Con keep_totals=False segment_totals_ tiene solo los totales del último
+    bloque, el que procesa por bloques los escribe a medida que llegan.
     """
 
+    memoize = False
+
+    # Categorías a excluir (NO son bancos individuales)
+    categories_to_exclude = {
+        'BANCA MÚLTIPLE',
+        'BANCOS PRIVADOS COMERCIALES', 
+        'BANCOS PRIVADOS CONSUMO',
+        'BANCOS PRIVADOS GRANDES',
+        'BANCOS PRIVADOS MEDIANOS', 
+        'BANCOS PRIVADOS MICROCRÉDITO',
+        'BANCOS PRIVADOS PEQUEÑOS',
+        'TOTAL BANCOS PRIVADOS'
+    }
+
+    # En el libro cada subtotal por tamaño va justo después de sus bancos y
+    # el total del sistema tiene a todos. De los segmentos por tipo de
+    # negocio (comerciales, consumo...) solo viene el total, sin sus bancos
+    size_segments = [
+        'BANCOS PRIVADOS GRANDES',
+        'BANCOS PRIVADOS MEDIANOS',
+        'BANCOS PRIVADOS PEQUEÑOS'
+    ]
+    system_total = 'TOTAL BANCOS PRIVADOS'
+
+    def __init__(self, copy=True, keep_totals=True):
+
+        super().__init__(copy=copy)
+        self.keep_totals = keep_totals
+
     def fit(self, X: pd.DataFrame, y=None):
+
+        self.segments_ = None
+        self.segment_totals_ = None
+
         return self
 
+    def get_membership(self, banks):
+
+        rows = []
+        group = []
+
+        for bank in banks:
+
+            if bank in self.size_segments:
+                rows += [(member, bank) for member in group]
+                group = []
+
+            elif bank not in self.categories_to_exclude:
+                group.append(bank)
+
+        rows += [
+            (bank, self.system_total) for bank in banks
+            if bank not in self.categories_to_exclude
+        ]
+
+        return pd.DataFrame(rows, columns=["Banks", "Segmento"])
+
+    def _keep_segments(self, X: pd.DataFrame, mask):
+
+        # Los bancos en el orden de las columnas, melt los deja así
+        membership = self.get_membership(pd.unique(X["Banks"]))
+
+        totals = X[~np.asarray(mask)].rename(columns={"Banks": "Segmento"})
+        totals = totals.astype({"Segmento": "object"})
+
+        if getattr(self, "segments_", None) is not None:
+            membership = pd.concat([self.segments_, membership])
+
+            if self.keep_totals:
+                totals = pd.concat([self.segment_totals_, totals])
+
+        self.segments_ = membership.drop_duplicates().reset_index(drop=True)
+        self.segment_totals_ = totals.reset_index(drop=True)
+
     def transform(self, X: pd.DataFrame):
-        X = X.copy()
-
-        # Categorías a excluir (NO son bancos individuales)
-        categories_to_exclude = {
-            'BANCA MÚLTIPLE',
-            'BANCOS PRIVADOS COMERCIALES', 
-            'BANCOS PRIVADOS CONSUMO',
-            'BANCOS PRIVADOS GRANDES',
-            'BANCOS PRIVADOS MEDIANOS', 
-            'BANCOS PRIVADOS MICROCRÉDITO',
-            'BANCOS PRIVADOS PEQUEÑOS',
-            'TOTAL BANCOS PRIVADOS'
-        }
+        X = self._start(X)
+
+        # Sin acumular, un bloque sin bancos no tiene totales
+        if not self.keep_totals:
+            self.segment_totals_ = None
 
         # Verificar si existe la columna 'Banks'
         if 'Banks' in X.columns:
@@ -242,7 +882,14 @@ class FilterRealBanks(BaseEstimator, TransformerMixin):
             initial_banks = X['Banks'].nunique()
             
             # Filtrar las categorías
-            X_filtered = X[~X['Banks'].isin(categories_to_exclude)].copy() #type:ignore
+            mask = ~X['Banks'].isin(self.categories_to_exclude)
+
+            self._keep_segments(X, mask)
+
+            if self.copy:
+                X_filtered = X[mask].copy() #type:ignore
+            else:
+                X_filtered = self._take_rows(X, mask)
             
             final_count = len(X_filtered)
             final_banks = X_filtered['Banks'].nunique()#type:ignore
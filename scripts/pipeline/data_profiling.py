@@ -0,0 +1,234 @@
+import contextlib
+import datetime
+import json
+import os
+import re
+import time
+import tracemalloc
+
+import pandas as pd
+
+from data_steps import StepTransformer
+
+
+# Get the rows and columns of what goes in or out of a step, the concat step
+# receives a list of dataframes so we add up their rows
+
+def get_shape(X):
+
+    if isinstance(X, pd.DataFrame):
+        return {"rows": len(X), "columns": X.shape[1], "frames": 1}
+
+    if isinstance(X, (list, tuple, dict)):
+
+        frames = list(X.values()) if isinstance(X, dict) else list(X)
+        frames = [frame for frame in frames if isinstance(frame, pd.DataFrame)]
+
+        return {
+            "rows": sum(len(frame) for frame in frames),
+            "columns": max((frame.shape[1] for frame in frames), default=0),
+            "frames": len(frames)
+        }
+
+    return {"rows": None, "columns": None, "frames": 0}
+
+
+# On linux we can reset the peak resident memory of the process and read it
+# again after the step, that costs nothing. In other systems we use
+# tracemalloc, which is slower because it follows every allocation
+
+def reset_peak_rss():
+
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+
+    except OSError:
+        return False
+
+
+def read_rss_kb():
+
+    with open("/proc/self/status") as file:
+        status = dict(re.findall(r"(VmRSS|VmHWM):\s+(\d+)", file.read()))
+
+    return int(status["VmRSS"]), int(status["VmHWM"])
+
+
+class PipelineProfiler:
+
+    def __init__(self, track_memory=True):
+
+        self.track_memory = track_memory
+        self.memory_source = None
+
+        if track_memory:
+            self.memory_source = "rss" if reset_peak_rss() else "tracemalloc"
+
+        self.records = []
+        self.graphs = {}
+        self.section = None
+        self.started_at = datetime.datetime.now()
+        self._start = time.perf_counter()
+
+
+    # Group the steps of a sheet (or any other part of the run) under a name
+
+    @contextlib.contextmanager
+    def in_section(self, section):
+
+        previous = self.section
+        self.section = section
+
+        try:
+            yield self
+        finally:
+            self.section = previous
+
+
+    # Run a function and write down its wall time, cpu time, memory and the
+    # shape of what went in and out
+
+    def run(self, step_name, function, X=None):
+
+        if self.memory_source == "rss":
+            reset_peak_rss()
+            memory_before = read_rss_kb()[0] * 1024
+
+        elif self.memory_source == "tracemalloc":
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        result = function(X) if X is not None else function()
+
+        record = {
+            "section": self.section,
+            "step": step_name,
+            "wall_seconds": round(time.perf_counter() - wall_start, 6),
+            "cpu_seconds": round(time.process_time() - cpu_start, 6),
+            "peak_memory_delta_mb": None,
+            "input": get_shape(X),
+            "output": get_shape(result)
+        }
+
+        if self.memory_source == "rss":
+            peak = read_rss_kb()[1] * 1024
+
+        elif self.memory_source == "tracemalloc":
+            peak = tracemalloc.get_traced_memory()[1]
+
+        if self.memory_source is not None:
+            record["peak_memory_delta_mb"] = round(
+                (peak - memory_before) / 1024 ** 2, 3
+            )
+
+        self.records.append(record)
+
+        return result
+
+
+    # Wrap the steps of a pipeline so every one of them is measured
+
+    def wrap(self, steps, pipeline_name):
+
+        return [
+            (name, ProfiledStep(step, self, f"{pipeline_name}.{name}"))
+            for name, step in steps
+        ]
+
+
+    # Keep the records that a profiler of a worker process measured, and the
+    # timeline and critical path of the task graphs of the run
+
+    def merge(self, records):
+
+        self.records.extend(records)
+
+
+    def add_graph(self, name, graph_report):
+
+        self.graphs[name] = graph_report
+
+
+    def get_report(self):
+
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total_wall_seconds": round(time.perf_counter() - self._start, 6),
+            "memory_source": self.memory_source,
+            "steps": self.records,
+            "graphs": self.graphs
+        }
+
+
+    # Save the report of the run as json, by default in output/reports with
+    # the date of the run in the name so we can compare the runs over time
+
+    def save_report(self, report_path=None):
+
+        if report_path is None:
+
+            project_root = os.path.abspath(os.path.join(
+                os.path.dirname(__file__), "../.."
+            ))
+
+            report_path = os.path.join(
+                project_root,
+                "output",
+                "reports",
+                f"pipeline_run_{self.started_at:%Y%m%d_%H%M%S}.json"
+            )
+
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)),
+                    exist_ok=True)
+
+        with open(report_path, "w", encoding="utf-8") as file:
+            json.dump(self.get_report(), file, indent=2, ensure_ascii=False)
+
+        if self.memory_source == "tracemalloc" and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        return report_path
+
+
+# Transformer that runs another one through the profiler, the pipeline calls
+# fit_transform on every step so that's the method we measure
+
+class ProfiledStep(StepTransformer):
+
+    def __init__(self, step, profiler, name):
+
+        self.step = step
+        self.profiler = profiler
+        self.name = name
+
+    @property
+    def memoize(self):
+
+        return self.step.memoize
+
+    def fit(self, X, y=None):
+
+        self.step.fit(X, y)
+
+        return self
+
+    def transform(self, X):
+
+        return self.profiler.run(self.name, self.step.transform, X)
+
+    def fit_transform(self, X, y=None, **fit_params):
+
+        return self.profiler.run(
+            self.name,
+            lambda data: self.step.fit_transform(data, y, **fit_params),
+            X
+        )
@@ -1,9 +1,50 @@
-import pandas as pd
+import contextlib
+import datetime
+import json
 import os
+import sqlite3
+import threading
+
+# fcntl only exists on unix, without it the publications are not locked
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+import pandas as pd
 
 class SaveCleanData():
 
-    def save(self, dataframe: pd.DataFrame, dataframe_name):
+    # Formats we publish for every cleaned dataframe, the csv is the one that
+    # everybody can read, the parquet is the fast typed one, the sqlite
+    # database has indexes so the api can ask for a bank or a ranking
+    # without loading everything, the matrix is the bank x indicator table
+    # that the analytics pivot, with its index of names in the json, the
+    # registry has the sheet, code and name of every ID of indicator, and
+    # the segments are the banks of every segment of the Superintendencia
+    # with the official totals of the segments
+
+    output_formats = [
+        "csv", "parquet", "sqlite", "matrix.npy", "matrix.json",
+        "indicators.csv", "segments.csv", "segment_totals.csv"
+    ]
+
+    # How many deltas between versions we keep in the history
+    max_deltas = 100
+
+    # By default everything goes to output/cleaned_data, the benchmarks use
+    # another directory so they don't replace the published data
+
+    def __init__(self, output_dir=None):
+
+        self.output_dir = output_dir
+
+        # The (thread, dataset) whose lock we already hold, so publish()
+        # inside save() doesn't lock again
+        self._locked = set()
+
+    def get_path(self, dataframe_name, extension="csv"):
 
         # Get the root path of the project
 
@@ -14,15 +55,62 @@ class SaveCleanData():
         # Define the new directory name where it will be set all the new
         # cleaned data
 
-        output_dir = os.path.join(project_root, "output", "cleaned_data")
+        output_dir = self.output_dir or os.path.join(
+            project_root, "output", "cleaned_data"
+        )
 
         # Here it'll create the new files based on the dataframe name
 
         processed_data_path = os.path.join(
             output_dir,
-            f"{dataframe_name}.csv"
+            f"{dataframe_name}.{extension}"
         )
 
+        return processed_data_path
+
+    # Lock of the publication of a dataset, a file next to it. The one who
+    # writes holds it from the temp files until version.json, so two runs
+    # don't mix their temp files or publish the same version, and the
+    # readers (the api) take it shared while they read all the files, so
+    # they never get the data of one version and the matrix of another
+
+    @contextlib.contextmanager
+    def lock(self, dataframe_name):
+
+        key = (threading.get_ident(), dataframe_name)
+
+        if fcntl is None or key in self._locked:
+            yield
+            return
+
+        lock_path = self.get_path(dataframe_name, "lock")
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+        with open(lock_path, "a") as lock_file:
+
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._locked.add(key)
+
+            try:
+                yield
+            finally:
+                self._locked.discard(key)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, dataframe: pd.DataFrame, dataframe_name, registry=None,
+             segments=None, segment_totals=None):
+
+        with self.lock(dataframe_name):
+            return self._save(
+                dataframe, dataframe_name, registry, segments, segment_totals
+            )
+
+    def _save(self, dataframe: pd.DataFrame, dataframe_name, registry=None,
+              segments=None, segment_totals=None):
+
+        processed_data_path = self.get_path(dataframe_name)
+        output_dir = os.path.dirname(processed_data_path)
+
         try:
             print("Guardando el archivo final limpio")
 
@@ -31,8 +119,26 @@ class SaveCleanData():
                 output_dir, exist_ok=True
             )
 
-            # Transform the clean dataframes to csv files
-            dataframe.to_csv(processed_data_path, index=False)
+            # Transform the clean dataframes to csv files, first in a temp
+            # file so the readers never find a file written by half
+            dataframe.to_csv(f"{processed_data_path}.tmp", index=False)
+
+            # Also save the columnar version for the loaders and the indexed
+            # database for the api
+            self.save_parquet(dataframe, dataframe_name)
+            self.save_sqlite(dataframe, dataframe_name)
+
+            matrix_builder = IndicatorMatrixBuilder()
+            matrix_builder.append(dataframe)
+            self.save_matrix(matrix_builder, dataframe_name)
+
+            if registry is not None:
+                self.save_registry(registry, dataframe_name)
+
+            if segments is not None:
+                self.save_segments(segments, segment_totals, dataframe_name)
+
+            self.publish(dataframe_name)
 
             return processed_data_path
 
@@ -40,5 +146,882 @@ class SaveCleanData():
 
             print(f"Error al guardar los datos {e}")
 
+            self.discard(dataframe_name)
+
+            return False
+
+
+
+    # Save the dataframe as parquet, the repeated names of the banks and
+    # indicators are dictionary encoded, and the values keep their type so
+    # the loaders don't have to parse text again
+
+    def save_parquet(self, dataframe: pd.DataFrame, dataframe_name):
+
+        parquet_path = self.get_path(dataframe_name, "parquet")
+
+        try:
+            dataframe.to_parquet(
+                f"{parquet_path}.tmp",
+                index=False,
+                compression="snappy",
+                use_dictionary=True
+            )
+
+            return f"{parquet_path}.tmp"
+
+        except ImportError:
+
+            # pyarrow is optional, without it we only publish the csv and
+            # publish() deletes the old parquet so nobody reads outdated data
+
+            print("pyarrow no está instalado, solo se guarda el csv")
+
+            return None
+
+
+    # Load the dataframe in a sqlite database with its indexes, sqlite comes
+    # with python so this one is always published
+
+    def save_sqlite(self, dataframe: pd.DataFrame, dataframe_name):
+
+        sqlite_path = f"{self.get_path(dataframe_name, 'sqlite')}.tmp"
+
+        # A temp file of a failed run would get the rows twice
+        if os.path.exists(sqlite_path):
+            os.remove(sqlite_path)
+
+        sink = SQLiteSink(sqlite_path)
+
+        try:
+            sink.append(dataframe)
+        except Exception:
+            sink.close(commit=False)
+            raise
+
+        sink.close()
+
+        return sqlite_path
+
+
+    # Save the bank x indicator matrix as a .npy file, it can be opened with
+    # np.load(mmap_mode="r") so every worker of the api reads the same pages
+    # of the file instead of making its own pivot. The names of the rows and
+    # the columns go in a json next to it
+
+    def save_matrix(self, matrix_builder, dataframe_name):
+
+        matrix = matrix_builder.build()
+
+        matrix_path = self.get_path(dataframe_name, "matrix.npy")
+        index_path = self.get_path(dataframe_name, "matrix.json")
+
+        # With a file object numpy doesn't add the .npy to the temp name
+        with open(f"{matrix_path}.tmp", "wb") as file:
+            np.save(file, np.ascontiguousarray(matrix.to_numpy(np.float64)))
+
+        # The names of the columns, and their IDs when the matrix has them so
+        # the readers label them with the registry
+        index = {
+            "shape": list(matrix.shape),
+            "banks": [str(bank) for bank in matrix.index],
+            "indicators": matrix_builder.get_names(matrix)
+        }
+
+        if matrix_builder.indicator_column != matrix_builder.name_column:
+            index["indicator_ids"] = [
+                int(indicator_id) for indicator_id in matrix.columns
+            ]
+
+        with open(f"{index_path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(index, file, ensure_ascii=False)
+
+        return matrix_path
+
+
+    # Save the registry of the indicators, one row per ID with its sheet,
+    # code and name, so the readers can go from a name to its IDs
+
+    def save_registry(self, registry: pd.DataFrame, dataframe_name):
+
+        registry_path = self.get_path(dataframe_name, "indicators.csv")
+
+        registry.sort_values("ID INDICADOR").to_csv(
+            f"{registry_path}.tmp", index=False
+        )
+
+        return registry_path
+
+
+    # Save the banks of every segment and the totals that the Superintendencia
+    # publishes for the segments, in the same long format as the banks
+
+    def save_segments(self, segments: pd.DataFrame,
+                      segment_totals: pd.DataFrame, dataframe_name):
+
+        segments_path = self.get_path(dataframe_name, "segments.csv")
+        totals_path = self.get_path(dataframe_name, "segment_totals.csv")
+
+        segments.to_csv(f"{segments_path}.tmp", index=False)
+
+        if segment_totals is not None:
+            segment_totals.to_csv(f"{totals_path}.tmp", index=False)
+
+        return segments_path, totals_path
+
+
+    # Move the temp files over the published ones, os.replace is atomic so a
+    # reader gets the old file or the new one, never half of it. The csv goes
+    # first, so while the parquet is still the old one it's older than the
+    # csv and the loaders take the csv. Everything happens under the lock,
+    # and version.json is written the last one, after the delta
+
+    def publish(self, dataframe_name):
+
+        with self.lock(dataframe_name):
+            return self._publish(dataframe_name)
+
+    def _publish(self, dataframe_name):
+
+        # The delta is computed before the old files are replaced
+        delta = self.build_delta(dataframe_name)
+
+        published = []
+
+        for extension in self.output_formats:
+
+            path = self.get_path(dataframe_name, extension)
+
+            if os.path.exists(f"{path}.tmp"):
+                os.replace(f"{path}.tmp", path)
+                published.append(path)
+
+            elif os.path.exists(path):
+                os.remove(path)
+
+        if delta is not None:
+            self.save_delta(
+                delta, dataframe_name,
+                self.get_version(dataframe_name).get("version", 0) + 1
+            )
+
+        self.bump_version(dataframe_name, published, delta)
+
+        return published
+
+
+    # Read one of the published files (or its temp file) with the type of
+    # its extension
+
+    @staticmethod
+    def read_output(path):
+
+        if path.endswith(".parquet") or path.endswith(".parquet.tmp"):
+            return pd.read_parquet(path)
+
+        return pd.read_csv(path)
+
+
+    # The files to compare, the parquet of the old and the new version if
+    # both have it, if not the csv
+
+    def _get_delta_sources(self, dataframe_name):
+
+        for extension in ["parquet", "csv"]:
+
+            path = self.get_path(dataframe_name, extension)
+
+            if os.path.exists(path) and os.path.exists(f"{path}.tmp"):
+                return path, f"{path}.tmp"
+
+        return None
+
+
+    # Compare the new version with the one that is published. For every
+    # bank and indicator we say if it was added, removed or if its value
+    # changed, so the readers only need to update what is in the delta
+
+    def build_delta(self, dataframe_name):
+
+        sources = self._get_delta_sources(dataframe_name)
+
+        if sources is None:
+            return None
+
+        try:
+            previous, current = [self.read_output(path) for path in sources]
+
+            return compare_versions(previous, current)
+
+        except Exception as e:
+
+            # Without the delta the readers reload everything like before,
+            # that's not a reason to stop the publication
+
+            print(f"No se pudo calcular el delta: {e}")
+
+            return None
+
+
+    def get_delta_dir(self, dataframe_name):
+
+        return os.path.join(
+            os.path.dirname(self.get_path(dataframe_name)), "deltas"
+        )
+
+
+    # Every version keeps its delta in deltas/<name>.v<version>.csv, that's
+    # the history of what changed. We only keep the last max_deltas
+
+    def save_delta(self, delta: pd.DataFrame, dataframe_name, version):
+
+        delta_dir = self.get_delta_dir(dataframe_name)
+        os.makedirs(delta_dir, exist_ok=True)
+
+        delta_path = os.path.join(
+            delta_dir, f"{dataframe_name}.v{version}.csv"
+        )
+
+        delta.to_csv(f"{delta_path}.tmp", index=False)
+        os.replace(f"{delta_path}.tmp", delta_path)
+
+        for old_version in self.list_delta_versions(dataframe_name)[
+            :-self.max_deltas
+        ]:
+            os.remove(os.path.join(
+                delta_dir, f"{dataframe_name}.v{old_version}.csv"
+            ))
+
+        return delta_path
+
+
+    def list_delta_versions(self, dataframe_name):
+
+        delta_dir = self.get_delta_dir(dataframe_name)
+
+        if not os.path.isdir(delta_dir):
+            return []
+
+        prefix = f"{dataframe_name}.v"
+
+        return sorted(
+            int(file_name[len(prefix):-len(".csv")])
+            for file_name in os.listdir(delta_dir)
+            if file_name.startswith(prefix) and file_name.endswith(".csv")
+            and file_name[len(prefix):-len(".csv")].isdigit()
+        )
+
+
+    # Delete the temp files of a save that failed, the published files stay
+    # as they were
+
+    def discard(self, dataframe_name):
+
+        for extension in self.output_formats:
+
+            temp_path = f"{self.get_path(dataframe_name, extension)}.tmp"
+
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+    def get_version_path(self, dataframe_name):
+
+        return self.get_path(dataframe_name, "version.json")
+
+
+    def get_version(self, dataframe_name):
+
+        try:
+            with open(self.get_version_path(dataframe_name),
+                      encoding="utf-8") as file:
+                return json.load(file)
+
+        except (OSError, ValueError):
+            return {"version": 0}
+
+
+    # Every publication increases the version, the api and the dashboard
+    # can check this small file to know when there is new data
+
+    def bump_version(self, dataframe_name, published, delta=None):
+
+        previous_version = self.get_version(dataframe_name).get("version", 0)
+
+        version = {
+            "version": previous_version + 1,
+            "published_at": datetime.datetime.now().isoformat(
+                timespec="seconds"
+            ),
+            "files": [os.path.basename(path) for path in published]
+        }
+
+        # A summary of the delta, the banks are the ones that the caches
+        # need to compute again
+
+        if delta is not None:
+
+            counts = delta["Cambio"].value_counts()
+
+            version["delta"] = {
+                "from_version": previous_version,
+                "file": f"deltas/{dataframe_name}.v{version['version']}.csv",
+                **{
+                    change: int(counts.get(change, 0))
+                    for change in DELTA_CHANGES
+                },
+                "banks": sorted(delta["Banks"].astype(str).unique().tolist())
+            }
+
+        version_path = self.get_version_path(dataframe_name)
+
+        with open(f"{version_path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(version, file, indent=2, ensure_ascii=False)
+
+        os.replace(f"{version_path}.tmp", version_path)
+
+        return version
+
+
+    # Get all the files we published for a dataframe
+
+    def get_output_paths(self, dataframe_name):
+
+        paths = [
+            self.get_path(dataframe_name, extension)
+            for extension in self.output_formats
+        ]
+
+        return [path for path in paths if os.path.exists(path)]
+
+
+# Table of the cleaned data in a sqlite database. The columns get the same
+# names that the DataHandler gives them (banks, nombre_del_indicador,
+# valor_indicador) so the api can use the rows as they come. The indexes
+# are the ones of the queries of the api, the data of a bank and the
+# ranking of an indicator, and they have the period when there is one
+
+class SQLiteSink:
+
+    table_name = "indicadores"
+    value_column = "valor_indicador"
+    period_column = "periodo"
+    id_column = "id_indicador"
+
+    def __init__(self, database_path):
+
+        self.database_path = database_path
+        self.connection = sqlite3.connect(database_path)
+        self.columns = None
+
+    @staticmethod
+    def get_column_name(column):
+
+        column = str(column).strip().lower().replace(" ", "_")
+
+        for accent, letter in zip("áéíóú", "aeiou"):
+            column = column.replace(accent, letter)
+
+        return column
+
+    def _create_table(self, dataframe: pd.DataFrame):
+
+        def get_type(column):
+
+            if column == self.value_column:
+                return "REAL"
+
+            if pd.api.types.is_integer_dtype(dataframe[column]):
+                return "INTEGER"
+
+            return "TEXT"
+
+        existing = [
+            row[1] for row in self.connection.execute(
+                f"PRAGMA table_info({self.table_name})"
+            )
+        ]
+
+        # If the columns changed (like when we added the ID of the indicator)
+        # the new ones are added to the table, the rows of the other periods
+        # of the store stay with the column empty until their period is
+        # written again (its key has the code of the pipeline, so the next
+        # backfill does it). A column that the new rows don't have stays
+        # empty for them. The rows are never dropped
+
+        if existing:
+
+            for column in dataframe.columns:
+                if column not in existing:
+                    self.connection.execute(
+                        f'ALTER TABLE {self.table_name} '
+                        f'ADD COLUMN "{column}" {get_type(column)}'
+                    )
+
+            return
+
+        definitions = ", ".join(
+            f'"{column}" {get_type(column)}' for column in dataframe.columns
+        )
+
+        # row_id keeps the order of the rows of the csv
+        self.connection.execute(
+            f"CREATE TABLE {self.table_name} "
+            f"(row_id INTEGER PRIMARY KEY, {definitions})"
+        )
+
+    def append(self, dataframe: pd.DataFrame):
+
+        if dataframe.empty:
+            return
+
+        dataframe = dataframe.rename(columns=self.get_column_name)
+
+        if self.columns is None:
+            self.columns = list(dataframe.columns)
+            self._create_table(dataframe)
+
+        # sqlite doesn't know the numpy types or the categories, so the
+        # rows go as python objects with None where pandas has NaN
+
+        values = dataframe[self.columns].astype(object)
+        values = values.where(dataframe[self.columns].notna(), None)
+
+        column_names = ", ".join(f'"{column}"' for column in self.columns)
+        placeholders = ", ".join("?" for _ in self.columns)
+
+        self.connection.executemany(
+            f"INSERT INTO {self.table_name} ({column_names}) "
+            f"VALUES ({placeholders})",
+            values.itertuples(index=False, name=None)
+        )
+
+    # Delete the rows of one period, the store uses it before writing the
+    # period again
+
+    def delete_period(self, period):
+
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (self.table_name,)
+        ).fetchone()
+
+        if exists:
+            self.connection.execute(
+                f'DELETE FROM {self.table_name} '
+                f'WHERE "{self.period_column}" = ?',
+                (period,)
+            )
+
+    # The rankings and the data of a bank are read in the order of these
+    # indexes, so sqlite reads the first rows of the index and stops (with a
+    # LIMIT) instead of sorting all the rows of the indicator. The ties go in
+    # the order of the rows, row_id ascending also when the values go from
+    # the biggest to the smallest, so every order has its own index. The
+    # names only have theirs when the data doesn't have the IDs
+
+    def get_indexes(self):
+
+        columns = self.columns or []
+
+        period = [self.period_column] if self.period_column in columns else []
+        indicator = (
+            self.id_column if self.id_column in columns
+            else "nombre_del_indicador"
+        )
+
+        return {
+            f"idx_{self.table_name}_bank_value":
+                ["banks"] + period + [f"{self.value_column} DESC", "row_id"],
+            f"idx_{self.table_name}_indicator_ascending":
+                [indicator] + period + [self.value_column, "row_id"],
+            f"idx_{self.table_name}_indicator_descending":
+                [indicator] + period + [f"{self.value_column} DESC", "row_id"]
+        }
+
+    # The indexes are created at the end, that is faster than updating them
+    # on every insert. The ones of an older version of the sink (the store
+    # keeps its database between runs) are dropped. Without commit nothing
+    # of this sink is saved
+
+    def close(self, commit=True):
+
+        try:
+            if not commit:
+                self.connection.rollback()
+
+            elif self.columns is not None:
+
+                indexes = self.get_indexes()
+
+                for (index_name,) in self.connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' "
+                    "AND tbl_name = ? AND sql IS NOT NULL",
+                    (self.table_name,)
+                ).fetchall():
+
+                    if index_name not in indexes:
+                        self.connection.execute(f"DROP INDEX {index_name}")
+
+                for index_name, columns in indexes.items():
+
+                    columns = [column.partition(" ") for column in columns]
+
+                    if not {name for name, _, _ in columns} <= {
+                        "row_id", *self.columns
+                    }:
+                        continue
+
+                    column_names = ", ".join(
+                        f'"{name}" {order}'.strip()
+                        for name, _, order in columns
+                    )
+
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {index_name} "
+                        f"ON {self.table_name} ({column_names})"
+                    )
+
+                self.connection.execute("ANALYZE")
+
+            if commit:
+                self.connection.commit()
+
+        finally:
+            self.connection.close()
+
+
+# Changes between two versions of the cleaned data, by bank and indicator.
+# The indicator is the ID when both versions have it, if not the name. If a
+# pair has more than one row we compare their mean, like the pivots
+
+DELTA_CHANGES = ["agregado", "eliminado", "modificado"]
+
+def compare_versions(previous: pd.DataFrame, current: pd.DataFrame,
+                     value_column="Valor Indicador",
+                     name_column="NOMBRE DEL INDICADOR"):
+
+    keys = ["Banks", "ID INDICADOR"]
+
+    if not all(key in previous and key in current for key in keys):
+        keys = ["Banks", name_column]
+
+    def get_values(dataframe):
+
+        values = dataframe.groupby(
+            keys, observed=True, dropna=False
+        )[value_column].mean().reset_index()
+
+        values["Banks"] = values["Banks"].astype(str)
+        values[keys[1]] = values[keys[1]].astype(
+            "int64" if keys[1] == "ID INDICADOR" else str
+        )
+
+        return values
+
+    merged = get_values(previous).merge(
+        get_values(current), on=keys, how="outer",
+        suffixes=(" Anterior", " Nuevo"), indicator=True
+    )
+
+    before = merged[f"{value_column} Anterior"]
+    after = merged[f"{value_column} Nuevo"]
+
+    # Two empty values are the same value
+    changed = (before != after) & ~(before.isna() & after.isna())
+
+    merged["Cambio"] = np.select(
+        [merged["_merge"] == "right_only", merged["_merge"] == "left_only",
+         changed],
+        DELTA_CHANGES,
+        default=""
+    )
+
+    delta = merged[merged["Cambio"] != ""].drop(columns="_merge")
+
+    # The name goes with the ID so the delta can be read alone
+
+    if keys[1] != name_column:
+
+        names = pd.concat([previous, current]).drop_duplicates(
+            keys[1], keep="last"
+        ).set_index(keys[1])[name_column].astype(str)
+
+        delta.insert(2, name_column, delta[keys[1]].map(names))
+
+    return delta.rename(columns={
+        f"{value_column} Anterior": "Valor Anterior",
+        f"{value_column} Nuevo": "Valor Nuevo"
+    })[
+        ["Banks", *keys[1:], *([name_column] if keys[1] != name_column else []),
+         "Cambio", "Valor Anterior", "Valor Nuevo"]
+    ].sort_values(["Cambio", "Banks", keys[1]]).reset_index(drop=True)
+
+
+# Average value of every bank and indicator, the same table that
+# pivot_table(index=banks, columns=indicator, aggfunc="mean") gives. We keep
+# the sum and the count of every pair, so the streaming mode can add the
+# blocks one by one and the memory only depends on banks x indicators. The
+# columns are the IDs of the indicators when the data has them, a name can
+# have more than one ID (OPERACIONES INTERBANCARIAS is an asset and a
+# liability) and they must not be averaged together
+
+class IndicatorMatrixBuilder:
+
+    def __init__(self, bank_column="Banks",
+                 indicator_column="ID INDICADOR",
+                 name_column="NOMBRE DEL INDICADOR",
+                 value_column="Valor Indicador"):
+
+        self.bank_column = bank_column
+        self.indicator_column = indicator_column
+        self.name_column = name_column
+        self.value_column = value_column
+        self.totals = None
+
+        # The name of every ID, for the index of the matrix
+        self.names = {}
+
+    def append(self, dataframe: pd.DataFrame):
+
+        if dataframe.empty:
+            return
+
+        # Data without IDs (an old run) keeps the names as columns
+        if self.indicator_column not in dataframe.columns:
+            self.indicator_column = self.name_column
+
+        totals = dataframe.groupby(
+            [self.bank_column, self.indicator_column], observed=True
+        )[self.value_column].agg(["sum", "count"])
+
+        if self.indicator_column != self.name_column:
+
+            names = dataframe.drop_duplicates(self.indicator_column)
+
+            for indicator_id, name in zip(
+                names[self.indicator_column], names[self.name_column]
+            ):
+                self.names.setdefault(indicator_id, str(name))
+
+        if self.totals is None:
+            self.totals = totals
+        else:
+            self.totals = self.totals.add(totals, fill_value=0)
+
+    def build(self) -> pd.DataFrame:
+
+        if self.totals is None:
+            return pd.DataFrame(dtype=np.float64)
+
+        means = self.totals["sum"] / self.totals["count"].where(
+            self.totals["count"] > 0
+        )
+
+        matrix = means.unstack(self.indicator_column)
+
+        # Like pivot_table, the banks or indicators without any value are
+        # left out, and both are sorted
+
+        matrix = matrix.dropna(how="all").dropna(axis=1, how="all")
+
+        matrix.index = matrix.index.astype(str)
+
+        if self.indicator_column == self.name_column:
+            matrix.columns = matrix.columns.astype(str)
+
+        return matrix.sort_index().sort_index(axis=1).astype(np.float64)
+
+    # The name of every column, the ID when the columns are IDs
+
+    def get_names(self, matrix: pd.DataFrame):
+
+        return [
+            self.names.get(indicator, str(indicator))
+            for indicator in matrix.columns
+        ]
+
+
+# Writer for the streaming mode, every block of the cleaned data is appended
+# to the csv, the sqlite database (and to the parquet when pyarrow is
+# installed) as soon as it's ready, so we never hold the whole dataframe in memory. Everything is
+# written to temp files that replace the published ones only at the end
+
+class CleanDataStream:
+
+    def __init__(self, data_saver: SaveCleanData, dataframe_name,
+                 value_column="Valor Indicador"):
+
+        self.data_saver = data_saver
+        self.dataframe_name = dataframe_name
+        self.csv_path = data_saver.get_path(dataframe_name)
+        self.parquet_path = data_saver.get_path(dataframe_name, "parquet")
+        self.sqlite_path = data_saver.get_path(dataframe_name, "sqlite")
+        self.totals_path = data_saver.get_path(
+            dataframe_name, "segment_totals.csv"
+        )
+        self.value_column = value_column
+
+        self.rows = 0
+        self.total_rows = 0
+        self._csv_file = None
+        self._totals_file = None
+        self._parquet_writer = None
+        self._schema = None
+        self._sqlite_sink = None
+        self._matrix_builder = IndicatorMatrixBuilder()
+
+        # The registry of the indicators and the segments, the one who
+        # writes the blocks gives them before closing the stream. The totals
+        # of the segments come block by block, see append_segment_totals
+        self.registry = None
+        self.segments = None
+
+    def __enter__(self):
+
+        os.makedirs(os.path.dirname(self.csv_path), exist_ok=True)
+
+        # The temp files are ours until the publication, another run waits
+        self._lock = self.data_saver.lock(self.dataframe_name)
+        self._lock.__enter__()
+
+        self._csv_file = open(
+            f"{self.csv_path}.tmp", "w", newline="", encoding="utf-8"
+        )
+
+        for path in [self.sqlite_path, self.totals_path]:
+            if os.path.exists(f"{path}.tmp"):
+                os.remove(f"{path}.tmp")
+
+        self._sqlite_sink = SQLiteSink(f"{self.sqlite_path}.tmp")
+
+        return self
+
+    def append(self, dataframe: pd.DataFrame):
+
+        if dataframe.empty:
+            return
+
+        # The values always go as float, a block can have only integers
+        # or only empty cells and it must be written like the others
+
+        if self.value_column in dataframe.columns:
+            dataframe = dataframe.assign(**{
+                self.value_column: pd.to_numeric(
+                    dataframe[self.value_column], errors="coerce"
+                ).astype("float64")
+            })
+
+        dataframe.to_csv(
+            self._csv_file, header=self.rows == 0, index=False
+        )
+
+        self._append_parquet(dataframe)
+        self._sqlite_sink.append(dataframe)  # type:ignore
+        self._matrix_builder.append(dataframe)
+
+        self.rows += len(dataframe)
+
+    # The totals of the segments of a block go to their own temp file, it's
+    # only created with the first totals so a dataset without segments
+    # doesn't publish an empty file
+
+    def append_segment_totals(self, dataframe: pd.DataFrame):
+
+        if dataframe is None or dataframe.empty:
+            return
+
+        if self._totals_file is None:
+            self._totals_file = open(
+                f"{self.totals_path}.tmp", "w", newline="", encoding="utf-8"
+            )
+
+        dataframe.to_csv(
+            self._totals_file, header=self.total_rows == 0, index=False
+        )
+
+        self.total_rows += len(dataframe)
+
+    def _append_parquet(self, dataframe: pd.DataFrame):
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+        except ImportError:
+            return
+
+        # The schema comes from the first block, the text columns are
+        # dictionary encoded like in the normal mode
+
+        if self._schema is None:
+
+            def get_type(column):
+
+                if column == self.value_column:
+                    return pa.float64()
+
+                if pd.api.types.is_integer_dtype(dataframe[column]):
+                    return pa.from_numpy_dtype(dataframe[column].dtype)
+
+                return pa.dictionary(pa.int32(), pa.string())
+
+            self._schema = pa.schema([
+                (column, get_type(column)) for column in dataframe.columns
+            ])
+
+            self._parquet_writer = pq.ParquetWriter(
+                f"{self.parquet_path}.tmp", self._schema
+            )
+
+        table = pa.Table.from_pandas(
+            dataframe.astype({
+                column: "string" for column in dataframe.columns
+                if column != self.value_column and
+                pa.types.is_dictionary(self._schema.field(column).type)
+            }),
+            schema=self._schema,
+            preserve_index=False
+        )
+
+        self._parquet_writer.write_table(table)  # type:ignore
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        try:
+            return self._close(exc_type)
+        finally:
+            self._lock.__exit__(None, None, None)
+
+    def _close(self, exc_type):
+
+        self._csv_file.close()  # type:ignore
+
+        if self._totals_file is not None:
+            self._totals_file.close()
+
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+        self._sqlite_sink.close(commit=exc_type is None)  # type:ignore
+
+        # If something failed we keep the files that were published before
+
+        if exc_type is not None:
+            self.data_saver.discard(self.dataframe_name)
             return False
 
+        self.data_saver.save_matrix(self._matrix_builder, self.dataframe_name)
+
+        if self.registry is not None:
+            self.data_saver.save_registry(self.registry, self.dataframe_name)
+
+        # The totals are already in their temp file
+        if self.segments is not None:
+            self.data_saver.save_segments(
+                self.segments, None, self.dataframe_name
+            )
+
+        self.data_saver.publish(self.dataframe_name)
+
+        return False
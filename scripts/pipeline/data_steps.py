@@ -0,0 +1,160 @@
+import inspect
+
+
+# Base of the transformers of the pipeline. It has the same methods that we
+# used from sklearn (get_params, set_params and fit_transform), so the steps
+# don't need to import scikit-learn, which takes more time and memory to
+# import than all the rest of the pipeline. The params are the arguments of
+# __init__ saved with the same name, like in sklearn, so the steps can still
+# go in a sklearn Pipeline if somebody has it installed
+
+class StepTransformer:
+
+    # The steps that keep something after running (like a registry) can't
+    # be skipped by the cache of steps, they set this to False
+    memoize = True
+
+    @classmethod
+    def _get_param_names(cls):
+
+        if cls.__init__ is object.__init__:
+            return []
+
+        return sorted(
+            parameter.name
+            for parameter in inspect.signature(cls.__init__).parameters.values()
+            if parameter.name != "self" and parameter.kind not in (
+                parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD
+            )
+        )
+
+    def get_params(self, deep=True):
+
+        return {name: getattr(self, name) for name in self._get_param_names()}
+
+    def set_params(self, **params):
+
+        for name, value in params.items():
+
+            if name not in self._get_param_names():
+                raise ValueError(
+                    f"{type(self).__name__} no tiene el parámetro {name}"
+                )
+
+            setattr(self, name, value)
+
+        return self
+
+    def fit(self, X, y=None):
+
+        return self
+
+    def fit_transform(self, X, y=None, **fit_params):
+
+        return self.fit(X, y, **fit_params).transform(X)
+
+    def __repr__(self):
+
+        params = ", ".join(
+            f"{name}={value!r}" for name, value in self.get_params().items()
+        )
+
+        return f"{type(self).__name__}({params})"
+
+
+# Run the steps one after the other, every step receives what the previous
+# one returned. It's all we used of sklearn.pipeline.Pipeline, plus the
+# optional memory (a StepMemory of data_cache) to skip the steps whose
+# output we already have
+
+class StepPipeline:
+
+    def __init__(self, steps, memory=None):
+
+        names = [name for name, _ in steps]
+
+        if len(set(names)) != len(names):
+            raise ValueError(f"Los nombres de los pasos se repiten: {names}")
+
+        self.steps = list(steps)
+        self.memory = memory
+
+    @property
+    def named_steps(self):
+
+        return dict(self.steps)
+
+    def fit(self, X, y=None):
+
+        self.fit_transform(X, y)
+
+        return self
+
+    def fit_transform(self, X, y=None):
+
+        if self.memory is None:
+
+            for _, step in self.steps:
+                X = step.fit_transform(X, y)
+
+            return X
+
+        return self._fit_transform_with_memory(X, y)
+
+    # Only the first steps that can be memoized are looked up, from the last
+    # one backwards, and the pipeline goes on after the one we found
+
+    def _fit_transform_with_memory(self, X, y=None):
+
+        key = self.memory.fingerprint(X)
+        keys = []
+
+        for _, step in self.steps:
+            key = self.memory.step_key(key, step)
+            keys.append(key)
+
+        cacheable = 0
+
+        for _, step in self.steps:
+
+            if not step.memoize:
+                break
+
+            cacheable += 1
+
+        start = 0
+
+        for position in reversed(range(cacheable)):
+
+            if not self.memory.contains(keys[position]):
+                continue
+
+            cached = self.memory.load(keys[position])
+
+            if cached is not None:
+
+                X = cached
+                start = position + 1
+
+                names = [name for name, _ in self.steps[:start]]
+                print(f"Pasos desde la cache: {', '.join(names)}")
+
+                break
+
+        for position in range(start, len(self.steps)):
+
+            X = self.steps[position][1].fit_transform(X, y)
+
+            if position < cacheable:
+                self.memory.save(keys[position], X)
+            else:
+                self.memory.remember(X, keys[position])
+
+        return X
+
+    def transform(self, X):
+
+        for _, step in self.steps:
+            X = step.transform(X)
+
+        return X
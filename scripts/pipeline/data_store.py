@@ -0,0 +1,299 @@
+import datetime
+import importlib.util
+import json
+import os
+
+import pandas as pd
+
+from data_saving import SQLiteSink
+
+
+# Store of the cleaned data with one partition for every period, so adding a
+# new month or fixing an old one only rewrites the files of that month
+
+class PartitionedStore:
+
+    period_column = "Periodo"
+
+    def __init__(self, store_dir=None):
+
+        # Get the root path of the project
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        self.store_dir = store_dir or os.path.join(
+            project_root, "output", "store"
+        )
+
+        self.manifest_path = os.path.join(self.store_dir, "manifest.json")
+        self.database_path = os.path.join(self.store_dir, "store.sqlite")
+        self.registry_path = os.path.join(self.store_dir, "indicators.csv")
+        self.failures_path = os.path.join(self.store_dir, "failures.json")
+
+        # We use parquet when pyarrow is installed, if not the csv works too
+
+        if importlib.util.find_spec("pyarrow") is not None:
+            self.extension = "parquet"
+        else:
+            self.extension = "csv"
+
+
+    def _partition_path(self, period, extension=None):
+
+        return os.path.join(
+            self.store_dir,
+            f"periodo={period}",
+            f"data.{extension or self.extension}"
+        )
+
+
+    # The manifest keeps the paths relative to the store, so the store can
+    # be moved or copied to another machine. The old manifests have them
+    # absolute, join keeps those as they are
+
+    def _entry_path(self, entry):
+
+        return os.path.join(self.store_dir, entry["path"])
+
+
+    def load_manifest(self):
+
+        if not os.path.exists(self.manifest_path):
+            return {}
+
+        try:
+            with open(self.manifest_path, encoding="utf-8") as file:
+                return json.load(file)
+
+        except (OSError, ValueError):
+            return {}
+
+
+    # Write to a temp file and then rename it, so a reader never finds a file
+    # written by half
+
+    @staticmethod
+    def _replace_file(path, write):
+
+        temp_path = f"{path}.tmp"
+        write(temp_path)
+        os.replace(temp_path, path)
+
+
+    def _save_json(self, path, data):
+
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        def write(temp_path):
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file, indent=2, ensure_ascii=False)
+
+        self._replace_file(path, write)
+
+
+    def _save_manifest(self, manifest):
+
+        self._save_json(self.manifest_path, manifest)
+
+
+    # The manifest is the checkpoint of the backfill: a period is in it only
+    # after its partition is written. The workbooks that failed go to their
+    # own file with the error, they are tried again in the next run and
+    # leave the list when their partition is written
+
+    def load_failures(self):
+
+        if not os.path.exists(self.failures_path):
+            return {}
+
+        try:
+            with open(self.failures_path, encoding="utf-8") as file:
+                return json.load(file)
+
+        except (OSError, ValueError):
+            return {}
+
+
+    def record_failure(self, period, source_path, error, source_key=None):
+
+        failures = self.load_failures()
+
+        failures[period] = {
+            "source_path": source_path,
+            "source_key": source_key,
+            "error": f"{type(error).__name__}: {error}",
+            "failed_at": datetime.datetime.now().isoformat(timespec="seconds")
+        }
+
+        self._save_json(self.failures_path, dict(sorted(failures.items())))
+
+
+    def clear_failure(self, period):
+
+        failures = self.load_failures()
+
+        if failures.pop(period, None) is not None:
+            self._save_json(self.failures_path, failures)
+
+
+    # Check if a period is already stored from the same source, in that case
+    # there is no need to process the workbook again
+
+    def has_partition(self, period, source_key=None):
+
+        entry = self.load_manifest().get(period)
+
+        if entry is None or not os.path.exists(self._entry_path(entry)):
+            return False
+
+        return source_key is None or entry.get("source_key") == source_key
+
+
+    # Write (or rewrite) only the partition of one period
+
+    def write_partition(self, period, dataframe: pd.DataFrame, source_key=None,
+                        source_path=None, registry=None, segments=None,
+                        segment_totals=None):
+
+        path = self._partition_path(period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        partition = dataframe.assign(**{self.period_column: period})
+
+        if self.extension == "parquet":
+            self._replace_file(path, lambda temp_path: partition.to_parquet(
+                temp_path, index=False, engine="pyarrow"
+            ))
+        else:
+            self._replace_file(path, lambda temp_path: partition.to_csv(
+                temp_path, index=False
+            ))
+
+        # Delete the file of the other format if this period had one before
+
+        for extension in ("parquet", "csv"):
+            old_path = self._partition_path(period, extension)
+            if old_path != path and os.path.exists(old_path):
+                os.remove(old_path)
+
+        # The segments of a period live next to its data, the banks can move
+        # from one segment to another between months
+
+        if segments is not None:
+            self._write_segments(period, segments, segment_totals)
+
+        self._index_partition(period, partition)
+
+        if registry is not None:
+            self._update_registry(registry)
+
+        manifest = self.load_manifest()
+
+        manifest[period] = {
+            "path": os.path.relpath(path, self.store_dir),
+            "rows": len(partition),
+            "source_key": source_key,
+            "source_path": source_path
+        }
+
+        self._save_manifest(dict(sorted(manifest.items())))
+        self.clear_failure(period)
+
+        return path
+
+
+    def _segments_path(self, period, name):
+
+        return os.path.join(
+            os.path.dirname(self._partition_path(period)), f"{name}.csv"
+        )
+
+
+    def _write_segments(self, period, segments, segment_totals=None):
+
+        self._replace_file(
+            self._segments_path(period, "segments"),
+            lambda temp_path: segments.to_csv(temp_path, index=False)
+        )
+
+        if segment_totals is not None:
+            self._replace_file(
+                self._segments_path(period, "segment_totals"),
+                lambda temp_path: segment_totals.assign(**{
+                    self.period_column: period
+                }).to_csv(temp_path, index=False)
+            )
+
+
+    # Keep all the periods in one sqlite database too, so we can ask for the
+    # history of a bank or an indicator with its indexes. Only the rows of
+    # the period we wrote are replaced, in a single transaction
+
+    def _index_partition(self, period, partition: pd.DataFrame):
+
+        sink = SQLiteSink(self.database_path)
+
+        try:
+            sink.delete_period(period)
+            sink.append(partition)
+        except Exception:
+            sink.close(commit=False)
+            raise
+
+        sink.close()
+
+
+    # The IDs don't depend on the period, so one registry has the indicators
+    # of all the periods, we only add the ones that are new
+
+    def _update_registry(self, registry: pd.DataFrame):
+
+        if os.path.exists(self.registry_path):
+            registry = pd.concat([
+                pd.read_csv(self.registry_path, dtype={"CÓDIGO": str},
+                            keep_default_na=False),
+                registry
+            ]).drop_duplicates()
+
+        self._replace_file(
+            self.registry_path,
+            lambda temp_path: registry.sort_values("ID INDICADOR").to_csv(
+                temp_path, index=False
+            )
+        )
+
+
+    def list_periods(self):
+
+        return [
+            period for period in sorted(self.load_manifest())
+            if self.has_partition(period)
+        ]
+
+
+    def read_partition(self, period) -> pd.DataFrame:
+
+        path = self._entry_path(self.load_manifest()[period])
+
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path)
+
+        return pd.read_csv(path)
+
+
+    # Read the periods we ask for (all of them by default) in a single
+    # dataframe sorted by period
+
+    def read_all(self, periods=None) -> pd.DataFrame:
+
+        periods = periods or self.list_periods()
+
+        if not periods:
+            return pd.DataFrame()
+
+        return pd.concat(
+            [self.read_partition(period) for period in sorted(periods)],
+            ignore_index=True
+        )
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+
+# Watch the dataset directory and run the pipeline when a workbook is added or
+# changed. We compare the date and size of the files every few seconds, that
+# works the same in every system and doesn't need extra packages
+
+class DatasetWatcher:
+
+    def __init__(self, directory, interval=10.0):
+
+        self.directory = directory
+        self.interval = interval
+
+    # Date and size of every workbook of the directory, skipping the lock
+    # files that excel leaves while a file is open
+
+    def snapshot(self):
+
+        files = {}
+
+        for file_name in sorted(os.listdir(self.directory)):
+
+            if not file_name.endswith(".xlsx") or file_name.startswith("~$"):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, file_name))
+            except FileNotFoundError:
+                continue
+
+            files[file_name] = (stat.st_mtime_ns, stat.st_size)
+
+        return files
+
+    # A file that is still being copied changes between two checks, so we
+    # wait until the directory stays the same for a whole interval
+
+    def wait_until_stable(self, files):
+
+        while True:
+
+            time.sleep(self.interval)
+            current = self.snapshot()
+
+            if current == files:
+                return current
+
+            files = current
+
+    def watch(self, on_change, max_runs=None):
+
+        runs = 0
+        files = self.snapshot()
+
+        # Run once at the start, with the incremental mode this doesn't do
+        # anything if the data is already published
+
+        while max_runs is None or runs < max_runs:
+
+            try:
+                on_change()
+
+            except Exception as e:
+
+                # A bad workbook must not stop the daemon, the published data
+                # stays as it was until a good file arrives
+
+                print(f"Error procesando el dataset: {e}", file=sys.stderr)
+
+            runs += 1
+
+            if max_runs is not None and runs >= max_runs:
+                break
+
+            print(f"Esperando cambios en {self.directory}...")
+
+            while True:
+
+                time.sleep(self.interval)
+                current = self.snapshot()
+
+                if current != files:
+                    print("Cambio detectado en el dataset")
+                    files = self.wait_until_stable(current)
+                    break
+
+        return runs
@@ -1,6 +1,22 @@
+import argparse
+import contextlib
+import datetime
+import os
+import sys
+
 from data_ingest import DataIngester
-from data_processing import CreateDataframes
-from data_saving import SaveCleanData
+from data_processing import (
+    CreateDataframes,
+    AccountingIdentityError,
+    ExtractIndicatorRegistry,
+    FilterRealBanks
+)
+from data_saving import SaveCleanData, CleanDataStream
+from data_cache import PipelineCache, StepMemory
+from data_store import PartitionedStore
+from data_profiling import PipelineProfiler
+from data_watcher import DatasetWatcher
+from data_executor import TaskGraph, ProgressReport
 
 from data_pipeline import (
     CleaningPipeline,
@@ -9,71 +25,724 @@ from data_pipeline import (
     ConcatDataframesPipeline
 )
 
-def main():
+
+# Run a part of the pipeline through the profiler when we have one, so the
+# report also has the reading and the saving of the data
+
+def measure(profiler, step_name, function, X=None):
+
+    if profiler is None:
+        return function(X) if X is not None else function()
+
+    return profiler.run(step_name, function, X)
+
+
+def section(profiler, name):
+
+    if profiler is None:
+        return contextlib.nullcontext()
+
+    return profiler.in_section(name)
+
+
+# Clean a single sheet with the pipeline that corresponds to it
+
+def clean_sheet(name, df, main_pipeline, balance_pipeline, match_pipeline):
+
+    print(f"\nProcesando hoja: {name}")
+
+    if name == "BALANCE":
+
+        print("→ Aplicando pipeline de BALANCE")
+        df = balance_pipeline.clean(df)
+        df = match_pipeline.match(df, name)
+
+    else:
+
+         print("→ Aplicando pipeline general")
+         df = main_pipeline.clean(df)
+         df = match_pipeline.match(df, name)
+
+    print("Resultado después del pipeline:")
+    print(df.head(5))
+    print(f"Shape final: {df.shape}")
+
+    return df
+
+
+# Read a sheet of the workbook from its bytes, that the graph reads once for
+# all the sheets. With the memory of steps the key of the read is the hash of
+# the xml of the sheet, so a sheet that didn't change is not parsed again and
+# the keys of its steps don't need to hash the dataframe
+
+def read_sheet(dataframe_creator, workbook_bytes, name, memory=None):
+
+    if memory is None:
+        return dataframe_creator.read(workbook_bytes, name)
+
+    sheet_hash = PipelineCache().sheet_hashes(workbook_bytes, [name])[name]
+
+    key = PipelineCache.make_key(
+        "CreateDataframes.read", sheet_hash, dataframe_creator.engine,
+        dataframe_creator.skiprows
+    )
+
+    return memory.cached_call(
+        key, dataframe_creator.read, workbook_bytes, name
+    )
+
+
+# Branch of the task graph for one sheet: read it and clean it. It runs in a
+# worker process, so it builds its own pipelines and profiler, and it gives
+# back the measures of its steps with the dataframe. The bytes of the
+# workbook go last because the graph adds the results of the dependencies
+# at the end of the arguments
+
+def clean_sheet_branch(dataframe_creator, name, copy, profile, on_violation,
+                       memory, workbook_bytes):
+
+    profiler = PipelineProfiler() if profile else None
+
+    with section(profiler, name):
+
+        df = measure(
+            profiler,
+            "CreateDataframes.read",
+            lambda workbook: read_sheet(
+                dataframe_creator, workbook, name, memory
+            ),
+            workbook_bytes
+        )
+
+        df = clean_sheet(
+            name,
+            df,
+            CleaningPipeline(copy=copy, profiler=profiler, memory=memory),
+            BalanceCleaningPipeline(
+                copy=copy, profiler=profiler, on_violation=on_violation,
+                memory=memory
+            ),
+            MatchColumnsPipeline(copy=copy, profiler=profiler, memory=memory)
+        )
+
+    return df, profiler.records if profiler is not None else []
+
+
+# Save the table of a workbook that didn't pass the accounting checks next to
+# the reports, so we can see which banks and rules failed
+
+def save_violations(error: AccountingIdentityError):
+
+    project_root = os.path.abspath(os.path.join(
+        os.path.dirname(__file__), "../.."
+    ))
+
+    violations_path = os.path.join(
+        project_root,
+        "output",
+        "reports",
+        f"violations_{datetime.datetime.now():%Y%m%d_%H%M%S}.csv"
+    )
+
+    os.makedirs(os.path.dirname(violations_path), exist_ok=True)
+    error.violations.to_csv(violations_path, index=False)  # type:ignore
+
+    print(f"{error}, no se publica nada. Detalle en {violations_path}",
+          file=sys.stderr)
+
+    return violations_path
+
+
+def report_graph(profiler, name, graph):
+
+    graph.print_summary()
+
+    if profiler is not None:
+        profiler.add_graph(name, graph.get_report())
+
+
+def main(incremental=False, copy=True, profiler=None, max_workers=None,
+         on_violation="raise", memory=None, quiet=False):
 
     # Creating the instances of the classes
 
     ingester = DataIngester()
     dataframe_creator = CreateDataframes()
-    main_pipeline = CleaningPipeline()
-    balance_pipeline = BalanceCleaningPipeline()
-    match_pipeline = MatchColumnsPipeline()
-    concat_pipeline = ConcatDataframesPipeline()
+    main_pipeline = CleaningPipeline(copy=copy, profiler=profiler)
+    balance_pipeline = BalanceCleaningPipeline(
+        copy=copy, profiler=profiler, on_violation=on_violation
+    )
+    match_pipeline = MatchColumnsPipeline(copy=copy, profiler=profiler)
+    concat_pipeline = ConcatDataframesPipeline(
+        copy=copy, profiler=profiler, memory=memory
+    )
     data_saver = SaveCleanData()
     dataset_name = "dataset"
+    output_name = "Final Dataframe"
 
     try:
         # Load the file
         path = ingester.ingest(dataset_name)
         print(f"Ruta del archivo cargado {path}")
 
-        # Create the dataframes
-        dataframes = dataframe_creator.create(path)
+        sheet_names = dataframe_creator.sheet_names
+        cleaned_sheets = {}
+
+        # The workbook is read from disk once, the hashes of the sheets and
+        # every branch of the graph use these bytes
+        workbook_bytes = dataframe_creator.load(path)
+
+        if incremental:
+
+            # Build a key for every sheet with its content and the params of
+            # the transformers, if nothing changed we don't do anything
+
+            cache = PipelineCache()
+
+            params_hash = cache.params_hash(
+                main_pipeline,
+                balance_pipeline,
+                match_pipeline,
+                concat_pipeline
+            )
 
-        final_dataframes = []
+            sheet_keys = {
+                sheet: cache.make_key(sheet, sheet_hash, params_hash)
+                for sheet, sheet_hash in cache.sheet_hashes(
+                    workbook_bytes, sheet_names
+                ).items()
+            }
 
-        for name, df in dataframes.items():
+            build_key = cache.make_key(*sheet_keys.values())
 
-            print(f"\nProcesando hoja: {name}")
+            if cache.is_up_to_date(
+                build_key, data_saver.get_output_paths(output_name)
+            ):
+                print("El dataset no cambió, no hay nada que procesar")
+                return data_saver.get_path(output_name)
 
-            if name == "BALANCE":
+            # Take from the cache the sheets that didn't change
 
-                print("→ Aplicando pipeline de BALANCE")
-                df = balance_pipeline.clean(df)
-                df = match_pipeline.match(df)
+            for sheet in sheet_names:
+                cached_sheet = cache.load_sheet(sheet, sheet_keys[sheet])
 
-            else:
+                if cached_sheet is not None:
+                    print(f"Hoja {sheet} sin cambios, usando la cache")
+                    cleaned_sheets[sheet] = cached_sheet
 
-                 print("→ Aplicando pipeline general")
-                 df = main_pipeline.clean(df)
-                 df = match_pipeline.match(df)
+        # Every sheet that we need to process is a branch of the graph, they
+        # run at the same time and then fan in to the concat and the save
 
-            print("Resultado después del pipeline:")
-            print(df.head(5))
-            print(f"Shape final: {df.shape}")
+        pending_sheets = [
+            sheet for sheet in sheet_names if sheet not in cleaned_sheets
+        ]
 
-            final_dataframes.append(df)
+        graph = TaskGraph(max_workers, quiet=quiet)
 
+        for sheet in pending_sheets:
+            graph.add_task(
+                sheet, clean_sheet_branch, dataframe_creator, sheet, copy,
+                profiler is not None, on_violation, memory, workbook_bytes
+            )
 
-        concat_dataframe = concat_pipeline.concat(final_dataframes)
+        def concat_sheets(*branches):
 
-        print("Resultado después de concatenar:")
-        print(concat_dataframe.head(5))
-        print(f"Shape después de concatenar: {concat_dataframe.shape}")
+            for sheet, (df, records) in zip(pending_sheets, branches):
+
+                if profiler is not None:
+                    profiler.merge(records)
+
+                if incremental:
+                    cache.save_sheet(sheet, sheet_keys[sheet], df)
+
+                cleaned_sheets[sheet] = df
+
+            # Keep always the same order of the sheets in the final dataframe
+
+            final_dataframes = [cleaned_sheets[sheet] for sheet in sheet_names]
+
+            concat_dataframe = concat_pipeline.concat(final_dataframes)
+
+            print("Resultado después de concatenar:")
+            print(concat_dataframe.head(5))
+            print(f"Shape después de concatenar: {concat_dataframe.shape}")
+
+            return concat_dataframe
+
+        graph.add_task(
+            "concat", concat_sheets, dependencies=pending_sheets,
+            in_process=True
+        )
 
-        
         # Guardar el dataframe filtrado
-        data_saver.save(concat_dataframe, "Final Dataframe")
+        graph.add_task(
+            "save",
+            lambda dataframe: measure(
+                profiler,
+                "SaveCleanData.save",
+                lambda data: data_saver.save(
+                    data, output_name, registry=concat_pipeline.registry,
+                    segments=concat_pipeline.segments,
+                    segment_totals=concat_pipeline.segment_totals
+                ),
+                dataframe
+            ),
+            dependencies=["concat"],
+            in_process=True
+        )
+
+        saved_path = graph.run()["save"]
+
+        report_graph(profiler, "main", graph)
+
+        if incremental and saved_path:
+            cache.save_manifest(
+                build_key, data_saver.get_output_paths(output_name), sheet_keys
+            )
+
+        return saved_path
+
+    except AccountingIdentityError as e:
+
+        save_violations(e)
 
     except FileNotFoundError as e:
 
-        print(e)
+        print(e, file=sys.stderr)
+
+
+# Streaming mode: every sheet is read by blocks of rows, each block is
+# cleaned, melted and filtered and then appended to the output, so the memory
+# doesn't grow with the number of accounts or banks of the workbook
+
+def main_streaming(chunk_size=5000, copy=True, profiler=None):
+
+    ingester = DataIngester()
+    dataframe_creator = CreateDataframes()
+    main_pipeline = CleaningPipeline(copy=copy, profiler=profiler)
+    # The blocks of the balance don't have all the accounts, so the totals
+    # can't be checked in this mode. The memory doesn't depend on the rows
+    # of the sheet, so here the balance keeps all its accounts and not only
+    # the ones of TakePriorRows
+    balance_pipeline = BalanceCleaningPipeline(
+        copy=copy, profiler=profiler, on_violation="ignore", prior_rows=False
+    )
+    match_pipeline = MatchColumnsPipeline(copy=copy, profiler=profiler)
+    # There is no concat in this mode, so the registry of the indicators
+    # and the segments are built block by block. The totals of the segments
+    # are as many as the rows of the banks, they go to the stream with every
+    # block instead of piling up in the filter
+    registry_extractor = ExtractIndicatorRegistry(copy=copy).fit(None)
+    banks_filter = FilterRealBanks(copy=copy, keep_totals=False).fit(None)
+    data_saver = SaveCleanData()
+    output_name = "Final Dataframe"
+
+    try:
+        path = ingester.ingest("dataset")
+        print(f"Ruta del archivo cargado {path}")
+
+        with CleanDataStream(data_saver, output_name) as stream:
+
+            for sheet in dataframe_creator.sheet_names:
+
+                print(f"\nProcesando hoja por bloques: {sheet}")
+
+                with section(profiler, sheet):
+
+                    for block in dataframe_creator.iter_chunks(
+                        path, sheet, chunk_size
+                    ):
+
+                        if sheet == "BALANCE":
+                            block = balance_pipeline.clean(block)
+                        else:
+                            block = main_pipeline.clean(block)
+
+                        block = match_pipeline.match(block, sheet)
 
+                        stream.append(banks_filter.transform(
+                            registry_extractor.transform(block)
+                        ))
+                        stream.append_segment_totals(
+                            banks_filter.segment_totals_
+                        )
 
+            stream.registry = registry_extractor.registry_
+            stream.segments = banks_filter.segments_
+
+        print(f"Filas guardadas: {stream.rows}")
+
+        return stream.csv_path
+
+    except FileNotFoundError as e:
+
+        print(e, file=sys.stderr)
+
+
+# Process a whole directory of monthly workbooks into the store partitioned
+# by period, the months that didn't change since the last run are skipped.
+# It's a backfill that can be resumed: every partition is checkpointed in the
+# manifest of the store as soon as it's written, so after a crash the next
+# run starts from the periods that are missing. A bad workbook doesn't stop
+# the others, it goes to the failures of the store and is tried again in
+# the next run
+
+def main_history(directory=None, copy=True, profiler=None,
+                 max_workers=None, on_violation="raise", memory=None,
+                 quiet=False):
+
+    ingester = DataIngester()
+    dataframe_creator = CreateDataframes()
+    main_pipeline = CleaningPipeline(copy=copy, profiler=profiler)
+    balance_pipeline = BalanceCleaningPipeline(
+        copy=copy, profiler=profiler, on_violation=on_violation
+    )
+    match_pipeline = MatchColumnsPipeline(copy=copy, profiler=profiler)
+    concat_pipeline = ConcatDataframesPipeline(
+        copy=copy, profiler=profiler, memory=memory
+    )
+    cache = PipelineCache()
+    store = PartitionedStore()
+
+    try:
+        unreadable = {}
+        workbooks = ingester.ingest_directory(directory, failures=unreadable)
+        print(f"Archivos encontrados: {len(workbooks) + len(unreadable)}")
+
+        # The failures of files that are not there anymore are forgotten
+
+        previous_failures = store.load_failures()
+
+        for period, failure in list(previous_failures.items()):
+            if not os.path.exists(failure["source_path"]):
+                store.clear_failure(period)
+                del previous_failures[period]
+
+        if previous_failures:
+            print(f"Se reintentan {len(previous_failures)} periodos que "
+                  f"fallaron antes: {', '.join(previous_failures)}")
+
+        params_hash = cache.params_hash(
+            main_pipeline,
+            balance_pipeline,
+            match_pipeline,
+            concat_pipeline
+        )
+
+        written_periods = []
+        failed_periods = []
+
+        pending = []
+
+        for period, path in workbooks:
+
+            source_key = cache.make_key(cache.file_hash(path), params_hash)
+
+            if store.has_partition(period, source_key):
+                print(f"Periodo {period} sin cambios, se mantiene")
+                continue
+
+            pending.append((period, path, source_key))
+
+        progress = ProgressReport(len(pending) + len(unreadable))
+
+        def fail_period(period, path, error, source_key=None):
+
+            if isinstance(error, AccountingIdentityError):
+                save_violations(error)
+
+            store.record_failure(period, path, error, source_key)
+            failed_periods.append(period)
+            progress.update(period, error=error)
+
+        # The files without a period (or with the period of another file)
+        # are kept by their name
+
+        for path, error in unreadable.items():
+            fail_period(os.path.basename(path), path, error)
+
+        # All the sheets of all the periods go in the same graph, so a
+        # backfill of many months uses all the cores. Every period fans in
+        # to its own concat and partition. Only two tasks per worker are sent
+        # at the same time, that keeps the finished sheets in memory bounded
+
+        workers = max_workers or os.cpu_count() or 1
+        periods = {}
+
+        def on_error(name, error):
+
+            period, task = name.rsplit("/", 1)
+
+            # The error of a sheet also skips the store of its period, we
+            # count the period once, when its store is skipped
+
+            if task == "store":
+                fail_period(period, *periods[period], error=error)
+
+        graph = TaskGraph(
+            max_workers, keep_going=True, max_pending=2 * workers,
+            on_error=on_error, quiet=quiet
+        )
+
+        for period, path, source_key in pending:
+
+            print(f"\nProcesando periodo {period}: {path}")
+
+            periods[period] = (path, source_key)
+
+            # The workbook of the period is read (and its sheets checked)
+            # once in this process, its sheets get the bytes and they are
+            # released when the last sheet is done. If it fails the store
+            # of the period is skipped and on_error records it
+            workbook = graph.add_task(
+                f"{period}/read", dataframe_creator.load, path,
+                in_process=True
+            )
+
+            branches = [
+                graph.add_task(
+                    f"{period}/{sheet}", clean_sheet_branch,
+                    dataframe_creator, sheet, copy,
+                    profiler is not None, on_violation, memory,
+                    dependencies=[workbook]
+                )
+                for sheet in dataframe_creator.sheet_names
+            ]
+
+            def write_period(period, path, source_key, *branches):
+
+                final_dataframes = []
+
+                for df, records in branches:
+
+                    if profiler is not None:
+                        profiler.merge(records)
+
+                    final_dataframes.append(df)
+
+                with section(profiler, period):
+                    concat_dataframe = concat_pipeline.concat(final_dataframes)
+
+                store.write_partition(
+                    period, concat_dataframe, source_key, path,
+                    registry=concat_pipeline.registry,
+                    segments=concat_pipeline.segments,
+                    segment_totals=concat_pipeline.segment_totals
+                )
+                written_periods.append(period)
+                progress.update(period, rows=len(concat_dataframe))
+
+            graph.add_task(
+                f"{period}/store", write_period, period, path, source_key,
+                dependencies=branches, in_process=True
+            )
+
+        if graph.tasks:
+            graph.run()
+            report_graph(profiler, "history", graph)
+
+        summary = progress.get_summary()
+
+        if profiler is not None:
+            profiler.add_graph("history_progress", summary)
+
+        print(f"\nPeriodos actualizados: {written_periods}")
+        print(f"Periodos en el store: {store.list_periods()}")
+        print(
+            f"Backfill: {summary['done']} escritos y {summary['failed']} "
+            f"fallidos en {summary['seconds']:.2f} s "
+            f"({summary['files_per_second']:.2f} archivos/s, "
+            f"{summary['rows_per_second']:.0f} filas/s)"
+        )
+
+        if failed_periods:
+            print(f"Periodos con error (ver {store.failures_path}): "
+                  f"{', '.join(failed_periods)}", file=sys.stderr)
+
+        return written_periods
+
+    except (FileNotFoundError, ValueError) as e:
+
+        print(e, file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
 
+    parser = argparse.ArgumentParser(
+        description="Pipeline de limpieza del dataset de la Superintendencia"
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reutilizar las hojas que no cambiaron desde la última ejecución"
+    )
+
+    parser.add_argument(
+        "--history",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="DIRECTORIO",
+        help="Procesar todos los archivos mensuales de un directorio "
+             "(por defecto dataset/) en el store particionado por periodo"
+    )
+
+    parser.add_argument(
+        "--no-copy",
+        action="store_true",
+        help="Los pasos del pipeline modifican los dataframes intermedios "
+             "en lugar de copiarlos (menos memoria)"
+    )
+
+    parser.add_argument(
+        "--stream",
+        nargs="?",
+        const=5000,
+        default=None,
+        type=int,
+        metavar="FILAS",
+        help="Leer y limpiar las hojas por bloques de filas (por defecto "
+             "5000) escribiendo el resultado a medida que avanza"
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Quedarse vigilando el directorio del dataset y volver a "
+             "ejecutar el pipeline cuando llegue un archivo nuevo o cambie"
+    )
+
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=10.0,
+        metavar="SEGUNDOS",
+        help="Cada cuánto revisar el directorio en el modo --watch"
+    )
+
+    parser.add_argument(
+        "--on-violation",
+        choices=["raise", "warn", "ignore"],
+        default="raise",
+        help="Qué hacer si el balance no cumple las identidades contables: "
+             "detener sin publicar (raise), solo avisar (warn) o no revisar "
+             "(ignore)"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Procesos para limpiar las hojas al mismo tiempo (por defecto "
+             "uno por núcleo)"
+    )
+
+    parser.add_argument(
+        "--step-cache",
+        nargs="?",
+        const=512,
+        default=None,
+        type=int,
+        metavar="MB",
+        help="Guardar en disco la salida de cada paso y reutilizarla cuando "
+             "la entrada y los parámetros del paso no cambian (por defecto "
+             "hasta 512 MB, se borra lo usado hace más tiempo)"
+    )
+
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="No mostrar nada en consola, el detalle queda en el reporte"
+    )
+
+    parser.add_argument(
+        "--report",
+        default=None,
+        metavar="RUTA",
+        help="Ruta del reporte json de la ejecución "
+             "(por defecto output/reports/pipeline_run_<fecha>.json)"
+    )
+
+    parser.add_argument(
+        "--no-report",
+        action="store_true",
+        help="No medir los pasos ni generar el reporte json"
+    )
+
+    args = parser.parse_args()
+
+    # Run the pipeline once with the mode we asked for, in the watch mode
+    # this runs again every time the dataset changes
+
+    def run_pipeline():
+
+        profiler = None if args.no_report else PipelineProfiler()
+
+        memory = None
+
+        if args.step_cache is not None:
+            memory = StepMemory(max_bytes=args.step_cache * 1024 ** 2)
+
+        if args.stream is not None:
+            main_streaming(
+                args.stream,
+                copy=not args.no_copy,
+                profiler=profiler
+            )
+        elif args.history is not None:
+            main_history(
+                args.history or None,
+                copy=not args.no_copy,
+                profiler=profiler,
+                max_workers=args.workers,
+                on_violation=args.on_violation,
+                memory=memory,
+                quiet=args.quiet
+            )
+        else:
+            main(
+                incremental=args.incremental,
+                copy=not args.no_copy,
+                profiler=profiler,
+                max_workers=args.workers,
+                on_violation=args.on_violation,
+                memory=memory,
+                quiet=args.quiet
+            )
+
+        if profiler is not None:
+            print(f"Reporte de la ejecución: {profiler.save_report(args.report)}")
+
+    # The devnull file is closed when the run ends, the workers of the
+    # graph are silenced by their own initializer (see TaskGraph)
+
+    with contextlib.ExitStack() as output:
+
+        if args.quiet:
+            output.enter_context(
+                contextlib.redirect_stdout(
+                    output.enter_context(open(os.devnull, "w"))
+                )
+            )
+
+        if args.watch:
+
+            # The watch mode is always incremental, so a change in a file
+            # we don't process doesn't publish a new version
+
+            args.incremental = True
+
+            watcher = DatasetWatcher(
+                args.history or DataIngester().get_dataset_dir(),
+                interval=args.interval
+            )
 
+            try:
+                watcher.watch(run_pipeline)
+            except KeyboardInterrupt:
+                print("Vigilancia detenida")
 
+        else:
+            run_pipeline()
@@ -1,8 +1,17 @@
-from .indicator_config import IndicatorConfig
-from .data_handler import DataHandler
-from .metrics_calculator import MetricsCalculator
-from .charts_builder import ChartBuilder
-from .ui_components import UIComponents
+import importlib
+
+# The components are imported when someone asks for them, the api only uses
+# the data ones and importing the charts (matplotlib, seaborn) made its start
+# more than a second slower
+
+_modules = {
+    'IndicatorConfig': '.indicator_config',
+    'DataHandler': '.data_handler',
+    'MetricsCalculator': '.metrics_calculator',
+    'ChartBuilder': '.charts_builder',
+    'UIComponents': '.ui_components'
+}
+
 __all__ = [
     'IndicatorConfig',
     'DataHandler',
@@ -10,3 +19,11 @@ __all__ = [
     'ChartBuilder',
     'UIComponents'
 ]
+
+
+def __getattr__(name):
+
+    if name not in _modules:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(importlib.import_module(_modules[name], __name__), name)
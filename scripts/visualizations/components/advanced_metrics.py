@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List, Optional, Tuple
 
+from .indicator_matrix import pivot_indicators
+
 class AdvancedMetrics:
     """
     Clase para calcular métricas avanzadas y KPIs derivados
@@ -9,12 +11,13 @@ class AdvancedMetrics:
     """
 
     @staticmethod
-    def calculate_derived_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    def calculate_derived_indicators(df: pd.DataFrame, pivot_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Calcula indicadores derivados a partir de los datos base
         
         Args:
             df: DataFrame con datos base (formato long: Banks, NOMBRE DEL INDICADOR, Valor Indicador)
+            pivot_df: Tabla banco x indicador ya calculada (opcional, si no se crea de df)
             
         Returns:
             DataFrame ampliado con indicadores calculados
@@ -22,12 +25,9 @@ class AdvancedMetrics:
         df_result = df.copy()
         
         # Convertir a formato wide para facilitar cálculos
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        ).fillna(0)
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
+        pivot_df = pivot_df.fillna(0)
         
         # Lista para almacenar nuevos indicadores
         new_indicators = []
@@ -113,19 +113,16 @@ class AdvancedMetrics:
         return df_result
 
     @staticmethod
-    def calculate_composite_indices(df: pd.DataFrame) -> pd.DataFrame:
+    def calculate_composite_indices(df: pd.DataFrame, pivot_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Calcula índices compuestos para ranking general
         """
         df_result = df.copy()
         
         # Convertir a formato wide
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        ).fillna(0)
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
+        pivot_df = pivot_df.fillna(0)
         
         new_indices = []
         
@@ -214,17 +211,14 @@ class AdvancedMetrics:
         return df_result
 
     @staticmethod
-    def calculate_market_participation(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    def calculate_market_participation(df: pd.DataFrame, pivot_df: Optional[pd.DataFrame] = None) -> Dict[str, pd.DataFrame]:
         """
         Calcula participación de mercado por diferentes métricas
         """
         # Convertir a formato wide
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        ).fillna(0)
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
+        pivot_df = pivot_df.fillna(0)
         
         participation_data = {}
         
@@ -248,16 +242,12 @@ class AdvancedMetrics:
         return participation_data
 
     @staticmethod
-    def get_system_statistics(df: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+    def get_system_statistics(df: pd.DataFrame, pivot_df: Optional[pd.DataFrame] = None) -> Dict[str, Dict[str, float]]:
         """
         Calcula estadísticas del sistema por categorías
         """
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        )
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
         
         system_stats = {}
         
@@ -281,23 +271,20 @@ class AdvancedMetrics:
         return system_stats
 
     @staticmethod
-    def detect_outliers(df: pd.DataFrame, method: str = 'iqr') -> Dict[str, List[str]]:
+    def detect_outliers(df: pd.DataFrame, method: str = 'iqr', pivot_df: Optional[pd.DataFrame] = None) -> Dict[str, List[str]]:
         """
         Detecta bancos con valores atípicos (outliers)
         
         Args:
             df: DataFrame con datos
             method: 'iqr' para método de rango intercuartílico, 'zscore' para z-score
+            pivot_df: Tabla banco x indicador ya calculada (opcional, si no se crea de df)
             
         Returns:
             Diccionario con indicador como clave y lista de bancos outliers como valor
         """
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        )
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
         
         outliers = {}
         
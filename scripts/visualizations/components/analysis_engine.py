@@ -3,25 +3,24 @@ import numpy as np
 from typing import Dict, List, Tuple, Optional
 import streamlit as st
 
+from .indicator_matrix import pivot_indicators
+
 class TrendAnalysis:
     """
     Clase para análisis de tendencias y detección de alertas
     """
     
     @staticmethod
-    def generate_alerts(df: pd.DataFrame) -> List[Dict[str, str]]:
+    def generate_alerts(df: pd.DataFrame, pivot_df: Optional[pd.DataFrame] = None) -> List[Dict[str, str]]:
         """
         Genera alertas automáticas basadas en thresholds de la industria bancaria
         """
         alerts = []
         
         # Convertir a formato wide para análisis
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        ).fillna(0)
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
+        pivot_df = pivot_df.fillna(0)
         
         # ALERTAS DE RIESGO CREDITICIO
         if 'MOROSIDAD DE LA CARTERA TOTAL' in pivot_df.columns:
@@ -104,16 +103,13 @@ class TrendAnalysis:
         return alerts
     
     @staticmethod
-    def calculate_concentration_risk(df: pd.DataFrame) -> Dict[str, float]:
+    def calculate_concentration_risk(df: pd.DataFrame, pivot_df: Optional[pd.DataFrame] = None) -> Dict[str, float]:
         """
         Calcula el riesgo de concentración del sistema bancario
         """
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        ).fillna(0)
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
+        pivot_df = pivot_df.fillna(0)
         
         concentration_metrics = {}
         
@@ -198,16 +194,13 @@ class TrendAnalysis:
         return peer_groups
     
     @staticmethod
-    def correlation_analysis(df: pd.DataFrame) -> pd.DataFrame:
+    def correlation_analysis(df: pd.DataFrame, pivot_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Analiza correlaciones entre indicadores principales
         """
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        ).fillna(0)
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
+        pivot_df = pivot_df.fillna(0)
         
         # Seleccionar indicadores principales para correlación
         key_indicators = [
@@ -227,16 +220,13 @@ class TrendAnalysis:
             return pd.DataFrame()
     
     @staticmethod
-    def benchmark_analysis(df: pd.DataFrame, benchmark_type: str = 'system_average') -> Dict[str, pd.DataFrame]:
+    def benchmark_analysis(df: pd.DataFrame, benchmark_type: str = 'system_average', pivot_df: Optional[pd.DataFrame] = None) -> Dict[str, pd.DataFrame]:
         """
         Compara cada banco contra benchmarks (promedio del sistema, top quartile, etc.)
         """
-        pivot_df = df.pivot_table(
-            index='banks', 
-            columns='nombre_del_indicador', 
-            values='valor_indicador', 
-            aggfunc='mean'
-        ).fillna(0)
+        if pivot_df is None:
+            pivot_df = pivot_indicators(df)
+        pivot_df = pivot_df.fillna(0)
         
         benchmark_results = {}
         
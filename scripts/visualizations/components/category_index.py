@@ -0,0 +1,157 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Index of the view of a category, built once with the view. The rows are
+# sorted a single time by bank and by indicator, so the data of a bank or
+# the ranking of an indicator are a slice of positions and a take of those
+# rows, instead of a mask over the whole view and a sort in every request.
+# The ties keep the order of the rows and the empty values go last, out of
+# the rankings and of the data of a bank by value, like the queries of
+# IndicatorDatabase.
+#
+# The indicators are the values of indicator_column, the ID of the indicator
+# when the data has it (a name can have more than one ID) or the name
+
+class CategoryIndex:
+
+    def __init__(self, df: pd.DataFrame,
+                 indicator_column: str = "nombre_del_indicador"):
+
+        self.frame = df
+        self.indicator_column = indicator_column
+
+        positions = np.arange(len(df))
+        values = df["valor_indicador"].to_numpy(dtype="float64", na_value=np.nan)
+        missing = np.isnan(values)
+
+        # The keys of lexsort go from the last to the first, the empty values
+        # get +inf so they end after every other value in both orders
+        ascending_key = np.where(missing, np.inf, values)
+        descending_key = np.where(missing, np.inf, -values)
+
+        bank_codes, banks = pd.factorize(df["banks"], sort=False)
+        indicator_codes, indicators = pd.factorize(
+            df[indicator_column], sort=False
+        )
+
+        self._by_bank = np.lexsort((positions, bank_codes))
+        self._by_bank_value = np.lexsort((positions, descending_key, bank_codes))
+        self._bank_slices = self._slices(bank_codes, self._by_bank, banks)
+
+        self._ascending = np.lexsort((positions, ascending_key, indicator_codes))
+        self._descending = np.lexsort((positions, descending_key, indicator_codes))
+        self._indicator_slices = self._slices(
+            indicator_codes, self._ascending, indicators
+        )
+
+        # How many values of every bank and indicator are not empty, they
+        # are the first ones of its slice in the orders by value
+        self._bank_values = self._count(bank_codes[~missing], banks)
+        self._indicator_values = self._count(
+            indicator_codes[~missing], indicators
+        )
+
+    @staticmethod
+    def _key(label):
+
+        return label.item() if isinstance(label, np.generic) else label
+
+    @classmethod
+    def _count(cls, codes, labels) -> Dict:
+
+        counts = np.bincount(codes, minlength=len(labels))
+
+        return {
+            cls._key(label): int(count) for label, count in zip(labels, counts)
+        }
+
+    # Where every key starts and ends in an order sorted by that key
+
+    @classmethod
+    def _slices(cls, codes, order, labels) -> Dict[str, Tuple[int, int]]:
+
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(labels)), "left")
+        stops = np.searchsorted(sorted_codes, np.arange(len(labels)), "right")
+
+        return {
+            cls._key(label): (int(start), int(stop))
+            for label, start, stop in zip(labels, starts, stops)
+        }
+
+    def _empty(self) -> pd.DataFrame:
+
+        return self.frame.iloc[0:0].copy()
+
+    def get_banks(self):
+
+        return list(self._bank_slices)
+
+    def get_indicators(self):
+
+        return list(self._indicator_slices)
+
+    # Rows of a bank, from the biggest value to the smallest or in the order
+    # of the view, with the same index as the view
+
+    def get_bank_data(
+        self,
+        bank_name: str,
+        sort_by_value: bool = True
+    ) -> pd.DataFrame:
+
+        if bank_name not in self._bank_slices:
+            return self._empty()
+
+        start, stop = self._bank_slices[bank_name]
+        order = self._by_bank
+
+        if sort_by_value:
+            order = self._by_bank_value
+            stop = start + self._bank_values[bank_name]
+
+        return self.frame.take(order[start:stop])
+
+    # The banks ordered by an indicator (an ID or a name, see
+    # indicator_column), with top we only take the first k positions of the
+    # slice
+
+    def get_ranking(
+        self,
+        indicator,
+        ascending: bool = False,
+        top: Optional[int] = None
+    ) -> pd.DataFrame:
+
+        if indicator not in self._indicator_slices:
+            return pd.DataFrame()
+
+        start, _ = self._indicator_slices[indicator]
+        stop = start + self._indicator_values[indicator]
+
+        if top is not None:
+            stop = min(stop, start + top)
+
+        order = self._ascending if ascending else self._descending
+
+        ranking = self.frame.take(order[start:stop]).reset_index(drop=True)
+
+        # Start from 1
+        ranking.index = ranking.index + 1
+
+        return ranking
+
+    def count_banks(self, indicator) -> int:
+
+        if indicator not in self._indicator_slices:
+            return 0
+
+        start, _ = self._indicator_slices[indicator]
+        stop = start + self._indicator_values[indicator]
+
+        return int(self.frame["banks"].take(
+            self._ascending[start:stop]
+        ).nunique())
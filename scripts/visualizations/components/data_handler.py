@@ -1,33 +1,106 @@
 from typing import Any, Dict, List, Optional
+import numpy as np
 import pandas as pd
 import streamlit as st
 # Importación con manejo de errores para compatibilidad
 try:
     from ..data_loader import VisualizationDataLoader
+    from .category_index import CategoryIndex
+    from .indicator_config import IndicatorConfig
+    from .indicator_registry import IndicatorRegistry
+    from .segment_totals import SegmentTotals
 except ImportError:
     # Fallback para ejecución directa
     import sys
     import os
     sys.path.append(os.path.dirname(os.path.dirname(__file__)))
     from data_loader import VisualizationDataLoader
+    from components.category_index import CategoryIndex
+    from components.indicator_config import IndicatorConfig
+    from components.indicator_registry import IndicatorRegistry
+    from components.segment_totals import SegmentTotals
+
+
+# The arrays of the shared dataframes can't be written, so whoever tries to
+# change a value in place gets an error instead of changing the data of all
+# the others. The numpy columns and the codes of the categories are copied
+# once into read only arrays (the ones that are read only already, like the
+# columns of a mapped arrow file, are kept without copy), the other
+# extension types are kept as they are
+
+def make_read_only(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+
+    if df is None:
+        return None
+
+    columns = {}
+
+    for column in df.columns:
+
+        values = df[column]
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+
+            codes = values.cat.codes.to_numpy()
+
+            if codes.flags.writeable:
+                codes = codes.copy()
+                codes.flags.writeable = False
+
+            values = pd.Categorical.from_codes(codes, dtype=values.dtype)
+
+        elif isinstance(values.dtype, np.dtype):
+
+            values = values.to_numpy()
+
+            if values.flags.writeable:
+                values = values.copy()
+                values.flags.writeable = False
+
+        columns[column] = pd.Series(
+            values, index=df.index, name=column, copy=False
+        )
+
+    read_only = pd.DataFrame(columns, index=df.index, copy=False)
+    read_only.columns = df.columns
+
+    return read_only
+
 
 class DataHandler:
 
 
-    def __init__(self, data_loader: VisualizationDataLoader):
+    def __init__(
+        self,
+        data_loader: VisualizationDataLoader,
+        value_dtype: Optional[str] = None
+    ):
 
         self.data_loader = data_loader
 
+        # Optional narrower type for the values, like "float32"
+        self.value_dtype = value_dtype
+
         self.dataframe : Optional[pd.DataFrame] = None
+        self.registry = IndicatorRegistry(None)
+        self.segments = SegmentTotals(None)
+
+        # The filtered view of every category, built once for every
+        # dataframe we load (see filter_by_category)
+        self._category_views: Dict = {}
+        self._category_indexes: Dict = {}
+        self._views_source: Optional[pd.DataFrame] = None
 
     def load_data(self, dataset_name)-> Optional[pd.DataFrame]:
 
         try:
 
             path = self.data_loader.load(dataset_name)
-            dataframe = pd.read_csv(path)
+            dataframe = self.data_loader.read(path)
             self.dataframe = self.normalize_columns(dataframe)
 
+            self.load_references(dataset_name)
+
             return self.dataframe
 
         except Exception as e:
@@ -36,6 +109,23 @@ class DataHandler:
             return None
 
 
+    # The files published next to the dataset, for a handler that gets its
+    # dataframe from somewhere else (like the shared dataset of the api)
+
+    def load_references(self, dataset_name):
+
+        # The IDs of the indicators, the data of an old run doesn't have
+        # them and we keep using the names
+        self.registry = IndicatorRegistry(
+            self.data_loader.get_registry_path(dataset_name)
+        )
+
+        # The segments of the Superintendencia with their official totals
+        self.segments = SegmentTotals(
+            self.data_loader.get_segments_paths(dataset_name)
+        )
+
+
     # First step we normalize the names of the columns, by first deleting all
     # the extra spaces in the word, then changing the spaces for underscores,
     # and removing all the acentuations
@@ -53,11 +143,48 @@ class DataHandler:
             .str.replace("ú", "u")
         )
 
+        return self.compact_dtypes(dataframe)
+
+
+    # The names of the banks and indicators are repeated on every row, as
+    # categories every row only keeps an integer code, so the frame is
+    # smaller and the isin and == filters compare integers
+
+    def compact_dtypes(self, dataframe: pd.DataFrame):
+
+        for column in ["banks", "nombre_del_indicador"]:
+            if (column in dataframe.columns and
+                    not isinstance(dataframe[column].dtype, pd.CategoricalDtype)):
+                dataframe[column] = dataframe[column].astype("category")
+
+        if self.value_dtype is not None and "valor_indicador" in dataframe.columns:
+            dataframe["valor_indicador"] = dataframe["valor_indicador"].astype(
+                self.value_dtype
+            )
+
         return dataframe
 
 
+    # After a filter the categories that are not in the rows anymore are
+    # still in the column, we remove them so groupby and pivot only see the
+    # banks and indicators of the filtered data
+
+    @staticmethod
+    def remove_unused_categories(df: pd.DataFrame) -> pd.DataFrame:
+
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].cat.remove_unused_categories()
+
+        return df
+
+
     # Filter the dataframe by category, so we return a dataframe from the
-    # original that only has the all the indicators by that category
+    # original that only has the all the indicators by that category. The
+    # view of a category (filtered and in percentage if we ask for it) is
+    # built the first time and then every call gets a read only shallow copy
+    # of it, when the dataframe changes (a new load or another dataframe
+    # assigned) the views are built again
 
     def filter_by_category(
         self, 
@@ -75,23 +202,141 @@ class DataHandler:
             st.error(" La columna 'nombre_del_indicador' no existe")
             return pd.DataFrame()
 
-        # Turn the dictionary keys into a list
-        indicator_list = list(indicator_names.keys())
+        return self._get_category_view(
+            indicator_names, convert_percentage
+        ).copy(deep=False)
+
+
+    def _get_category_view(
+        self,
+        indicator_names: Dict[str, str],
+        convert_percentage: bool = False
+    ) -> pd.DataFrame:
+
+        if self._views_source is not self.dataframe:
+            self._category_views = {}
+            self._category_indexes = {}
+            self._views_source = self.dataframe
+
+        key = (tuple(indicator_names), convert_percentage)
+        view = self._category_views.get(key)
+
+        if view is None:
+            view = self._build_category_view(
+                list(indicator_names.keys()), convert_percentage
+            )
+            self._category_views[key] = view
+
+        return view
+
+
+    # The index of the view of a category (see CategoryIndex), built with
+    # the view and dropped with it. The data of a bank and the rankings of
+    # the category are a slice of it
+
+    def get_category_index(
+        self,
+        indicator_names: Dict[str, str],
+        convert_percentage: bool = False
+    ) -> Optional[CategoryIndex]:
+
+        if self.dataframe is None or "nombre_del_indicador" not in self.dataframe.columns:
+            return None
+
+        view = self._get_category_view(indicator_names, convert_percentage)
+
+        key = (tuple(indicator_names), convert_percentage)
+        index = self._category_indexes.get(key)
+
+        if index is None or index.frame is not view:
+            index = CategoryIndex(
+                view,
+                "id_indicador" if self.has_indicator_ids(view)
+                else "nombre_del_indicador"
+            )
+            self._category_indexes[key] = index
+
+        return index
+
+
+    # The key of an indicator in the indexes and the database: its ID when
+    # we have the registry, if not the name as it comes. A name with more
+    # than one ID needs the sheet or the code, or it raises
+    # AmbiguousIndicatorError with the labels to choose from
+
+    def resolve_indicator(
+        self,
+        indicator: str,
+        sheet: Optional[str] = None,
+        code: Optional[str] = None
+    ):
 
-        # Create the filter so then apply the filter to the dataframe
-        mask = self.dataframe["nombre_del_indicador"].isin(indicator_list)
+        if not self.registry.is_available():
+            return indicator
+
+        return self.registry.resolve(indicator, sheet, code)
+
+
+    # The keys of all the indicators of a category, like resolve_indicator
+
+    def get_indicator_keys(self, indicator_names: Dict[str, str]) -> List:
+
+        if not self.registry.is_available():
+            return list(indicator_names)
+
+        return self.registry.get_ids(list(indicator_names))
+
+
+    def _build_category_view(
+        self,
+        indicator_list: List[str],
+        convert_percentage: bool = False
+    ) -> pd.DataFrame:
+
+        # Create the filter so then apply the filter to the dataframe, with
+        # the IDs when we have them, that compares integers and takes every
+        # indicator that has the name
+        if self.has_indicator_ids(self.dataframe):
+            mask = self.dataframe["id_indicador"].isin(
+                self.registry.get_ids(indicator_list)
+            )
+        else:
+            mask = self.dataframe["nombre_del_indicador"].isin(indicator_list)
         df_filtered = self.dataframe[mask].copy()
 
         # Check if the instance exists
         if not isinstance(df_filtered, pd.DataFrame):
             return pd.DataFrame()
 
+        df_filtered = self.remove_unused_categories(df_filtered)
+
         if convert_percentage and not df_filtered.empty:
             df_filtered = self.convert_to_percentage(df_filtered)
 
-        return df_filtered
+        return make_read_only(df_filtered)
 
 
+    # Build the views of all the categories of IndicatorConfig at once, with
+    # the unit of every category and their indexes, so no request pays for
+    # the first one
+
+    def precompute_category_views(self):
+
+        if self.dataframe is None:
+            return
+
+        for category in IndicatorConfig.get_all_indicators():
+            self.get_category_index(
+                IndicatorConfig.get_indicator_names_by_category(category),
+                IndicatorConfig.is_category_percentage(category)
+            )
+
+
+
+    def has_indicator_ids(self, df: pd.DataFrame) -> bool:
+
+        return "id_indicador" in df.columns and self.registry.is_available()
+
 
     # Transform all the decimal values to representative percentage
 
@@ -114,11 +359,15 @@ class DataHandler:
         indicator_order: List[str] 
     ):
 
+        if self.has_indicator_ids(df):
+            return self._get_pivot_table_by_id(df, indicator_order)
+
         pivot = df.pivot_table(
             index="banks",
             columns="nombre_del_indicador",
             values="valor_indicador",
-            aggfunc="mean"
+            aggfunc="mean",
+            observed=True
         )
 
         # Re-order the columns if it's specified
@@ -129,6 +378,42 @@ class DataHandler:
 
         return pivot
 
+
+    # The same table with a column per ID, so two indicators with the same
+    # name are not averaged. The columns take the label of the registry, the
+    # name, or the name with the sheet and code when it's repeated
+
+    def _get_pivot_table_by_id(
+        self,
+        df: pd.DataFrame,
+        indicator_order: List[str]
+    ):
+
+        pivot = df.pivot_table(
+            index="banks",
+            columns="id_indicador",
+            values="valor_indicador",
+            aggfunc="mean",
+            observed=True
+        )
+
+        # Without order the columns go in the order they have in the data
+        order = (
+            self.registry.get_ids(indicator_order) if indicator_order
+            else pd.unique(df["id_indicador"])
+        )
+
+        pivot = pivot[[
+            indicator_id for indicator_id in order if indicator_id in pivot
+        ]]
+
+        pivot.columns = pd.Index(
+            [self.registry.get_label(indicator_id) for indicator_id in pivot.columns],
+            name="nombre_del_indicador"
+        )
+
+        return pivot
+
     
     # Get the ranking of banks by specific indicator, so we can get a general
     # chart where we'll see the best and worst bank in ascending order
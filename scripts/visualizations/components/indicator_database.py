@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+from numbers import Integral
+from typing import List, Optional
+
+import pandas as pd
+
+
+# Queries to the sqlite database that the pipeline publishes next to the
+# csv. The table has indexes by (bank, indicator) and (indicator, value), so
+# the data of a bank or the ranking of an indicator only read the rows they
+# need instead of filtering the whole dataframe
+
+class IndicatorDatabase:
+
+    table_name = "indicadores"
+    columns = ["id_indicador", "nombre_del_indicador", "banks", "valor_indicador"]
+
+    # The read only connection is opened once, when the object is created,
+    # and kept until it's closed. The pipeline publishes a new database
+    # with os.replace, so the open connection keeps reading the file that
+    # was there when it was opened and the answers are always of the same
+    # version (the one of the snapshot of the api that owns it)
+
+    def __init__(self, database_path: Optional[str]):
+
+        self.database_path = database_path
+        self._connection = None
+        self._lock = threading.Lock()
+
+        if database_path is not None:
+            self._connection = sqlite3.connect(
+                f"file:{database_path}?mode=ro", uri=True,
+                check_same_thread=False
+            )
+
+    def is_available(self) -> bool:
+
+        return self._connection is not None
+
+    def close(self):
+
+        with self._lock:
+
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # The api answers the requests in different threads, they share the
+    # connection one query at a time
+
+    def query(self, sql: str, parameters=()) -> pd.DataFrame:
+
+        with self._lock:
+
+            if self._connection is None:
+                raise sqlite3.ProgrammingError("La base de datos está cerrada")
+
+            return pd.read_sql_query(sql, self._connection, params=parameters)
+
+    def _select(self):
+
+        return ", ".join(f'"{column}"' for column in self.columns)
+
+    # sqlite doesn't take the numpy integers as parameters
+
+    @staticmethod
+    def _parameter(indicator):
+
+        return int(indicator) if isinstance(indicator, Integral) else indicator
+
+    # The indicators are asked by ID (see IndicatorRegistry.resolve), a name
+    # can have more than one. The names are only for the data without IDs
+
+    @staticmethod
+    def _indicator_column(indicators) -> str:
+
+        return "id_indicador" if all(
+            isinstance(indicator, Integral) for indicator in indicators
+        ) else "nombre_del_indicador"
+
+    # Rows of a bank for some indicators, from the biggest value to the
+    # smallest like DataHandler.get_bank_data. The rows come in the order of
+    # the index (bank, value descending, row), without a sort (the + keeps
+    # sqlite from taking the index of the indicator for the IN). The empty
+    # values are left out, like in the rankings
+
+    def get_bank_data(
+        self,
+        bank_name: str,
+        indicators: List,
+        scale: float = 1
+    ) -> pd.DataFrame:
+
+        if not indicators:
+            return pd.DataFrame(columns=self.columns)
+
+        placeholders = ", ".join("?" for _ in indicators)
+        column = self._indicator_column(indicators)
+        indicators = [self._parameter(indicator) for indicator in indicators]
+
+        bank_df = self.query(
+            f"SELECT {self._select()} FROM {self.table_name} "
+            f"WHERE banks = ? AND +{column} IN ({placeholders}) "
+            f"AND valor_indicador IS NOT NULL "
+            f"ORDER BY valor_indicador DESC, row_id",
+            [bank_name, *indicators]
+        )
+
+        bank_df["valor_indicador"] = bank_df["valor_indicador"] * scale
+
+        return bank_df
+
+    # The banks ordered by an indicator. There is an index (indicator,
+    # value, row) for every order, so sqlite walks it from the start and
+    # with limit it stops after k rows instead of sorting the whole
+    # indicator. The empty values are not in the ranking
+
+    def get_ranking(
+        self,
+        indicator,
+        ascending: bool = False,
+        limit: Optional[int] = None,
+        scale: float = 1
+    ) -> pd.DataFrame:
+
+        order = "ASC" if ascending else "DESC"
+        sql = (
+            f"SELECT {self._select()} FROM {self.table_name} "
+            f"WHERE {self._indicator_column([indicator])} = ? "
+            f"AND valor_indicador IS NOT NULL "
+            f"ORDER BY valor_indicador {order}, row_id"
+        )
+        parameters = [self._parameter(indicator)]
+
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        ranking = self.query(sql, parameters)
+
+        ranking["valor_indicador"] = ranking["valor_indicador"] * scale
+
+        # Start from 1
+        ranking.index = ranking.index + 1
+
+        return ranking
+
+    def count_banks(self, indicator) -> int:
+
+        result = self.query(
+            f"SELECT COUNT(DISTINCT banks) AS total FROM {self.table_name} "
+            f"WHERE {self._indicator_column([indicator])} = ? "
+            f"AND valor_indicador IS NOT NULL",
+            [self._parameter(indicator)]
+        )
+
+        return int(result["total"].iloc[0])
@@ -0,0 +1,100 @@
+import json
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Wide table of the indicators, one row per bank and one column per
+# indicator with the mean of its values. It's what every method of the
+# analytics starts with. With the registry the columns are the IDs with
+# their label (the name, with the sheet and the code when the name has more
+# than one ID), so two indicators with the same name are not averaged. The
+# rows without ID (the derived indicators) keep their name
+
+def pivot_indicators(df: pd.DataFrame, registry=None) -> pd.DataFrame:
+
+    if (registry is not None and registry.is_available() and
+            "id_indicador" in df.columns):
+
+        labels = df["id_indicador"].map(registry.labels)
+
+        df = df.assign(nombre_del_indicador=labels.fillna(
+            df["nombre_del_indicador"].astype(object)
+        ))
+
+    return df.pivot_table(
+        index='banks',
+        columns='nombre_del_indicador',
+        values='valor_indicador',
+        aggfunc='mean',
+        observed=True
+    )
+
+
+# The same table already computed by the pipeline. The .npy is opened with
+# mmap_mode="r", so the values are not copied to memory and all the
+# processes that open it share the pages of the file. It's read only, the
+# methods that need to change it (like fillna) work on their own copy
+
+class IndicatorMatrix:
+
+    @staticmethod
+    def load(paths: Optional[Tuple[str, str]], registry=None) -> Optional[pd.DataFrame]:
+
+        if paths is None:
+            return None
+
+        matrix_path, index_path = paths
+
+        with open(index_path, encoding="utf-8") as file:
+            index = json.load(file)
+
+        values = np.load(matrix_path, mmap_mode="r")
+
+        # The files are published one after the other, if they are from
+        # different runs it's better to make the pivot again
+
+        if list(values.shape) != [len(index["banks"]), len(index["indicators"])]:
+            return None
+
+        matrix = pd.DataFrame(
+            values,
+            index=pd.Index(index["banks"], name='banks'),
+            columns=pd.Index(
+                IndicatorMatrix.get_labels(index, registry),
+                name='nombre_del_indicador'
+            ),
+            copy=False
+        )
+
+        # The columns in the order of their labels, like pivot_indicators
+        if not matrix.columns.is_monotonic_increasing:
+            matrix = matrix.sort_index(axis=1)
+
+        return matrix
+
+    # The label of every column. A matrix by ID takes the labels of the
+    # registry, without the registry the repeated names get the ID
+
+    @staticmethod
+    def get_labels(index: dict, registry=None):
+
+        names = index["indicators"]
+        ids = index.get("indicator_ids")
+
+        if ids is None:
+            return names
+
+        if registry is not None and registry.is_available():
+            return [
+                registry.get_label(indicator_id) or name
+                for indicator_id, name in zip(ids, names)
+            ]
+
+        repeated = {name for name in names if names.count(name) > 1}
+
+        return [
+            f"{name} ({indicator_id})" if name in repeated else name
+            for indicator_id, name in zip(ids, names)
+        ]
@@ -0,0 +1,141 @@
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+
+# A name with more than one ID that came without the sheet or the code to
+# choose one of them, choices has the labels of all of them
+
+class AmbiguousIndicatorError(ValueError):
+
+    def __init__(self, name: str, choices: List[str]):
+
+        super().__init__(
+            f"El indicador '{name}' es ambiguo, usa uno de: {', '.join(choices)}"
+        )
+        self.name = name
+        self.choices = choices
+
+
+# Registry of the indicators that the pipeline publishes, every ID with its
+# sheet, code and name. A name can have more than one ID (OPERACIONES
+# INTERBANCARIAS is in the assets and in the liabilities), so the filters
+# and pivots use the IDs and the names are only the labels
+
+class IndicatorRegistry:
+
+    columns = {
+        "ID INDICADOR": "id_indicador",
+        "HOJA": "hoja",
+        "CÓDIGO": "codigo",
+        "NOMBRE DEL INDICADOR": "nombre_del_indicador"
+    }
+
+    def __init__(self, registry_path: Optional[str]):
+
+        self.registry = pd.DataFrame(columns=list(self.columns.values()))
+
+        if registry_path is not None:
+
+            # The indicators without code keep an empty text, not NaN
+            self.registry = pd.read_csv(
+                registry_path, dtype={"CÓDIGO": str}, keep_default_na=False
+            ).rename(columns=self.columns)
+
+        self.ids_by_name: Dict[str, List[int]] = {
+            name: group.tolist()
+            for name, group in self.registry.groupby(
+                "nombre_del_indicador", sort=False
+            )["id_indicador"]
+        }
+
+        self.labels = self._build_labels()
+
+    def is_available(self) -> bool:
+
+        return not self.registry.empty
+
+    def get_ids(self, names: Iterable[str]) -> List[int]:
+
+        return [
+            indicator_id
+            for name in names
+            for indicator_id in self.ids_by_name.get(name, [])
+        ]
+
+    def is_ambiguous(self, name: str) -> bool:
+
+        return len(self.ids_by_name.get(name, [])) > 1
+
+    # The name of every ID, and when the name has more than one ID we add
+    # the sheet and the code so the columns of a pivot are not repeated
+
+    def _build_labels(self) -> Dict[int, str]:
+
+        labels = {}
+
+        for row in self.registry.itertuples(index=False):
+
+            label = row.nombre_del_indicador
+
+            if self.is_ambiguous(label):
+                label = f"{label} ({row.hoja} {row.codigo})".replace(" )", ")")
+
+            labels[row.id_indicador] = label
+
+        return labels
+
+    def get_label(self, indicator_id: int) -> Optional[str]:
+
+        return self.labels.get(indicator_id)
+
+    # The IDs of an indicator asked by its name or by its label, the sheet
+    # and the code (as in the registry) choose between the IDs of a name
+
+    def find_ids(
+        self,
+        indicator: str,
+        sheet: Optional[str] = None,
+        code: Optional[str] = None
+    ) -> List[int]:
+
+        ids = self.ids_by_name.get(indicator) or [
+            indicator_id for indicator_id, label in self.labels.items()
+            if label == indicator
+        ]
+
+        rows = self.registry[self.registry["id_indicador"].isin(ids)]
+
+        if sheet is not None:
+            rows = rows[rows["hoja"] == sheet]
+
+        if code is not None:
+            rows = rows[rows["codigo"].astype(str) == str(code)]
+
+        return rows["id_indicador"].tolist()
+
+    # The one ID of an indicator, None if the registry doesn't have it and
+    # AmbiguousIndicatorError if there are more than one
+
+    def resolve(
+        self,
+        indicator: str,
+        sheet: Optional[str] = None,
+        code: Optional[str] = None
+    ) -> Optional[int]:
+
+        ids = self.find_ids(indicator, sheet, code)
+
+        if not ids:
+            return None
+
+        if len(ids) > 1:
+            raise AmbiguousIndicatorError(
+                indicator, [self.labels[indicator_id] for indicator_id in ids]
+            )
+
+        return int(ids[0])
+
+    def to_records(self) -> List[Dict]:
+
+        return self.registry.to_dict("records")
@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+
+# Segments of the Superintendencia (BANCOS PRIVADOS GRANDES, TOTAL BANCOS
+# PRIVADOS...) that the pipeline takes out of the banks: the banks of every
+# segment and the totals that the Superintendencia publishes for them. The
+# statistics of a segment come from these totals, and rollup adds up the
+# banks of the data to check them
+
+class SegmentTotals:
+
+    columns = {
+        "Banks": "banks",
+        "Segmento": "segmento",
+        "ID INDICADOR": "id_indicador",
+        "NOMBRE DEL INDICADOR": "nombre_del_indicador",
+        "Valor Indicador": "valor_indicador"
+    }
+
+    def __init__(self, paths: Optional[Tuple[str, str]]):
+
+        self.members = pd.DataFrame(columns=["banks", "segmento"])
+        self.totals = pd.DataFrame(columns=[
+            "id_indicador", "nombre_del_indicador", "segmento",
+            "valor_indicador"
+        ])
+
+        if paths is not None:
+
+            segments_path, totals_path = paths
+
+            self.members = pd.read_csv(segments_path).rename(
+                columns=self.columns
+            )
+            self.totals = pd.read_csv(totals_path).rename(
+                columns=self.columns
+            )
+
+    def is_available(self) -> bool:
+
+        return not self.totals.empty
+
+    def get_segments(self) -> List[str]:
+
+        return list(pd.unique(self.totals["segmento"]))
+
+    # Only the segments by size and the total have their banks, of the
+    # segments by type of business the workbook only has the total
+
+    def get_members(self, segment: str) -> List[str]:
+
+        return self.members.loc[
+            self.members["segmento"] == segment, "banks"
+        ].tolist()
+
+    def get_totals(
+        self,
+        indicator_ids: Optional[Iterable[int]] = None,
+        segment: Optional[str] = None
+    ) -> pd.DataFrame:
+
+        mask = pd.Series(True, index=self.totals.index)
+
+        if indicator_ids is not None:
+            mask &= self.totals["id_indicador"].isin(list(indicator_ids))
+
+        if segment is not None:
+            mask &= self.totals["segmento"] == segment
+
+        return self.totals[mask]
+
+    # Add up the banks of every segment with one merge and one groupby, the
+    # dataframe has the normalized columns of DataHandler
+
+    def rollup(self, df: pd.DataFrame) -> pd.DataFrame:
+
+        return (
+            df[["banks", "id_indicador", "valor_indicador"]]
+            .astype({"banks": "object"})
+            .merge(self.members, on="banks")
+            .groupby(["segmento", "id_indicador"])["valor_indicador"]
+            .sum(min_count=1)
+            .reset_index()
+        )
+
+    # The official totals next to the sum of the banks. Only the amounts add
+    # up, the ratios of a segment are not the sum of the ratios of its banks
+
+    def compare(
+        self,
+        df: pd.DataFrame,
+        tolerance: float = 1e-6,
+        absolute_tolerance: float = 1.0
+    ) -> pd.DataFrame:
+
+        comparison = self.totals.merge(
+            self.rollup(df).rename(columns={"valor_indicador": "suma_bancos"}),
+            on=["segmento", "id_indicador"]
+        )
+
+        difference = (
+            comparison["valor_indicador"] - comparison["suma_bancos"]
+        ).abs()
+
+        comparison["coincide"] = difference <= (
+            absolute_tolerance + tolerance * comparison["suma_bancos"].abs()
+        )
+
+        return comparison
@@ -1,4 +1,15 @@
 import os
+import json
+import contextlib
+import importlib.util
+
+# fcntl only exists on unix, without it the reads are not locked
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import pandas as pd
 
 class VisualizationDataLoader:
 
@@ -19,9 +30,237 @@ class VisualizationDataLoader:
             f"{dataset_name}.csv"
         )
 
+        parquet_path = os.path.join(
+            dataset_dir,
+            f"{dataset_name}.parquet"
+        )
+
+        # Prefer the parquet file because it's a typed read instead of parsing
+        # text, but only if we can read it and it's not older than the csv
+
+        if self.can_read_parquet() and os.path.exists(parquet_path):
+
+            if (not os.path.exists(data_path) or
+                    os.path.getmtime(parquet_path) >=
+                    os.path.getmtime(data_path)):
+                return parquet_path
+
         # Check if the file exist, if it doesn't throw an exception with raise
         if not os.path.exists(data_path):
             raise FileNotFoundError(f"No se encontro el archivo {data_path}")
 
-        return data_path 
+        return data_path
+
+
+    # The sqlite database of the pipeline, with indexes by bank and by
+    # indicator. We only give it if it's not older than the csv, if not it
+    # could have the data of an old run
+
+    def get_database_path(self, dataset_name):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        dataset_dir = os.path.join(project_root, "output/cleaned_data")
+
+        database_path = os.path.join(dataset_dir, f"{dataset_name}.sqlite")
+        data_path = os.path.join(dataset_dir, f"{dataset_name}.csv")
+
+        if not os.path.exists(database_path):
+            return None
+
+        if (os.path.exists(data_path) and
+                os.path.getmtime(database_path) < os.path.getmtime(data_path)):
+            return None
+
+        return database_path
+
+
+    # The bank x indicator matrix and the json with its names, with the same
+    # check of the date as the database. Both are needed to use it
+
+    def get_matrix_paths(self, dataset_name):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        dataset_dir = os.path.join(project_root, "output/cleaned_data")
+
+        matrix_path = os.path.join(dataset_dir, f"{dataset_name}.matrix.npy")
+        index_path = os.path.join(dataset_dir, f"{dataset_name}.matrix.json")
+        data_path = os.path.join(dataset_dir, f"{dataset_name}.csv")
+
+        for path in [matrix_path, index_path]:
+
+            if not os.path.exists(path):
+                return None
+
+            if (os.path.exists(data_path) and
+                    os.path.getmtime(path) < os.path.getmtime(data_path)):
+                return None
+
+        return matrix_path, index_path
+
+
+    # The registry of the indicators, with the ID, sheet, code and name of
+    # every one
+
+    def get_registry_path(self, dataset_name):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        dataset_dir = os.path.join(project_root, "output/cleaned_data")
+
+        registry_path = os.path.join(
+            dataset_dir, f"{dataset_name}.indicators.csv"
+        )
+        data_path = os.path.join(dataset_dir, f"{dataset_name}.csv")
+
+        if not os.path.exists(registry_path):
+            return None
+
+        if (os.path.exists(data_path) and
+                os.path.getmtime(registry_path) < os.path.getmtime(data_path)):
+            return None
+
+        return registry_path
+
+
+    # The banks of every segment of the Superintendencia and the official
+    # totals of the segments, published next to the data
+
+    def get_segments_paths(self, dataset_name):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        dataset_dir = os.path.join(project_root, "output/cleaned_data")
+
+        segments_path = os.path.join(
+            dataset_dir, f"{dataset_name}.segments.csv"
+        )
+        totals_path = os.path.join(
+            dataset_dir, f"{dataset_name}.segment_totals.csv"
+        )
+        data_path = os.path.join(dataset_dir, f"{dataset_name}.csv")
+
+        for path in (segments_path, totals_path):
+
+            if not os.path.exists(path):
+                return None
+
+            if (os.path.exists(data_path) and
+                    os.path.getmtime(path) < os.path.getmtime(data_path)):
+                return None
+
+        return segments_path, totals_path
+
+
+    # The version that the pipeline published and the deltas of the changes
+    # between versions, one csv per version in cleaned_data/deltas
+
+    def get_version(self, dataset_name):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        version_path = os.path.join(
+            project_root, "output/cleaned_data", f"{dataset_name}.version.json"
+        )
+
+        try:
+            with open(version_path, encoding="utf-8") as file:
+                return json.load(file)
+
+        except (OSError, ValueError):
+            return {"version": 0}
+
+
+    def load_deltas(self, dataset_name, since_version=0, limit=None):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        delta_dir = os.path.join(project_root, "output/cleaned_data/deltas")
+        prefix = f"{dataset_name}.v"
+
+        if not os.path.isdir(delta_dir):
+            return {}
+
+        versions = []
+
+        for file_name in os.listdir(delta_dir):
+
+            version = file_name[len(prefix):-len(".csv")]
+
+            if (not file_name.startswith(prefix) or
+                    not file_name.endswith(".csv") or not version.isdigit()):
+                continue
+
+            if int(version) > since_version:
+                versions.append(int(version))
+
+        # With limit we only read the first versions, the oldest ones
+        versions = sorted(versions)[:limit]
+
+        return {
+            version: pd.read_csv(
+                os.path.join(delta_dir, f"{prefix}{version}.csv")
+            )
+            for version in versions
+        }
+
+
+    # The lock that the pipeline holds while it publishes (see
+    # SaveCleanData.lock), taken shared so all the files we read while we
+    # hold it are of the same version
+
+    @contextlib.contextmanager
+    def read_lock(self, dataset_name):
+
+        project_root = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), "../.."
+        ))
+
+        lock_path = os.path.join(
+            project_root, "output/cleaned_data", f"{dataset_name}.lock"
+        )
+
+        if fcntl is None or not os.path.exists(lock_path):
+            yield
+            return
+
+        with open(lock_path) as lock_file:
+
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+    # pyarrow is optional, so we check if it's installed before using parquet
+
+    @staticmethod
+    def can_read_parquet():
+
+        return importlib.util.find_spec("pyarrow") is not None
+
+
+    # Read the file that load() returned, with the reader of its format
+
+    @staticmethod
+    def read(data_path) -> pd.DataFrame:
+
+        if str(data_path).endswith(".parquet"):
+            return pd.read_parquet(data_path)
 
+        return pd.read_csv(data_path)
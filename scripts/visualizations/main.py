@@ -350,7 +350,7 @@ with tab_overview:
         
         if not activos_data.empty:
             # Agrupar por banco y sumar activos
-            bank_assets = activos_data.groupby('banks')['valor_indicador'].sum().sort_values(ascending=False)
+            bank_assets = activos_data.groupby('banks', observed=True)['valor_indicador'].sum().sort_values(ascending=False)
             total_assets = bank_assets.sum()
             
             if total_assets > 0:
@@ -784,8 +784,19 @@ with tab_categoria:
         is_percentage = False
         unit = ""
     
-    # Obtener ranking dinámico
-    ranking_df = dh.get_ranking(df_filtrado, selected_indicator, ascending=False)
+    # Obtener ranking dinámico (sin datos cargados no hay índice). El índice
+    # va por ID, de un nombre repetido avisamos cuáles son
+    category_index = dh.get_category_index(indicator_names)
+    ranking_df = pd.DataFrame()
+
+    if category_index is not None:
+
+        try:
+            ranking_df = category_index.get_ranking(
+                dh.resolve_indicator(selected_indicator), ascending=False
+            )
+        except ValueError as e:
+            st.warning(str(e))
     
     if not ranking_df.empty:
         col_chart_rank, col_metrics_rank = st.columns([3, 1])
@@ -0,0 +1,12 @@
+import os
+import sys
+
+
+# The modules of the pipeline import each other by their name, like when
+# main.py runs them, and the api and the dashboard import from the root
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+for path in (ROOT, os.path.join(ROOT, "scripts", "pipeline")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+from openpyxl import Workbook
+
+from data_cache import PipelineCache
+
+
+def write_workbook(path, balance_value, indicators_value):
+
+    workbook = Workbook()
+    workbook.active.title = "BALANCE"
+    workbook.active.append(["CÓDIGO", "BANCO"])
+    workbook.active.append([11, balance_value])
+
+    indicators = workbook.create_sheet("INDICADORES")
+    indicators.append(["CÓDIGO", "BANCO"])
+    indicators.append([1, indicators_value])
+
+    workbook.save(path)
+
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+
+    return PipelineCache(str(tmp_path / "cache"))
+
+
+def test_make_key_depends_on_every_part():
+
+    assert PipelineCache.make_key("a", 1) == PipelineCache.make_key("a", 1)
+    assert PipelineCache.make_key("a", 1) != PipelineCache.make_key("a", 2)
+
+    # The separator keeps ("ab", "c") and ("a", "bc") apart
+    assert PipelineCache.make_key("ab", "c") != PipelineCache.make_key("a", "bc")
+
+
+def test_only_the_changed_sheet_gets_a_new_hash(cache, tmp_path):
+
+    sheets = ["BALANCE", "INDICADORES"]
+
+    before = cache.sheet_hashes(
+        write_workbook(str(tmp_path / "before.xlsx"), 100, 5), sheets
+    )
+    after = cache.sheet_hashes(
+        write_workbook(str(tmp_path / "after.xlsx"), 100, 6), sheets
+    )
+
+    assert before["INDICADORES"] != after["INDICADORES"]
+
+    # openpyxl writes the numbers inside the sheet, the shared strings are
+    # the same so the balance keeps its hash
+    assert before["BALANCE"] == after["BALANCE"]
+
+
+def test_sheet_hashes_of_the_bytes_and_of_the_path_match(cache, tmp_path):
+
+    path = write_workbook(str(tmp_path / "dataset.xlsx"), 100, 5)
+
+    with open(path, "rb") as file:
+        workbook_bytes = file.read()
+
+    sheets = ["BALANCE", "INDICADORES"]
+
+    assert cache.sheet_hashes(workbook_bytes, sheets) == \
+        cache.sheet_hashes(path, sheets)
+
+
+def test_a_file_that_is_not_xlsx_uses_the_hash_of_the_whole_file(cache, tmp_path):
+
+    path = tmp_path / "dataset.xlsx"
+    path.write_bytes(b"not a zip")
+
+    hashes = cache.sheet_hashes(str(path), ["BALANCE", "INDICADORES"])
+
+    assert hashes["BALANCE"] == hashes["INDICADORES"] == \
+        PipelineCache.file_hash(str(path))
+
+
+def test_sheet_cache_keeps_only_the_last_version(cache):
+
+    import pandas as pd
+
+    cache.save_sheet("BALANCE", "old", pd.DataFrame({"a": [1]}))
+    cache.save_sheet("BALANCE", "new", pd.DataFrame({"a": [2]}))
+
+    assert cache.load_sheet("BALANCE", "old") is None
+    assert cache.load_sheet("BALANCE", "new")["a"].tolist() == [2]
+
+
+def test_manifest_is_invalidated_by_the_key_and_by_the_outputs(cache, tmp_path):
+
+    output = tmp_path / "Final Dataframe.csv"
+    output.write_text("a\n1\n")
+
+    cache.save_manifest("key", [str(output)], {"BALANCE": "sheet-key"})
+
+    assert cache.is_up_to_date("key", [str(output)])
+
+    # Other inputs or parameters
+    assert not cache.is_up_to_date("other key", [str(output)])
+
+    # Other set of published files
+    assert not cache.is_up_to_date("key", [str(output), str(tmp_path / "x")])
+
+    # Somebody changed the published file
+    output.write_text("a\n2\n")
+    assert not cache.is_up_to_date("key", [str(output)])
+
+    # Or deleted it
+    os.remove(output)
+    assert not cache.is_up_to_date("key", [str(output)])
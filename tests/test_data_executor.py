@@ -0,0 +1,180 @@
+import gc
+import weakref
+
+import pytest
+
+from data_executor import TaskGraph
+
+
+# The tasks live at module level so the workers of the pool can pickle them
+
+def value(x):
+
+    return x
+
+
+def add(*numbers):
+
+    return sum(numbers)
+
+
+def test_the_results_of_the_dependencies_go_at_the_end_of_the_args():
+
+    graph = TaskGraph(max_workers=1)
+
+    graph.add_task("a", value, 1)
+    graph.add_task("b", value, 2)
+    graph.add_task("sum", add, 10, dependencies=["a", "b"])
+
+    # Only the tasks nobody depends on are returned
+    assert graph.run() == {"sum": 13}
+
+
+def test_the_tasks_must_exist_before_their_dependents():
+
+    graph = TaskGraph()
+    graph.add_task("a", value, 1)
+
+    with pytest.raises(ValueError):
+        graph.add_task("a", value, 2)
+
+    with pytest.raises(ValueError):
+        graph.add_task("b", add, dependencies=["missing"])
+
+
+def test_the_pool_gives_the_same_results_as_a_single_process():
+
+    def build(max_workers):
+
+        graph = TaskGraph(max_workers=max_workers)
+
+        for sheet in range(4):
+            graph.add_task(f"sheet/{sheet}", value, sheet)
+
+        graph.add_task(
+            "concat", add,
+            dependencies=[f"sheet/{sheet}" for sheet in range(4)],
+            in_process=True
+        )
+
+        return graph
+
+    assert build(1).run() == build(2).run() == {"concat": 6}
+
+
+def test_the_critical_path_follows_the_dependencies():
+
+    graph = TaskGraph(max_workers=1)
+
+    graph.add_task("read", value, 1)
+    graph.add_task("clean", add, dependencies=["read"])
+    graph.add_task("other", value, 2)
+    graph.add_task("store", add, dependencies=["clean", "other"])
+    graph.run()
+
+    path, seconds = graph.get_critical_path()
+
+    # Whatever chain is the slowest, it ends in the store and every task of
+    # it depends on the one before
+    assert path[-1] == "store"
+    assert seconds >= 0
+
+    for previous, name in zip(path, path[1:]):
+        assert previous in graph.tasks[name]["dependencies"]
+
+
+def fail(*args):
+
+    raise ValueError("hoja rota")
+
+
+def test_without_keep_going_the_first_error_stops_the_graph():
+
+    graph = TaskGraph(max_workers=1)
+
+    graph.add_task("bad", fail)
+    graph.add_task("store", add, dependencies=["bad"])
+
+    with pytest.raises(ValueError):
+        graph.run()
+
+
+def test_with_keep_going_only_the_dependents_of_a_failure_are_skipped():
+
+    errors = []
+
+    graph = TaskGraph(
+        max_workers=1, keep_going=True,
+        on_error=lambda name, error: errors.append(name)
+    )
+
+    graph.add_task("2025-01/BALANCE", fail)
+    graph.add_task("2025-01/INDICADORES", value, 1)
+    graph.add_task(
+        "2025-01/store", add,
+        dependencies=["2025-01/BALANCE", "2025-01/INDICADORES"]
+    )
+    graph.add_task("2025-02/BALANCE", value, 2)
+    graph.add_task("2025-02/store", add, dependencies=["2025-02/BALANCE"])
+
+    assert graph.run() == {"2025-02/store": 2}
+
+    # The failed task and everything after it, with the same error
+    assert errors == ["2025-01/BALANCE", "2025-01/store"]
+    assert set(graph.errors) == {"2025-01/BALANCE", "2025-01/store"}
+    assert graph.errors["2025-01/store"] is graph.errors["2025-01/BALANCE"]
+
+
+class Result:
+
+    pass
+
+
+# The graph with the task that makes a result and the task that checks if
+# that result was already released
+
+def release_graph():
+
+    released = {}
+
+    def make():
+
+        result = Result()
+        released["read"] = weakref.ref(result)
+
+        return result
+
+    def check(*args):
+
+        gc.collect()
+
+        return released["read"]() is None
+
+    return TaskGraph(max_workers=1, keep_going=True), make, check
+
+
+def test_the_results_are_released_when_nobody_needs_them():
+
+    graph, make, check = release_graph()
+
+    # read is only used by clean, so it's gone before last runs
+    graph.add_task("read", make)
+    graph.add_task("clean", lambda result: 1, dependencies=["read"])
+    graph.add_task("last", check, dependencies=["clean"])
+
+    assert graph.run() == {"last": True}
+
+
+def test_the_results_of_a_skipped_task_are_released_too():
+
+    graph, make, check = release_graph()
+
+    # The only dependent of read is skipped because of bad, so read isn't
+    # needed anymore
+    graph.add_task("read", make)
+    graph.add_task("bad", fail)
+    graph.add_task("store", add, dependencies=["read", "bad"])
+    graph.add_task("after", check)
+
+    assert graph.run() == {"after": True}
+    assert "store" in graph.errors
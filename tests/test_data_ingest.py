@@ -0,0 +1,47 @@
+import pytest
+
+from data_ingest import DataIngester
+
+
+def touch(directory, *names):
+
+    for name in names:
+        (directory / name).write_bytes(b"")
+
+
+def test_the_workbooks_are_sorted_by_the_period_of_their_name(tmp_path):
+
+    touch(tmp_path, "dataset_2025-09.xlsx", "202501.xlsx", "~$202502.xlsx",
+          "notes.txt")
+
+    assert DataIngester().ingest_directory(str(tmp_path)) == [
+        ("2025-01", str(tmp_path / "202501.xlsx")),
+        ("2025-09", str(tmp_path / "dataset_2025-09.xlsx"))
+    ]
+
+
+def test_two_files_of_the_same_period_stop_the_ingest(tmp_path):
+
+    touch(tmp_path, "2025-01.xlsx", "dataset_202501.xlsx")
+
+    with pytest.raises(ValueError):
+        DataIngester().ingest_directory(str(tmp_path))
+
+
+def test_with_failures_the_repeated_and_unreadable_files_are_left_out(tmp_path):
+
+    touch(tmp_path, "2025-01.xlsx", "dataset_202501.xlsx",
+          "2025-02.xlsx", "sin_periodo.xlsx")
+
+    failures = {}
+    workbooks = DataIngester().ingest_directory(str(tmp_path), failures)
+
+    assert workbooks == [("2025-02", str(tmp_path / "2025-02.xlsx"))]
+
+    # Both files of the repeated period, and the empty file without period
+    # in its name (it can't be opened to read the header)
+    assert set(failures) == {
+        str(tmp_path / "2025-01.xlsx"),
+        str(tmp_path / "dataset_202501.xlsx"),
+        str(tmp_path / "sin_periodo.xlsx")
+    }
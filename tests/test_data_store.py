@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from data_store import PartitionedStore
+
+
+def make_partition(value):
+
+    return pd.DataFrame({
+        "ID INDICADOR": [1, 2],
+        "NOMBRE DEL INDICADOR": ["ACTIVO", "PASIVOS"],
+        "Banks": ["BP PICHINCHA", "BP PICHINCHA"],
+        "Valor Indicador": [value, value / 2]
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+
+    return PartitionedStore(str(tmp_path / "store"))
+
+
+def test_the_manifest_keeps_paths_relative_to_the_store(store):
+
+    store.write_partition("2025-01", make_partition(10.0), "key")
+
+    entry = store.load_manifest()["2025-01"]
+
+    assert entry["path"] == f"periodo=2025-01/data.{store.extension}"
+    assert entry["rows"] == 2
+
+
+def test_a_partition_is_only_kept_with_the_same_source_key(store):
+
+    store.write_partition("2025-01", make_partition(10.0), "key")
+
+    assert store.has_partition("2025-01")
+    assert store.has_partition("2025-01", "key")
+    assert not store.has_partition("2025-01", "other key")
+    assert not store.has_partition("2025-02")
+
+
+def test_rewriting_a_period_only_replaces_that_period(store):
+
+    store.write_partition("2025-01", make_partition(10.0), "key")
+    store.write_partition("2025-02", make_partition(20.0), "key")
+    store.write_partition("2025-01", make_partition(30.0), "new key")
+
+    data = store.read_all()
+
+    assert store.list_periods() == ["2025-01", "2025-02"]
+    assert data.groupby("Periodo")["Valor Indicador"].max().to_dict() == {
+        "2025-01": 30.0, "2025-02": 20.0
+    }
+    assert store.has_partition("2025-01", "new key")
+
+
+def test_a_moved_store_still_finds_its_partitions(store, tmp_path):
+
+    store.write_partition("2025-01", make_partition(10.0), "key")
+
+    moved = PartitionedStore(
+        shutil.move(store.store_dir, str(tmp_path / "moved"))
+    )
+
+    assert moved.has_partition("2025-01", "key")
+    assert moved.read_partition("2025-01")["Valor Indicador"].tolist() == \
+        [10.0, 5.0]
+
+
+def test_old_manifests_with_absolute_paths_are_still_read(store):
+
+    path = store.write_partition("2025-01", make_partition(10.0), "key")
+
+    manifest = store.load_manifest()
+    manifest["2025-01"]["path"] = path
+
+    with open(store.manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+
+    assert store.has_partition("2025-01", "key")
+    assert len(store.read_partition("2025-01")) == 2
+
+
+def test_a_deleted_partition_is_not_listed(store):
+
+    path = store.write_partition("2025-01", make_partition(10.0), "key")
+    store.write_partition("2025-02", make_partition(20.0), "key")
+
+    shutil.rmtree(os.path.dirname(path))
+
+    assert store.list_periods() == ["2025-02"]
+    assert not store.has_partition("2025-01", "key")
+
+
+def test_a_failure_is_cleared_when_the_period_is_written(store):
+
+    store.record_failure("2025-01", "/data/2025-01.xlsx", ValueError("rota"))
+
+    assert store.load_failures()["2025-01"]["error"] == "ValueError: rota"
+
+    store.write_partition("2025-01", make_partition(10.0), "key")
+
+    assert "2025-01" not in store.load_failures()
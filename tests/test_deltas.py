@@ -0,0 +1,140 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from data_saving import SaveCleanData, compare_versions
+from scripts.visualizations import data_loader
+from scripts.visualizations.data_loader import VisualizationDataLoader
+
+
+def make_version(values):
+
+    return pd.DataFrame({
+        "ID INDICADOR": [1, 2, 3][:len(values)],
+        "NOMBRE DEL INDICADOR": ["ACTIVO", "PASIVOS", "PATRIMONIO"][:len(values)],
+        "Banks": ["BP PICHINCHA"] * len(values),
+        "Valor Indicador": values
+    })
+
+
+def test_compare_versions_finds_the_added_removed_and_changed_pairs():
+
+    previous = make_version([10.0, 20.0])
+    current = make_version([10.0, 25.0, 30.0]).iloc[[1, 2]]
+
+    delta = compare_versions(previous, current)
+
+    assert dict(zip(delta["ID INDICADOR"], delta["Cambio"])) == {
+        1: "eliminado", 2: "modificado", 3: "agregado"
+    }
+    assert delta.set_index("ID INDICADOR").loc[2, "NOMBRE DEL INDICADOR"] == \
+        "PASIVOS"
+
+
+def test_only_the_last_deltas_are_kept(tmp_path):
+
+    saver = SaveCleanData(str(tmp_path))
+    delta = compare_versions(make_version([1.0]), make_version([2.0]))
+
+    for version in range(1, saver.max_deltas + 3):
+        saver.save_delta(delta, "Final Dataframe", version)
+
+    assert saver.list_delta_versions("Final Dataframe") == \
+        list(range(3, saver.max_deltas + 3))
+
+
+# A project with the deltas of the versions we ask for and the version file
+# of the last one, the loader finds it from the path of its module
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(data_loader, "__file__", str(
+        tmp_path / "scripts" / "visualizations" / "data_loader.py"
+    ))
+
+    cleaned_dir = tmp_path / "output" / "cleaned_data"
+    saver = SaveCleanData(str(cleaned_dir))
+
+    def publish(versions, current):
+
+        for version in versions:
+            saver.save_delta(
+                compare_versions(
+                    make_version([float(version)]),
+                    make_version([float(version + 1)])
+                ),
+                "Final Dataframe", version
+            )
+
+        with open(saver.get_version_path("Final Dataframe"), "w",
+                  encoding="utf-8") as file:
+            json.dump({"version": current}, file)
+
+    return publish
+
+
+def test_load_deltas_reads_the_oldest_versions_after_since(project):
+
+    project([1, 2, 3, 4, 5], 5)
+
+    loader = VisualizationDataLoader()
+
+    assert list(loader.load_deltas("Final Dataframe")) == [1, 2, 3, 4, 5]
+    assert list(loader.load_deltas("Final Dataframe", 2, limit=2)) == [3, 4]
+    assert loader.load_deltas("Final Dataframe", 5) == {}
+
+
+@pytest.fixture
+def changes(project, monkeypatch):
+
+    dashboard_support = pytest.importorskip("api.routes.dashboard_support")
+    monkeypatch.setattr(
+        dashboard_support, "loader", VisualizationDataLoader()
+    )
+
+    def get_changes(since_version=0, include_rows=False, limit=10):
+
+        return dashboard_support.get_changes(
+            since_version=since_version, include_rows=include_rows,
+            limit=limit
+        )
+
+    return get_changes
+
+
+def test_the_changes_are_paged_by_version(project, changes):
+
+    project([1, 2, 3, 4, 5], 5)
+
+    first = changes(limit=2)
+
+    assert [change["version"] for change in first["changes"]] == [1, 2]
+    assert first["complete"] and first["has_more"]
+    assert first["next_since_version"] == 2
+
+    # The rows only come when we ask for them
+    assert "rows" not in first["changes"][0]
+
+    last = changes(since_version=4, include_rows=True)
+
+    assert [change["version"] for change in last["changes"]] == [5]
+    assert not last["has_more"]
+    assert last["next_since_version"] == 5
+    assert last["changes"][0]["rows"][0]["Cambio"] == "modificado"
+
+
+def test_a_missing_delta_makes_the_page_incomplete(project, changes):
+
+    project([1, 3], 3)
+
+    page = changes(limit=2)
+
+    assert not page["complete"]
+    assert [change["version"] for change in page["changes"]] == [1, 3]
+
+    # The client reloads everything and goes on from the last version
+    assert page["next_since_version"] == 3
+    assert not page["has_more"]
@@ -0,0 +1,142 @@
+import pandas as pd
+import pytest
+
+from data_processing import (
+    AssignIndicatorIds,
+    ExtractIndicatorRegistry,
+    get_indicator_id,
+    normalize_code
+)
+from scripts.visualizations.components.indicator_registry import (
+    AmbiguousIndicatorError,
+    IndicatorRegistry
+)
+
+
+def test_the_id_is_stable_and_depends_on_sheet_code_and_name():
+
+    assert normalize_code(11.0) == normalize_code("11 ") == "11"
+    assert normalize_code(float("nan")) == ""
+
+    assert get_indicator_id("BALANCE", 11.0, "CAJA") == \
+        get_indicator_id("BALANCE", "11", " CAJA")
+
+    ids = {
+        get_indicator_id("BALANCE", "12", "OPERACIONES INTERBANCARIAS"),
+        get_indicator_id("BALANCE", "22", "OPERACIONES INTERBANCARIAS"),
+        get_indicator_id("INDICADORES", "12", "OPERACIONES INTERBANCARIAS")
+    }
+
+    assert len(ids) == 3
+    assert all(0 <= indicator_id < 2 ** 31 for indicator_id in ids)
+
+
+def test_the_same_name_with_two_codes_gets_two_ids():
+
+    balance = pd.DataFrame({
+        "CÓDIGO": [12.0, 22.0, 12.0],
+        "NOMBRE DEL INDICADOR": ["OPERACIONES INTERBANCARIAS"] * 3,
+        "Banks": ["BP PICHINCHA", "BP PICHINCHA", "BP GUAYAQUIL"],
+        "Valor Indicador": [1.0, 2.0, 3.0]
+    })
+
+    X = AssignIndicatorIds(sheet_name="BALANCE").fit_transform(balance)
+
+    assert X.columns[0] == "ID INDICADOR"
+    assert X["ID INDICADOR"].nunique() == 2
+    assert X["ID INDICADOR"].iloc[0] == X["ID INDICADOR"].iloc[2]
+    assert X["CÓDIGO"].tolist() == ["12", "22", "12"]
+
+    extractor = ExtractIndicatorRegistry().fit(None)
+    X = extractor.transform(X)
+
+    assert "HOJA" not in X and "CÓDIGO" not in X
+    assert len(extractor.registry_) == 2
+
+
+def test_two_indicators_with_the_same_id_stop_the_registry():
+
+    X = pd.DataFrame({
+        "ID INDICADOR": [7, 7],
+        "HOJA": ["BALANCE", "INDICADORES"],
+        "CÓDIGO": ["11", ""],
+        "NOMBRE DEL INDICADOR": ["CAJA", "ROE"],
+        "Banks": ["BP PICHINCHA"] * 2,
+        "Valor Indicador": [1.0, 2.0]
+    })
+
+    with pytest.raises(ValueError, match="mismo ID"):
+        ExtractIndicatorRegistry().fit(None).transform(X)
+
+
+def test_the_collisions_are_checked_across_blocks():
+
+    def block(sheet, name):
+
+        return pd.DataFrame({
+            "ID INDICADOR": [7], "HOJA": [sheet], "CÓDIGO": ["11"],
+            "NOMBRE DEL INDICADOR": [name], "Banks": ["BP PICHINCHA"],
+            "Valor Indicador": [1.0]
+        })
+
+    extractor = ExtractIndicatorRegistry().fit(None)
+    extractor.transform(block("BALANCE", "CAJA"))
+
+    # The same indicator again is not a collision
+    extractor.transform(block("BALANCE", "CAJA"))
+
+    with pytest.raises(ValueError, match="mismo ID"):
+        extractor.transform(block("BALANCE", "BANCOS"))
+
+
+@pytest.fixture
+def registry(tmp_path):
+
+    path = tmp_path / "Final Dataframe.indicators.csv"
+
+    pd.DataFrame({
+        "ID INDICADOR": [1, 2, 3],
+        "HOJA": ["BALANCE", "BALANCE", "INDICADORES"],
+        "CÓDIGO": ["12", "22", ""],
+        "NOMBRE DEL INDICADOR": [
+            "OPERACIONES INTERBANCARIAS", "OPERACIONES INTERBANCARIAS", "ROE"
+        ]
+    }).to_csv(path, index=False)
+
+    return IndicatorRegistry(str(path))
+
+
+def test_a_repeated_name_gets_the_sheet_and_code_in_its_label(registry):
+
+    assert registry.is_ambiguous("OPERACIONES INTERBANCARIAS")
+    assert not registry.is_ambiguous("ROE")
+
+    assert registry.get_label(1) == "OPERACIONES INTERBANCARIAS (BALANCE 12)"
+    assert registry.get_label(2) == "OPERACIONES INTERBANCARIAS (BALANCE 22)"
+    assert registry.get_label(3) == "ROE"
+
+    assert registry.get_ids(["OPERACIONES INTERBANCARIAS", "ROE"]) == [1, 2, 3]
+
+
+def test_an_ambiguous_name_lists_its_choices(registry):
+
+    with pytest.raises(AmbiguousIndicatorError) as error:
+        registry.resolve("OPERACIONES INTERBANCARIAS")
+
+    assert error.value.choices == [
+        "OPERACIONES INTERBANCARIAS (BALANCE 12)",
+        "OPERACIONES INTERBANCARIAS (BALANCE 22)"
+    ]
+
+
+def test_the_sheet_the_code_or_the_label_choose_one_id(registry):
+
+    assert registry.resolve("OPERACIONES INTERBANCARIAS", code="22") == 2
+    assert registry.resolve(
+        "OPERACIONES INTERBANCARIAS", sheet="BALANCE", code=12
+    ) == 1
+    assert registry.resolve("OPERACIONES INTERBANCARIAS (BALANCE 22)") == 2
+    assert registry.resolve("ROE") == 3
+
+    assert registry.resolve("NO EXISTE") is None
+    assert registry.resolve("ROE", sheet="BALANCE") is None
@@ -0,0 +1,111 @@
+import os
+
+import pandas as pd
+import pytest
+
+from api.repository import DatasetRepository
+from api.shared_dataset import SHARED_DATASET_ENV
+from data_saving import SaveCleanData
+from scripts.visualizations import data_loader
+from scripts.visualizations.data_loader import VisualizationDataLoader
+from conftest import ROOT
+
+
+CLEANED_DIR = os.path.join(ROOT, "output", "cleaned_data")
+
+
+# A project in a temporary directory where the pipeline publishes the
+# cleaned data of the repository, the loader finds it from the path of its
+# module. Every call publishes a new version with the values times factor
+
+@pytest.fixture
+def publish(tmp_path, monkeypatch):
+
+    monkeypatch.delenv(SHARED_DATASET_ENV, raising=False)
+    monkeypatch.setattr(data_loader, "__file__", str(
+        tmp_path / "scripts" / "visualizations" / "data_loader.py"
+    ))
+
+    data = pd.read_csv(os.path.join(CLEANED_DIR, "Final Dataframe.csv"))
+    registry = pd.read_csv(
+        os.path.join(CLEANED_DIR, "Final Dataframe.indicators.csv"),
+        dtype={"CÓDIGO": str}, keep_default_na=False
+    )
+    saver = SaveCleanData(str(tmp_path / "output" / "cleaned_data"))
+
+    def publish(factor=1.0):
+
+        saver.save(
+            data.assign(**{"Valor Indicador": data["Valor Indicador"] * factor}),
+            "Final Dataframe", registry=registry
+        )
+
+    publish()
+
+    return publish
+
+
+@pytest.fixture
+def repository(publish):
+
+    return DatasetRepository(loader=VisualizationDataLoader()).load()
+
+
+def total(snapshot):
+
+    return snapshot.data["valor_indicador"].sum()
+
+
+def test_a_reload_swaps_the_snapshot_and_keeps_the_old_one_intact(
+        publish, repository):
+
+    old = repository.snapshot()
+    old_total = total(old)
+
+    assert not repository.has_changed()
+
+    publish(2.0)
+
+    assert repository.has_changed()
+    assert repository.reload()
+
+    new = repository.snapshot()
+
+    assert new is not old
+    assert new.version == old.version + 1
+    assert total(new) == pytest.approx(2 * old_total)
+    assert not repository.has_changed()
+
+    # A request that took the old snapshot finishes with its data, and its
+    # database is the one of its version
+    assert total(old) == old_total
+    assert new.database is not old.database
+
+
+def test_a_failed_reload_keeps_the_current_snapshot(
+        publish, repository, tmp_path):
+
+    current = repository.snapshot()
+
+    for extension in ("csv", "parquet"):
+        path = tmp_path / "output" / "cleaned_data" / f"Final Dataframe.{extension}"
+        if path.exists():
+            path.unlink()
+
+    assert not repository.reload()
+    assert repository.last_error
+    assert repository.snapshot() is current
+
+
+def test_only_one_reload_runs_in_the_background(publish, repository):
+
+    publish(3.0)
+
+    assert repository.reload_in_background()
+    assert not repository.reload_in_background()
+
+    repository.wait_for_reload()
+
+    assert not repository.is_reloading()
+    assert repository.last_error is None
+    assert not repository.has_changed()